@@ -0,0 +1,123 @@
+# app/db/detections.py
+"""
+Normalised detections: one row per detected animal, derived from Image.species_detected.
+Rows are written alongside their Image (ORM flush listener or bulk writers), and
+rewritten when an Image's species_detected or session_id is reassigned through the ORM.
+"""
+from typing import Iterable, List
+
+from sqlalchemy import delete, event, insert, inspect, select, update
+from sqlalchemy.orm import Session as OrmSession
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.db.models import Detection, Image, Session
+
+
+def iter_detections(species_detected) -> List[dict]:
+    """Detection dicts for whatever shape species_detected was stored in"""
+    if not species_detected:
+        return []
+    if isinstance(species_detected, dict):
+        detections = species_detected.get("detections")
+        if detections is None:
+            # Legacy summary-only shape: {"name": ..., "confidence": ...}
+            name = species_detected.get("name")
+            return [{"species": name, "classification_confidence": species_detected.get("confidence")}] if name else []
+        return [d for d in detections if isinstance(d, dict) and d.get("species")]
+    return [d for d in species_detected if isinstance(d, dict) and d.get("species")]
+
+
+def detection_rows(image: dict) -> List[dict]:
+    """
+    Detection table rows for one image mapping
+    (id, session_id, project_id, capture_time/created_at, species_detected)
+    """
+    rows = []
+    for detection in iter_detections(image.get("species_detected")):
+        box = detection.get("bounding_box") or {}
+        rows.append({
+            "image_id": image["id"],
+            "session_id": image["session_id"],
+            "project_id": image["project_id"],
+            "capture_time": image.get("capture_time") or image.get("created_at"),
+            "species": detection["species"],
+            "detection_confidence": detection.get("detection_confidence"),
+            "classification_confidence": detection.get("classification_confidence"),
+            "x1": box.get("x1"),
+            "y1": box.get("y1"),
+            "x2": box.get("x2"),
+            "y2": box.get("y2"),
+        })
+    return rows
+
+
+def insert_detections(connection, images: Iterable[dict]) -> int:
+    """Insert the detections of many images with one executemany"""
+    rows = [row for image in images for row in detection_rows(image)]
+    if rows:
+        connection.execute(insert(Detection.__table__), rows)
+    return len(rows)
+
+
+def project_ids_for_sessions(connection, session_ids: set) -> dict:
+    """{session_id: project_id}"""
+    rows = connection.execute(
+        select(Session.id, Session.project_id).where(Session.id.in_(session_ids))
+    )
+    return dict(rows.all())
+
+
+def _updated_images(db: OrmSession) -> list:
+    """Dirty Images whose detection rows are out of date"""
+    return [
+        obj for obj in db.dirty
+        if isinstance(obj, Image) and any(
+            inspect(obj).attrs[field].history.has_changes() for field in ("session_id", "species_detected")
+        )
+    ]
+
+
+def _after_flush(db: OrmSession, flush_context):
+    """
+    For Images added through the ORM: fill the denormalised project_id and write
+    their detection rows (deletes cascade via Image.detections). Updated Images
+    get their project_id and detection rows rewritten.
+    """
+    added = [obj for obj in db.new if isinstance(obj, Image)]
+    updated = _updated_images(db)
+    if not added and not updated:
+        return
+    connection = db.connection()
+    project_ids = project_ids_for_sessions(connection, {img.session_id for img in added + updated})
+
+    if updated:
+        connection.execute(delete(Detection).where(Detection.image_id.in_([img.id for img in updated])))
+    missing = [img for img in added if img.project_id is None and img.session_id in project_ids]
+    missing += [img for img in updated if img.project_id != project_ids.get(img.session_id, img.project_id)]
+    for session_id in {img.session_id for img in missing}:
+        image_ids = [img.id for img in missing if img.session_id == session_id]
+        connection.execute(
+            update(Image).where(Image.id.in_(image_ids)).values(project_id=project_ids[session_id])
+        )
+    for img in missing:
+        set_committed_value(img, "project_id", project_ids[img.session_id])
+
+    added = [img for img in added + updated if img.species_detected]
+    insert_detections(connection, [
+        {
+            "id": img.id,
+            "session_id": img.session_id,
+            "project_id": project_ids.get(img.session_id),
+            "capture_time": img.capture_time,
+            "created_at": img.created_at,
+            "species_detected": img.species_detected,
+        }
+        for img in added
+        if project_ids.get(img.session_id)
+    ])
+
+
+def register_detection_listeners(session_factory):
+    """Hook denormalised ids and detection rows into every session created by session_factory"""
+    if not event.contains(session_factory, "after_flush", _after_flush):
+        event.listen(session_factory, "after_flush", _after_flush)
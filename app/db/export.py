@@ -0,0 +1,435 @@
+# app/db/export.py
+"""
+Streaming bulk export of a project's (or one session's) images and detections.
+
+Rows come off a server-side cursor EXPORT_CHUNK_SIZE at a time and are encoded and
+sent chunk by chunk, so memory stays flat however large the project is:
+
+- csv: one row per detection, images without detections get one row with empty detection columns
+- parquet: the same rows, one row group per EXPORT_ROW_GROUP_SIZE rows (needs pyarrow)
+- camtrapdp: Camera Trap Data Package (https://camtrap-dp.tdwg.org) zip: sessions become
+  deployments, images media and detections media-level observations. Coordinates come from
+  Session.location ("lat,lng"); bounding boxes are left out (only pixel boxes are stored)
+
+Rows are exported in storage order: an ORDER BY would make the database sort the whole project.
+"""
+import csv
+import io
+import json
+import mimetypes
+import os
+import zipfile
+from datetime import date, datetime
+from typing import AsyncIterator, Iterable, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, select
+
+from app.db.models import Detection, Image, Project, Session, Species
+from app.db.session import get_async_db_session
+
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "5000"))
+EXPORT_ROW_GROUP_SIZE = int(os.getenv("EXPORT_ROW_GROUP_SIZE", "50000"))
+
+EXPORT_FORMATS = {
+    # format: (media type, file extension)
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "camtrapdp": ("application/zip", "zip"),
+}
+
+# (column, pyarrow type name) of the csv/parquet rows
+EXPORT_COLUMNS = [
+    ("image_id", "string"),
+    ("session_id", "string"),
+    ("file_path", "string"),
+    ("capture_time", "timestamp"),
+    ("created_at", "timestamp"),
+    ("has_animal", "bool"),
+    ("animal_count", "int32"),
+    ("detection_id", "int64"),
+    ("species", "string"),
+    ("detection_confidence", "float32"),
+    ("classification_confidence", "float32"),
+    ("x1", "float32"),
+    ("y1", "float32"),
+    ("x2", "float32"),
+    ("y2", "float32"),
+]
+
+CAMTRAP_DP_VERSION = "1.0"
+_CAMTRAP_DP_BASE = f"https://raw.githubusercontent.com/tdwg/camtrap-dp/{CAMTRAP_DP_VERSION}"
+
+DEPLOYMENT_FIELDS = ["deploymentID", "locationID", "locationName", "latitude", "longitude",
+                     "deploymentStart", "deploymentEnd"]
+MEDIA_FIELDS = ["mediaID", "deploymentID", "captureMethod", "timestamp", "filePath", "filePublic",
+                "fileName", "fileMediatype"]
+OBSERVATION_FIELDS = ["observationID", "deploymentID", "mediaID", "eventStart", "eventEnd",
+                      "observationLevel", "observationType", "scientificName", "count",
+                      "classificationMethod", "classifiedBy", "classificationProbability"]
+
+
+class ExportUnavailable(Exception):
+    pass
+
+
+def check_format(fmt: str):
+    """Raise ExportUnavailable when fmt needs a library that isn't installed"""
+    if fmt == "parquet":
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ExportUnavailable("Parquet export needs pyarrow (pip install pyarrow)")
+
+
+class _StreamBuffer:
+    """Write-only, unseekable file for csv/zipfile/pyarrow; drain() takes what was written so far"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _csv_value(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return "" if value is None else value
+
+
+class _CsvWriter:
+    """Rows -> UTF-8 CSV written to a binary stream"""
+
+    def __init__(self, stream, fields: List[str]):
+        self._stream = stream
+        self._text = io.StringIO()
+        self._writer = csv.writer(self._text)
+        self.fields = fields
+        self._writer.writerow(fields)
+        self._flush()
+
+    def write(self, rows: Iterable[dict]):
+        self._writer.writerows([_csv_value(row.get(field)) for field in self.fields] for row in rows)
+        self._flush()
+
+    def _flush(self):
+        self._stream.write(self._text.getvalue().encode("utf-8"))
+        self._text.seek(0)
+        self._text.truncate()
+
+    def close(self):
+        self._flush()
+
+
+class _ParquetWriter:
+    """Rows -> Parquet, buffered (as Arrow tables) up to EXPORT_ROW_GROUP_SIZE rows per row group"""
+
+    def __init__(self, stream, row_group_size: int = EXPORT_ROW_GROUP_SIZE):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        types = {"string": pa.string(), "timestamp": pa.timestamp("us"), "bool": pa.bool_(),
+                 "int32": pa.int32(), "int64": pa.int64(), "float32": pa.float32()}
+        self._pa = pa
+        self.schema = pa.schema([(name, types[kind]) for name, kind in EXPORT_COLUMNS])
+        self._writer = pq.ParquetWriter(stream, self.schema, compression="zstd")
+        self.row_group_size = row_group_size
+        self._tables = []
+        self._buffered = 0
+
+    def write(self, rows: List[dict]):
+        self._tables.append(self._pa.Table.from_pylist(rows, schema=self.schema))
+        self._buffered += len(rows)
+        while self._buffered >= self.row_group_size:
+            self._write_row_group(self.row_group_size)
+
+    def _write_row_group(self, size: Optional[int] = None):
+        """Write the first size buffered rows (all of them by default) as one row group"""
+        if not self._buffered:
+            return
+        table = self._pa.concat_tables(self._tables)
+        size = min(size or self._buffered, self._buffered)
+        self._writer.write_table(table.slice(0, size), row_group_size=size)
+        rest = table.slice(size)
+        self._tables = [rest] if rest.num_rows else []
+        self._buffered = rest.num_rows
+
+    def close(self):
+        self._write_row_group()
+        self._writer.close()
+
+
+def _timestamp(value: Optional[datetime]) -> str:
+    """Camtrap DP datetime: ISO 8601 with a timezone (stored times are UTC)"""
+    return value.strftime("%Y-%m-%dT%H:%M:%SZ") if value else ""
+
+
+def _coordinates(location: Optional[str]):
+    try:
+        latitude, longitude = (float(part) for part in (location or "").split(","))
+        return latitude, longitude
+    except ValueError:
+        return None, None
+
+
+class ProjectExport:
+    """One export request: a project, optionally one session, and filters"""
+
+    def __init__(self, project_id: str, session_id: Optional[str] = None, species: Optional[str] = None,
+                 start: Optional[datetime] = None, end: Optional[datetime] = None,
+                 min_confidence: Optional[float] = None, chunk_size: int = EXPORT_CHUNK_SIZE):
+        self.project_id = project_id
+        self.session_id = session_id
+        self.species = species
+        self.start = start
+        self.end = end
+        self.min_confidence = min_confidence
+        self.chunk_size = chunk_size
+
+    def _image_filters(self) -> list:
+        taken = func.coalesce(Image.capture_time, Image.created_at)
+        filters = [Image.project_id == self.project_id]
+        if self.session_id:
+            filters.append(Image.session_id == self.session_id)
+        if self.start:
+            filters.append(taken >= self.start)
+        if self.end:
+            filters.append(taken < self.end)
+        return filters
+
+    def _detection_filters(self) -> list:
+        filters = []
+        if self.species:
+            filters.append(Detection.species == self.species)
+        if self.min_confidence is not None:
+            confidence = func.coalesce(Detection.classification_confidence, Detection.detection_confidence)
+            filters.append(confidence >= self.min_confidence)
+        return filters
+
+    def rows_query(self):
+        """One row per detection, plus one per image without (matching) detections unless filtering on them"""
+        return (
+            select(
+                Image.id.label("image_id"), Image.session_id, Image.file_path, Image.capture_time,
+                Image.created_at, Image.has_animal, Image.animal_count, Detection.id.label("detection_id"),
+                Detection.species, Detection.detection_confidence, Detection.classification_confidence,
+                Detection.x1, Detection.y1, Detection.x2, Detection.y2,
+            )
+            .select_from(Image)
+            .outerjoin(Detection, Detection.image_id == Image.id)
+            .where(*self._image_filters(), *self._detection_filters())
+        )
+
+    def images_query(self):
+        query = select(
+            Image.id, Image.session_id, Image.file_path, func.coalesce(Image.capture_time, Image.created_at).label("taken")
+        ).where(*self._image_filters())
+        detection_filters = self._detection_filters()
+        if detection_filters:
+            query = query.where(Image.id.in_(select(Detection.image_id).where(*detection_filters)))
+        return query
+
+    async def _chunks(self, db, query) -> AsyncIterator[List[dict]]:
+        """Server-side cursor over query, chunk_size rows at a time"""
+        result = await db.stream(query.execution_options(yield_per=self.chunk_size))
+        async for partition in result.mappings().partitions():
+            yield [dict(row) for row in partition]
+
+    async def stream(self, fmt: str) -> AsyncIterator[bytes]:
+        """The export file in fmt, piece by piece"""
+        if fmt == "camtrapdp":
+            async for data in self._stream_camtrap_dp():
+                yield data
+            return
+
+        buffer = _StreamBuffer()
+        writer = _ParquetWriter(buffer) if fmt == "parquet" else _CsvWriter(buffer, [name for name, _ in EXPORT_COLUMNS])
+        async with get_async_db_session() as db:
+            async for rows in self._chunks(db, self.rows_query()):
+                # Encoding (and compression) is CPU work, keep it off the event loop
+                await run_in_threadpool(writer.write, rows)
+                data = buffer.drain()
+                if data:
+                    yield data
+        await run_in_threadpool(writer.close)
+        yield buffer.drain()
+
+    async def _stream_camtrap_dp(self) -> AsyncIterator[bytes]:
+        buffer = _StreamBuffer()
+        package = zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_DEFLATED)
+        # Per-session first/last media, for deployments without start/end dates (one entry per session)
+        periods = {}
+        taxa = set()
+
+        async with get_async_db_session() as db:
+            project = await db.get(Project, self.project_id)
+            scientific_names = dict((await db.execute(
+                select(Species.common_name, Species.scientific_name).where(Species.scientific_name.is_not(None))
+            )).all())
+
+            def _media_rows(images: List[dict]) -> List[dict]:
+                rows = []
+                for image in images:
+                    first, last = periods.get(image["session_id"], (image["taken"], image["taken"]))
+                    if image["taken"]:
+                        periods[image["session_id"]] = (min(first, image["taken"]), max(last, image["taken"]))
+                    rows.append({
+                        "mediaID": image["id"],
+                        "deploymentID": image["session_id"],
+                        "captureMethod": "activityDetection",
+                        "timestamp": _timestamp(image["taken"]),
+                        "filePath": image["file_path"],
+                        "filePublic": "false",
+                        "fileName": os.path.basename(image["file_path"]),
+                        "fileMediatype": mimetypes.guess_type(image["file_path"])[0] or "image/jpeg",
+                    })
+                return rows
+
+            def _observation_rows(rows: List[dict]) -> List[dict]:
+                observations = []
+                for row in rows:
+                    taken = _timestamp(row["capture_time"] or row["created_at"])
+                    observation = {
+                        "deploymentID": row["session_id"],
+                        "mediaID": row["image_id"],
+                        "eventStart": taken,
+                        "eventEnd": taken,
+                        "observationLevel": "media",
+                    }
+                    if row["detection_id"] is None:
+                        observation.update(observationID=f"{row['image_id']}-0",
+                                           observationType="unclassified" if row["has_animal"] else "blank")
+                    else:
+                        name = scientific_names.get(row["species"], row["species"])
+                        taxa.add((name, row["species"]))
+                        observation.update(
+                            observationID=f"{row['image_id']}-{row['detection_id']}",
+                            observationType="animal",
+                            scientificName=name,
+                            count=1,
+                            classificationMethod="machine",
+                            classifiedBy="TrailGuard AI",
+                            classificationProbability=row["classification_confidence"]
+                            if row["classification_confidence"] is not None else row["detection_confidence"],
+                        )
+                    observations.append(observation)
+                return observations
+
+            for name, fields, query, to_rows in (
+                ("media.csv", MEDIA_FIELDS, self.images_query(), _media_rows),
+                ("observations.csv", OBSERVATION_FIELDS, self.rows_query(), _observation_rows),
+            ):
+                member = package.open(name, "w", force_zip64=True)
+                writer = _CsvWriter(member, fields)
+                async for rows in self._chunks(db, query):
+                    await run_in_threadpool(lambda: writer.write(to_rows(rows)))
+                    data = buffer.drain()
+                    if data:
+                        yield data
+                writer.close()
+                member.close()
+
+            sessions = select(Session).where(Session.project_id == self.project_id)
+            if self.session_id:
+                sessions = sessions.where(Session.id == self.session_id)
+            deployments = []
+            for session in (await db.scalars(sessions)).all():
+                first, last = periods.get(session.id, (None, None))
+                if first is None and session.start_date is None:
+                    continue
+                latitude, longitude = _coordinates(session.location)
+                deployments.append({
+                    "deploymentID": session.id,
+                    "locationID": session.location,
+                    "locationName": session.location,
+                    "latitude": latitude,
+                    "longitude": longitude,
+                    "deploymentStart": _timestamp(datetime.combine(session.start_date, datetime.min.time()))
+                    if session.start_date else _timestamp(first),
+                    "deploymentEnd": _timestamp(datetime.combine(session.end_date, datetime.max.time()))
+                    if session.end_date else _timestamp(last or first),
+                })
+
+        with package.open("deployments.csv", "w") as member:
+            writer = _CsvWriter(member, DEPLOYMENT_FIELDS)
+            writer.write(deployments)
+            writer.close()
+
+        package.writestr("datapackage.json", json.dumps(
+            self._datapackage(project, deployments, periods, taxa), indent=2
+        ))
+        package.close()
+        yield buffer.drain()
+
+    def _datapackage(self, project, deployments: List[dict], periods: dict, taxa: set) -> dict:
+        """datapackage.json; licenses, contributors' details etc. are left for the publisher to fill in"""
+        starts = [first for first, _ in periods.values() if first]
+        ends = [last for _, last in periods.values() if last]
+        points = [(d["longitude"], d["latitude"]) for d in deployments if d["latitude"] is not None]
+
+        def _resource(name: str) -> dict:
+            return {
+                "name": name,
+                "path": f"{name}.csv",
+                "profile": "tabular-data-resource",
+                "format": "csv",
+                "mediatype": "text/csv",
+                "encoding": "utf-8",
+                "schema": f"{_CAMTRAP_DP_BASE}/{name}-table-schema.json",
+            }
+
+        package = {
+            "profile": f"{_CAMTRAP_DP_BASE}/camtrap-dp-profile.json",
+            "name": f"trailguard-{self.project_id}",
+            "id": self.project_id,
+            "created": _timestamp(datetime.utcnow()),
+            "title": project.name if project else self.project_id,
+            "description": project.description if project else None,
+            "contributors": [{"title": "TrailGuard AI", "role": "contributor"}],
+            "project": {
+                "id": self.project_id,
+                "title": project.name if project else self.project_id,
+                "samplingDesign": "opportunistic",
+                "captureMethod": ["activityDetection"],
+                "individualAnimals": False,
+                "observationLevel": ["media"],
+            },
+            "temporal": {
+                "start": min(starts).date().isoformat() if starts else None,
+                "end": max(ends).date().isoformat() if ends else None,
+            },
+            "taxonomic": [
+                {"scientificName": name, "vernacularNames": {"eng": common}} for name, common in sorted(taxa)
+            ],
+            "resources": [_resource("deployments"), _resource("media"), _resource("observations")],
+        }
+        if points:
+            longitudes, latitudes = zip(*points)
+            west, east, south, north = min(longitudes), max(longitudes), min(latitudes), max(latitudes)
+            package["spatial"] = {
+                "type": "Polygon",
+                "coordinates": [[[west, south], [east, south], [east, north], [west, north], [west, south]]],
+            }
+        return package
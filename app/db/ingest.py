@@ -0,0 +1,125 @@
+# app/db/ingest.py
+"""
+Batched persistence of pipeline results.
+
+Image rows, their detections, the rollups and Session.total_images are written
+with a few executemany statements per chunk, one transaction per chunk, instead
+of one ORM add per image.
+"""
+import os
+import uuid
+from datetime import date, datetime
+from typing import List, Optional
+
+from sqlalchemy import func, insert, update
+
+from app.db.detections import insert_detections
+from app.db.models import Image, Project, Session
+from app.db.rollups import apply_image_rollups, bump_project_versions
+from app.db.session import get_db_session
+from app.utils.cache import invalidate_pattern
+
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "500"))
+
+
+class ProjectNotFound(Exception):
+    pass
+
+
+class SessionNotFound(Exception):
+    pass
+
+
+def get_or_create_session(project_id: str, session_id: Optional[str] = None,
+                          location: Optional[str] = None) -> str:
+    """Reuse session_id (must belong to project_id) or start a new session for today"""
+    with get_db_session() as db:
+        if db.get(Project, project_id) is None:
+            raise ProjectNotFound(project_id)
+
+        if session_id is not None:
+            session = db.get(Session, session_id)
+            if session is None or session.project_id != project_id:
+                raise SessionNotFound(session_id)
+            return session.id
+
+        session = Session(project_id=project_id, location=location, start_date=date.today(), total_images=0)
+        db.add(session)
+        db.flush()
+        bump_project_versions(db.connection(), [project_id])
+        new_session_id = session.id
+    # After the commit, so no reader caches the old state again
+    invalidate_pattern(f"project:{project_id}:*")
+    invalidate_pattern("projects:*")
+    return new_session_id
+
+
+def image_row(project_id: str, session_id: str, file_path: str, result: dict,
+              file_size: Optional[int] = None, capture_time: Optional[datetime] = None) -> dict:
+    """images table row for one pipeline result"""
+    detections = result.get("detections") or []
+    timings = result.get("timings")
+    species_detected = None
+    if detections:
+        top = max(detections, key=lambda d: d.get("classification_confidence") or 0.0)
+        species_detected = {
+            "name": top["species"],
+            "confidence": top.get("classification_confidence"),
+            "detections": detections,
+        }
+
+    return {
+        "id": str(uuid.uuid4()),
+        "session_id": session_id,
+        "project_id": project_id,
+        "file_path": file_path,
+        "file_size": file_size,
+        "capture_time": capture_time,
+        "has_animal": result.get("status") == "animal_detected",
+        "animal_count": result.get("animals_detected", 0),
+        "species_detected": species_detected,
+        # Seconds per stage (app/utils/metrics.py) and their sum
+        "processing_time": round(sum(timings.values()), 6) if timings else None,
+        "stage_timings": dict(timings) if timings else None,
+        "created_at": datetime.utcnow(),
+    }
+
+
+class ImageWriter:
+    """Buffers image rows for one session and writes them a chunk at a time"""
+
+    def __init__(self, project_id: str, session_id: str, chunk_size: int = INGEST_CHUNK_SIZE):
+        self.project_id = project_id
+        self.session_id = session_id
+        self.chunk_size = chunk_size
+        self._rows: List[dict] = []
+        self.written = 0
+
+    @property
+    def chunk_ready(self) -> bool:
+        return len(self._rows) >= self.chunk_size
+
+    def add(self, row: dict):
+        self._rows.append(row)
+
+    def flush(self) -> int:
+        """Write everything buffered in one transaction (blocking, call from a worker thread)"""
+        rows, self._rows = self._rows, []
+        if not rows:
+            return 0
+
+        with get_db_session() as db:
+            connection = db.connection()
+            connection.execute(insert(Image.__table__), rows)
+            insert_detections(connection, rows)
+            apply_image_rollups(connection, rows)
+            connection.execute(
+                update(Session.__table__)
+                .where(Session.__table__.c.id == self.session_id)
+                .values(total_images=func.coalesce(Session.__table__.c.total_images, 0) + len(rows))
+            )
+
+        self.written += len(rows)
+        invalidate_pattern(f"project:{self.project_id}:*")
+        invalidate_pattern("projects:*")
+        return len(rows)
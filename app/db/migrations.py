@@ -0,0 +1,91 @@
+# app/db/migrations.py
+"""
+Schema upgrades and data backfills for existing databases.
+
+    python -m app.db.migrations upgrade                # new tables + missing indexes
+    python -m app.db.migrations backfill-detections    # fill detections from images.species_detected
+"""
+import argparse
+
+from sqlalchemy import delete, inspect, select, text, update
+
+from app.db.detections import insert_detections
+from app.db.models import Base, Detection, Image, Session
+from app.db.session import engine, get_db_session
+
+
+def _add_missing_columns():
+    """ALTER TABLE ... ADD COLUMN for nullable columns added to existing tables"""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                print(f"Added column {table.name}.{column.name}")
+
+
+def upgrade():
+    """Create missing tables/columns and add indexes that create_all skips on existing tables"""
+    Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+    # Denormalised Image.project_id for rows stored before the column existed
+    with engine.begin() as connection:
+        connection.execute(
+            update(Image)
+            .where(Image.project_id.is_(None))
+            .values(project_id=select(Session.project_id).where(Session.id == Image.session_id).scalar_subquery())
+        )
+
+
+def backfill_detections(chunk_size: int = 1000) -> int:
+    """
+    Rebuild detection rows from the species_detected JSON, one chunk per transaction.
+    Idempotent: each chunk replaces the detections of its images, so it can be re-run or resumed.
+    """
+    last_id = ""
+    total = 0
+    while True:
+        with get_db_session() as db:
+            rows = db.execute(
+                select(Image.id, Image.session_id, Session.project_id, Image.capture_time,
+                       Image.created_at, Image.species_detected)
+                .join(Session, Session.id == Image.session_id)
+                .where(Image.id > last_id, Image.species_detected.isnot(None))
+                .order_by(Image.id)
+                .limit(chunk_size)
+            ).mappings().all()
+            if not rows:
+                break
+
+            connection = db.connection()
+            connection.execute(delete(Detection).where(Detection.image_id.in_([row["id"] for row in rows])))
+            total += insert_detections(connection, rows)
+            last_id = rows[-1]["id"]
+        print(f"Backfilled {total} detections (up to image {last_id})")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Database migrations")
+    parser.add_argument("command", choices=["upgrade", "backfill-detections"])
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    upgrade()
+    if args.command == "backfill-detections":
+        backfill_detections(chunk_size=args.chunk_size)
+
+
+if __name__ == "__main__":
+    main()
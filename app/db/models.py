@@ -1,5 +1,5 @@
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
-from sqlalchemy import String, Text, Date, Integer, Float, JSON, TIMESTAMP, ForeignKey, func, case
+from sqlalchemy import String, Text, Date, Integer, Float, JSON, TIMESTAMP, ForeignKey, Index, func, case
 import uuid
 from datetime import datetime
 
@@ -17,11 +17,17 @@ class Project(Base):
     description: Mapped[str | None] = mapped_column(Text)
     created_at: Mapped[datetime] = mapped_column(TIMESTAMP, default=datetime.utcnow)
     user_id: Mapped[str | None] = mapped_column(String)  # For future user auth
+    # Bumped with every change to the project's sessions or images; the ETag of its read endpoints
+    version: Mapped[int | None] = mapped_column(Integer, default=0)
     
     sessions: Mapped[list["Session"]] = relationship(back_populates="project", cascade="all, delete-orphan")
 
 class Session(Base):
     __tablename__ = "sessions"
+    __table_args__ = (
+        # Session counts of the project listing and a project's sessions by date
+        Index("ix_sessions_project_start", "project_id", "start_date"),
+    )
     
     id: Mapped[str] = mapped_column(String, primary_key=True, default=_uuid)
     project_id: Mapped[str] = mapped_column(ForeignKey("projects.id"), nullable=False)
@@ -35,23 +41,58 @@ class Session(Base):
 
 class Image(Base):
     __tablename__ = "images"
+    __table_args__ = (
+        Index("ix_images_session_animal_created", "session_id", "has_animal", "created_at"),
+        # Keyset pagination of a project's results: (created_at, id) order straight from the index
+        Index("ix_images_project_animal_created_id", "project_id", "has_animal", "created_at", "id"),
+    )
     
     id: Mapped[str] = mapped_column(String, primary_key=True, default=_uuid)
-    session_id: Mapped[str] = mapped_column(ForeignKey("sessions.id"), nullable=False)
+    # active_history: rollups subtract the replaced values on update (app/db/rollups.py)
+    session_id: Mapped[str] = mapped_column(ForeignKey("sessions.id"), nullable=False, active_history=True)
+    project_id: Mapped[str | None] = mapped_column(ForeignKey("projects.id"))  # Denormalised from the session
     file_path: Mapped[str] = mapped_column(String(500), nullable=False)
     file_size: Mapped[int | None] = mapped_column(Integer)
     capture_time: Mapped[datetime | None] = mapped_column(TIMESTAMP)
     
     # AI Analysis Results
-    has_animal: Mapped[bool] = mapped_column(default=False)
+    has_animal: Mapped[bool] = mapped_column(default=False, active_history=True)
     animal_count: Mapped[int] = mapped_column(Integer, default=0)
-    species_detected: Mapped[dict | None] = mapped_column(JSON)  # {species: confidence, bounding_boxes}
+    species_detected: Mapped[dict | None] = mapped_column(JSON, active_history=True)  # {species: confidence, bounding_boxes}
     quality_score: Mapped[float | None] = mapped_column(Float)
     
-    processing_time: Mapped[float | None] = mapped_column(Float)
+    processing_time: Mapped[float | None] = mapped_column(Float)  # seconds, sum of stage_timings
+    stage_timings: Mapped[dict | None] = mapped_column(JSON)  # {stage: seconds}, see app/utils/metrics.py
     created_at: Mapped[datetime] = mapped_column(TIMESTAMP, default=datetime.utcnow)
     
     session: Mapped[Session] = relationship(back_populates="images")
+    detections: Mapped[list["Detection"]] = relationship(back_populates="image", cascade="all, delete-orphan")
+
+class Detection(Base):
+    """One detected animal, normalised out of Image.species_detected so it can be indexed"""
+    __tablename__ = "detections"
+    __table_args__ = (
+        Index("ix_detections_project_species_time", "project_id", "species", "capture_time"),
+        Index("ix_detections_session_species_time", "session_id", "species", "capture_time"),
+    )
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    image_id: Mapped[str] = mapped_column(ForeignKey("images.id", ondelete="CASCADE"), nullable=False, index=True)
+    # Denormalised from the image/session so filters don't need joins
+    # active_history: rollups subtract the replaced values on update (app/db/rollups.py)
+    session_id: Mapped[str] = mapped_column(ForeignKey("sessions.id"), nullable=False, active_history=True)
+    project_id: Mapped[str] = mapped_column(ForeignKey("projects.id"), nullable=False)
+    capture_time: Mapped[datetime | None] = mapped_column(TIMESTAMP)  # image capture time, else upload time
+    
+    species: Mapped[str] = mapped_column(String(255), nullable=False)
+    detection_confidence: Mapped[float | None] = mapped_column(Float(precision=24))
+    classification_confidence: Mapped[float | None] = mapped_column(Float(precision=24))
+    x1: Mapped[float | None] = mapped_column(Float(precision=24))
+    y1: Mapped[float | None] = mapped_column(Float(precision=24))
+    x2: Mapped[float | None] = mapped_column(Float(precision=24))
+    y2: Mapped[float | None] = mapped_column(Float(precision=24))
+    
+    image: Mapped[Image] = relationship(back_populates="detections")
 
 class Species(Base):
     __tablename__ = "species"
@@ -61,3 +102,22 @@ class Species(Base):
     scientific_name: Mapped[str | None] = mapped_column(String(255))
     conservation_status: Mapped[str | None] = mapped_column(String(50))  # endangered, vulnerable, etc
     image_url: Mapped[str | None] = mapped_column(String(500))
+
+class StatsRollup(Base):
+    """Image counts per project or per session, maintained incrementally (see app/db/rollups.py)"""
+    __tablename__ = "stats_rollups"
+    
+    scope: Mapped[str] = mapped_column(String(16), primary_key=True)  # "project" or "session"
+    scope_id: Mapped[str] = mapped_column(String, primary_key=True)
+    total_images: Mapped[int] = mapped_column(Integer, default=0)
+    animal_images: Mapped[int] = mapped_column(Integer, default=0)
+
+class SpeciesRollup(Base):
+    """Per-species image/detection counts per project or per session"""
+    __tablename__ = "species_rollups"
+    
+    scope: Mapped[str] = mapped_column(String(16), primary_key=True)
+    scope_id: Mapped[str] = mapped_column(String, primary_key=True)
+    species: Mapped[str] = mapped_column(String(255), primary_key=True)
+    image_count: Mapped[int] = mapped_column(Integer, default=0)
+    detection_count: Mapped[int] = mapped_column(Integer, default=0)
@@ -0,0 +1,216 @@
+# app/db/rollups.py
+"""
+Incrementally maintained per-project / per-session statistics.
+
+Every inserted, updated or deleted Image adjusts stats_rollups and species_rollups
+in the same transaction, so result pages read O(species) rows instead of scanning images.
+Updates are tracked through attribute history: assign a new value to has_animal,
+species_detected or session_id (in-place mutation of the species_detected JSON is
+not seen by the ORM). Bulk UPDATE statements bypass the ORM, rebuild after those.
+The same transaction bumps Project.version, which the read endpoints use as ETag.
+
+Rebuild from scratch (e.g. for data stored before the rollups existed):
+    python -m app.db.rollups rebuild [--project PROJECT_ID]
+"""
+import argparse
+from collections import defaultdict
+from typing import Iterable
+
+from sqlalchemy import event, func, inspect, select, delete, update
+from sqlalchemy.orm import Session as OrmSession
+
+from app.db.detections import iter_detections, project_ids_for_sessions
+from app.db.models import Image, Project, Session, StatsRollup, SpeciesRollup
+
+def species_counts(species_detected) -> dict:
+    """{species: detections} for whatever shape species_detected was stored in"""
+    counts = defaultdict(int)
+    for detection in iter_detections(species_detected):
+        counts[detection["species"]] += 1
+    return dict(counts)
+
+
+def _aggregate(images: Iterable[dict], sign: int):
+    """Fold image rows into increments keyed by rollup primary key"""
+    totals = defaultdict(lambda: [0, 0])
+    species = defaultdict(lambda: [0, 0])
+    for image in images:
+        scope_ids = {"project": image["project_id"], "session": image["session_id"]}
+        counts = species_counts(image.get("species_detected"))
+        for scope, scope_id in scope_ids.items():
+            total = totals[(scope, scope_id)]
+            total[0] += sign
+            total[1] += sign if image.get("has_animal") else 0
+            for name, detections in counts.items():
+                entry = species[(scope, scope_id, name)]
+                entry[0] += sign
+                entry[1] += sign * detections
+    return totals, species
+
+
+def _upsert(connection, table, keys: dict, increments: dict):
+    """INSERT ... ON CONFLICT DO UPDATE col = col + increment (SQLite and PostgreSQL)"""
+    if connection.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(table).values(**keys, **increments)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(keys),
+        set_={column: table.c[column] + stmt.excluded[column] for column in increments},
+    )
+    connection.execute(stmt)
+
+
+def apply_image_rollups(connection, images: Iterable[dict], sign: int = 1):
+    """
+    Add (sign=1) or remove (sign=-1) images from the rollups.
+    Each image is a mapping with project_id, session_id, has_animal and species_detected.
+    Runs on the caller's connection, i.e. inside the caller's transaction.
+    """
+    totals, species = _aggregate(images, sign)
+    for (scope, scope_id), (total, animals) in totals.items():
+        _upsert(connection, StatsRollup.__table__,
+                {"scope": scope, "scope_id": scope_id},
+                {"total_images": total, "animal_images": animals})
+    for (scope, scope_id, name), (image_count, detection_count) in species.items():
+        _upsert(connection, SpeciesRollup.__table__,
+                {"scope": scope, "scope_id": scope_id, "species": name},
+                {"image_count": image_count, "detection_count": detection_count})
+    bump_project_versions(connection, {scope_id for scope, scope_id in totals if scope == "project"})
+
+
+def bump_project_versions(connection, project_ids: Iterable[str]):
+    """Mark the projects as changed (in the caller's transaction)"""
+    project_ids = list(project_ids)
+    if project_ids:
+        table = Project.__table__
+        connection.execute(
+            update(table).where(table.c.id.in_(project_ids)).values(version=func.coalesce(table.c.version, 0) + 1)
+        )
+
+
+# Image attributes the rollups are derived from
+_ROLLUP_FIELDS = ("session_id", "has_animal", "species_detected")
+
+
+def _image_rows(db: OrmSession, images: list, known_projects: dict | None = None) -> list:
+    """Rollup rows for Image objects or {field: value} mappings of _ROLLUP_FIELDS"""
+    images = [img if isinstance(img, dict) else {f: getattr(img, f) for f in _ROLLUP_FIELDS} for img in images]
+    project_ids = dict(known_projects or {})
+    unknown = {img["session_id"] for img in images} - set(project_ids)
+    if unknown:
+        project_ids.update(project_ids_for_sessions(db.connection(), unknown))
+    return [
+        {**img, "project_id": project_ids[img["session_id"]]}
+        for img in images
+        if project_ids.get(img["session_id"])
+    ]
+
+
+def _updated_images(db: OrmSession) -> tuple:
+    """(old state, new state) mappings of dirty Images whose rollup fields changed"""
+    before, after = [], []
+    for obj in db.dirty:
+        if not isinstance(obj, Image):
+            continue
+        attrs = inspect(obj).attrs
+        histories = {field: attrs[field].history for field in _ROLLUP_FIELDS}
+        if not any(history.has_changes() for history in histories.values()):
+            continue
+        old, new = {}, {}
+        for field, history in histories.items():
+            if history.has_changes():
+                # The columns use active_history, so the replaced value is always loaded
+                old[field] = history.deleted[0] if history.deleted else None
+                new[field] = history.added[0] if history.added else None
+            else:
+                old[field] = new[field] = getattr(obj, field)
+        before.append(old)
+        after.append(new)
+    return before, after
+
+
+def _before_flush(db: OrmSession, flush_context, instances):
+    """
+    Images deleted together with their Session or Project: look up their projects now,
+    after the flush the session rows are gone
+    """
+    sessions = {obj.session_id for obj in db.deleted if isinstance(obj, Image)}
+    if sessions:
+        db.info["rollup_projects"] = project_ids_for_sessions(db.connection(), sessions)
+
+
+def _after_flush(db: OrmSession, flush_context):
+    """Keep rollups in step with Image rows added, updated or deleted through the ORM"""
+    known_projects = db.info.pop("rollup_projects", None)
+    added = [obj for obj in db.new if isinstance(obj, Image)]
+    removed = [obj for obj in db.deleted if isinstance(obj, Image)]
+    before, after = _updated_images(db)
+    removed += before
+    added += after
+    if added:
+        apply_image_rollups(db.connection(), _image_rows(db, added), sign=1)
+    if removed:
+        apply_image_rollups(db.connection(), _image_rows(db, removed, known_projects), sign=-1)
+
+
+def register_rollup_listeners(session_factory):
+    """Hook the rollups into every session created by session_factory"""
+    for name, listener in (("before_flush", _before_flush), ("after_flush", _after_flush)):
+        if not event.contains(session_factory, name, listener):
+            event.listen(session_factory, name, listener)
+
+
+def rebuild_rollups(db: OrmSession, project_id: str | None = None, chunk_size: int = 5000) -> int:
+    """Recompute rollups from the images table, for one project or everything"""
+    sessions = select(Session.id, Session.project_id)
+    if project_id is not None:
+        sessions = sessions.where(Session.project_id == project_id)
+    session_projects = dict(db.execute(sessions).all())
+
+    connection = db.connection()
+    for table in (StatsRollup.__table__, SpeciesRollup.__table__):
+        if project_id is None:
+            connection.execute(delete(table))
+        else:
+            connection.execute(delete(table).where(table.c.scope == "project", table.c.scope_id == project_id))
+            connection.execute(delete(table).where(
+                table.c.scope == "session", table.c.scope_id.in_(list(session_projects))
+            ))
+
+    query = select(Image.session_id, Image.has_animal, Image.species_detected).where(
+        Image.session_id.in_(list(session_projects))
+    ).execution_options(yield_per=chunk_size)
+
+    rebuilt = 0
+    for partition in db.execute(query).partitions():
+        apply_image_rollups(connection, [
+            {
+                "project_id": session_projects[row.session_id],
+                "session_id": row.session_id,
+                "has_animal": row.has_animal,
+                "species_detected": row.species_detected,
+            }
+            for row in partition
+        ])
+        rebuilt += len(partition)
+    return rebuilt
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain detection rollup tables")
+    parser.add_argument("command", choices=["rebuild"])
+    parser.add_argument("--project", help="Only rebuild this project")
+    args = parser.parse_args()
+
+    from app.db.session import get_db_session, create_tables
+
+    create_tables()
+    with get_db_session() as db:
+        count = rebuild_rollups(db, project_id=args.project)
+    print(f"Rebuilt rollups from {count} images")
+
+
+if __name__ == "__main__":
+    main()
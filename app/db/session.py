@@ -1,13 +1,79 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
-from contextlib import contextmanager
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from contextlib import asynccontextmanager, contextmanager
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./trailguard.db")
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True, echo=False)
+# Connections kept open per engine (and so per process), plus how many more may be opened under load
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# SQLite: how long a writer waits for the lock before "database is locked", and per-connection caches
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+
+def _async_url(url: str) -> str:
+    """Async driver for a sync DATABASE_URL: sqlite -> aiosqlite, postgresql -> asyncpg"""
+    scheme, separator, rest = url.partition("://")
+    dialect = scheme.split("+")[0]
+    driver = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}.get(dialect)
+    return f"{dialect}+{driver}{separator}{rest}" if driver else url
+
+
+# Used by the async routes; set it when the derived URL doesn't fit (e.g. asyncpg ssl options)
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_url(DATABASE_URL)
+
+
+def _is_sqlite(url: str) -> bool:
+    return url.startswith("sqlite")
+
+
+def _pool_options(url: str, pool_class) -> dict:
+    # In-memory SQLite lives in a single connection, keep SQLAlchemy's default pool for it
+    if _is_sqlite(url) and (":memory:" in url or url.split("://", 1)[1] in ("", "/")):
+        return {}
+    return {
+        "poolclass": pool_class,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+    }
+
+
+def _tune_sqlite(sync_engine):
+    """
+    WAL lets readers run alongside the (single) writer instead of waiting for it;
+    synchronous=NORMAL is durable in WAL mode except on power loss, and skips an fsync per commit
+    """
+    @event.listens_for(sync_engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+
+
+engine = create_engine(DATABASE_URL, pool_pre_ping=True, echo=False, **_pool_options(DATABASE_URL, QueuePool))
+if _is_sqlite(DATABASE_URL):
+    _tune_sqlite(engine)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
+from app.db.detections import register_detection_listeners  # noqa: E402
+from app.db.rollups import register_rollup_listeners  # noqa: E402
+register_detection_listeners(SessionLocal)
+register_rollup_listeners(SessionLocal)
+
 @contextmanager
 def get_db_session():
     """Context manager for database sessions"""
@@ -21,6 +87,51 @@ def get_db_session():
     finally:
         session.close()
 
+
+_async_engine = None
+_AsyncSessionLocal = None
+
+
+def get_async_engine():
+    """Engine of the async driver, created on first use (CLI tools never need it)"""
+    global _async_engine, _AsyncSessionLocal
+    if _async_engine is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+        _async_engine = create_async_engine(
+            ASYNC_DATABASE_URL, pool_pre_ping=True, echo=False,
+            **_pool_options(ASYNC_DATABASE_URL, AsyncAdaptedQueuePool)
+        )
+        if _is_sqlite(ASYNC_DATABASE_URL):
+            _tune_sqlite(_async_engine.sync_engine)
+        # Sessions are built by SessionLocal underneath, so the detection/rollup listeners apply too
+        _AsyncSessionLocal = async_sessionmaker(_async_engine, sync_session_class=SessionLocal,
+                                                autoflush=False, expire_on_commit=False)
+    return _async_engine
+
+
+@asynccontextmanager
+async def get_async_db_session():
+    """get_db_session for async routes: queries are awaited instead of blocking the event loop"""
+    get_async_engine()
+    session = _AsyncSessionLocal()
+    try:
+        yield session
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    finally:
+        await session.close()
+
+
+async def dispose_async_engine():
+    global _async_engine
+    if _async_engine is not None:
+        await _async_engine.dispose()
+        _async_engine = None
+
+
 def create_tables():
     """Create all tables"""
     from app.db.models import Base
@@ -1,8 +1,18 @@
-from fastapi import FastAPI
+import time
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+import asyncio
 import os
 
-from app.routes import analysis, projects, batch, species, realtime
+from app.routes import analysis, projects, batch, jobs, models, species, realtime
+from app.pipeline.executor import InferenceQueueFull
+from app.utils.startup import startup_tracker_singleton
+
+startup_tracker_singleton().record("import", time.perf_counter() - _import_started)
 
 app = FastAPI(title="TrailGuard AI", version="1.0.0")
 
@@ -19,24 +29,137 @@ app.add_middleware(
 app.include_router(analysis.router, prefix="/api")
 app.include_router(projects.router, prefix="/api")
 app.include_router(batch.router, prefix="/api")
+app.include_router(jobs.router, prefix="/api")
+app.include_router(models.router, prefix="/api")
 app.include_router(species.router, prefix="/api")
 app.include_router(realtime.router, prefix="/api")
 
 
+@app.exception_handler(InferenceQueueFull)
+async def inference_queue_full_handler(request: Request, exc: InferenceQueueFull):
+    """Backpressure: tell clients to come back later instead of piling up work"""
+    return JSONResponse(
+        status_code=503,
+        content={"success": False, "error": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
 @app.get("/health")
 async def health_check():
     return {"status": "ok"}
 
 
+@app.get("/ready")
+async def readiness_check():
+    """200 once the models are loaded and warmed up, 503 before (startup phase and timings in both)"""
+    status = startup_tracker_singleton().status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+
+@app.get("/cache/stats")
+async def cache_statistics():
+    """Hit/miss/eviction counters of the API response cache"""
+    from app.utils.cache import cache_stats
+    return cache_stats()
+
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """Stage latency histograms (app/utils/metrics.py) and inference queue/cache counters, Prometheus text format"""
+    from app.pipeline.image_processor import image_processor_singleton
+    from app.utils.metrics import metrics_singleton, render_values
+
+    body = metrics_singleton().render()
+    tracker = startup_tracker_singleton()
+    values = [("trailguard_ready", "gauge", "1 once the models are loaded and warmed up", int(tracker.ready))]
+    if tracker.ready:
+        stats = await image_processor_singleton().queue_stats()
+        cache = stats["result_cache"]
+        values += [
+            ("trailguard_inference_queue_depth", "gauge", "Inference jobs waiting for a worker", stats["queue_depth"]),
+            ("trailguard_inference_in_flight", "gauge", "Inference jobs running", stats["in_flight"]),
+            ("trailguard_inference_completed_total", "counter", "Inference jobs completed", stats["completed"]),
+            ("trailguard_inference_rejected_total", "counter", "Inference jobs rejected with 503", stats["rejected"]),
+            ("trailguard_micro_batch_size_avg", "gauge", "Average images per micro-batch",
+             stats["micro_batching"]["avg_batch_size"]),
+            ("trailguard_result_cache_hits_total", "counter", "Result cache hits", cache["hits"]),
+            ("trailguard_result_cache_misses_total", "counter", "Result cache misses", cache["misses"]),
+        ]
+    return PlainTextResponse(body + render_values(values), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/metrics/slowest")
+async def slowest_images():
+    """The slowest images seen by this process, with their stage breakdown"""
+    from app.utils.metrics import metrics_singleton
+    return metrics_singleton().slowest()
+
+
+async def load_models(tracker):
+    """Load and warm up the models (or wait for the node's model server)"""
+    from app.pipeline.model_registry import model_manager_singleton
+    from app.pipeline.model_server import INFERENCE_SERVER_SOCKET, remote_processor_singleton
+
+    if INFERENCE_SERVER_SOCKET:
+        # The node's model server holds (and has warmed up) the models
+        with tracker.timed("model_server"):
+            while True:
+                try:
+                    await remote_processor_singleton().client.call("info")
+                    break
+                except OSError:
+                    await asyncio.sleep(1)
+        print(f"Using the model server at {INFERENCE_SERVER_SOCKET}")
+    else:
+        manager = model_manager_singleton()
+        with tracker.timed("models"):
+            processor = await run_in_threadpool(lambda: manager.active)
+        state = next(v for v in manager.status()["versions"] if v["version"] == processor.version)
+        tracker.timings.update(model_load=state.get("load_seconds"), warmup=state.get("warmup_seconds"))
+        with tracker.timed("warm_workers"):
+            await processor.warm_workers()
+        asyncio.create_task(manager.watch_registry())
+        print("Animal detection model loaded and ready")
+
+
+async def prepare_models():
+    """Load the models in the background, retrying after failures, then start taking traffic"""
+    from app.pipeline.jobs import start_inline_workers
+    from app.utils.startup import STARTUP_RETRY_INTERVAL
+
+    tracker = startup_tracker_singleton()
+    while True:
+        try:
+            await load_models(tracker)
+            break
+        except Exception as e:
+            tracker.mark_failed(e)
+            await asyncio.sleep(STARTUP_RETRY_INTERVAL)
+
+    tracker.mark_ready()
+    start_inline_workers()
+
+
 @app.on_event("startup")
 async def startup_event():
-    """Initialize database tables and load models on startup"""
+    """Initialize database tables, then load models without blocking /health"""
     from app.db.session import create_tables
-    from app.pipeline.image_processor import image_processor_singleton
-    
-    create_tables()
+
+    tracker = startup_tracker_singleton()
+    with tracker.timed("database"):
+        create_tables()
     print("Database tables created/verified")
-    
-    # Load YOLO model at startup
-    image_processor_singleton()
-    print("Animal detection model loaded and ready")
\ No newline at end of file
+
+    # Inference requests get 503 + Retry-After until the models are ready
+    tracker.background_loading = True
+    asyncio.create_task(prepare_models())
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Hand running background jobs back to the queue, then close the async DB pool"""
+    from app.db.session import dispose_async_engine
+    from app.pipeline.jobs import stop_inline_workers
+    await stop_inline_workers()
+    await dispose_async_engine()
\ No newline at end of file
@@ -0,0 +1,55 @@
+# app/pipeline/backends.py
+"""
+Inference backends for the YOLO models.
+
+INFERENCE_BACKEND=pytorch runs models/*.pt. onnx and openvino load the artifacts
+written by `python -m app.pipeline.model_export` next to each .pt file (int8
+variants with INFERENCE_INT8=1); ultralytics runs all of them through the same
+predictor API, so the rest of the pipeline does not change.
+
+    models/animal_detector.pt
+    models/animal_detector.onnx                      (onnx)
+    models/animal_detector.int8.onnx                 (onnx, int8)
+    models/animal_detector_openvino_model/           (openvino)
+    models/animal_detector_int8_openvino_model/      (openvino, int8)
+"""
+import os
+from typing import Tuple
+
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "pytorch")
+INFERENCE_INT8 = os.getenv("INFERENCE_INT8", "0").lower() in ("1", "true", "yes")
+
+BACKENDS = ("pytorch", "onnx", "openvino")
+
+
+def artifact_path(weights_path: str, backend: str, int8: bool = False) -> str:
+    """Where the exported model for weights_path lives"""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend: {backend}")
+    stem = os.path.splitext(weights_path)[0]
+    if backend == "pytorch":
+        return weights_path
+    if backend == "onnx":
+        return f"{stem}.int8.onnx" if int8 else f"{stem}.onnx"
+    return f"{stem}_int8_openvino_model" if int8 else f"{stem}_openvino_model"
+
+
+def resolve_model_path(weights_path: str, backend: str = INFERENCE_BACKEND,
+                       int8: bool = INFERENCE_INT8) -> Tuple[str, str]:
+    """(path to load, backend it runs on); falls back to the .pt file when nothing was exported"""
+    path = artifact_path(weights_path, backend, int8)
+    if backend != "pytorch" and not os.path.exists(path):
+        print(f"⚠️ {path} not found, using {weights_path} on PyTorch "
+              f"(run: python -m app.pipeline.model_export --format {backend}{' --int8' if int8 else ''})")
+        return weights_path, "pytorch"
+    return path, backend
+
+
+def load_model(weights_path: str, task: str, backend: str = INFERENCE_BACKEND, int8: bool = INFERENCE_INT8):
+    """Load a YOLO model on the configured backend; returns (model, loaded path, backend)"""
+    from ultralytics import YOLO
+
+    path, backend = resolve_model_path(weights_path, backend, int8)
+    # Exported models carry no checkpoint to infer the task from
+    model = YOLO(path) if backend == "pytorch" else YOLO(path, task=task)
+    return model, path, backend
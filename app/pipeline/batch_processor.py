@@ -1,67 +1,421 @@
 import asyncio
+import io
 import time
-from typing import List
+from typing import AsyncIterator, List, Optional
 import os
 
-from app.pipeline.image_processor import image_processor_singleton
+from fastapi.concurrency import run_in_threadpool
 
+from app.db.ingest import ImageWriter, get_or_create_session, image_row
+from app.pipeline.decode import decode_for_detection, read_capture_time
+from app.pipeline.image_processor import ImageProcessor, image_processor_singleton
+from app.pipeline.micro_batcher import MICRO_BATCH_SIZE
+from app.pipeline.prefilter import PREFILTER_ENABLED, BurstGrouper, plan_burst, skipped_result, thumbnail
+from app.pipeline.result_cache import ResultCache, content_digest
+from app.utils.cache import publish_message
+from app.utils.metrics import add_timing, merge_timings, metrics_singleton, set_queue_wait, timed
 
-class BatchProcessor:
-    def __init__(self):
-        self.image_processor = None
-    
-    async def _get_processor(self):
-        """Lazy load image processor"""
-        if self.image_processor is None:
-            self.image_processor = image_processor_singleton()
-        return self.image_processor
-    
-    async def process_batch(self, image_paths: List[str], project_id: str) -> dict:
-        """Process multiple images in batch"""
-        results = {
-            "total_images": len(image_paths),
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.webp', '.bmp', '.tiff', '.gif'}
+
+# Streaming pipeline: workers per stage and the bound on every inter-stage queue.
+# Peak memory is roughly PIPELINE_QUEUE_SIZE decoded frames per stage, whatever the batch size.
+PIPELINE_DECODE_WORKERS = int(os.getenv("PIPELINE_DECODE_WORKERS", "4"))
+PIPELINE_DETECT_WORKERS = int(os.getenv("PIPELINE_DETECT_WORKERS", "1"))
+PIPELINE_CLASSIFY_WORKERS = int(os.getenv("PIPELINE_CLASSIFY_WORKERS", "1"))
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "32"))
+
+# Server-side imports (batch ingestion, jobs) may only read files below this directory
+IMPORT_ROOT = os.getenv("IMPORT_ROOT", "imports")
+
+_DONE = object()
+
+
+def _inside(root: str, path: str) -> bool:
+    return os.path.commonpath([root, os.path.realpath(path)]) == root
+
+
+def check_import_paths(paths: List[str], import_root: str = IMPORT_ROOT):
+    """ValueError unless every path (symlinks resolved) is inside import_root"""
+    root = os.path.realpath(import_root)
+    for path in paths:
+        if not _inside(root, path):
+            raise ValueError(f"Image paths must be inside {import_root}: {path}")
+
+
+def expand_image_paths(paths: List[str], import_root: Optional[str] = None) -> List[str]:
+    """
+    Expand directories (e.g. a mounted SD card dump) into the image files they contain.
+    With import_root, files whose symlinks lead outside of it are left out.
+    """
+    expanded = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                expanded.extend(
+                    os.path.join(root, name) for name in sorted(files)
+                    if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS
+                )
+        else:
+            expanded.append(path)
+    if import_root is not None:
+        root = os.path.realpath(import_root)
+        expanded = [path for path in expanded if _inside(root, path)]
+    return expanded
+
+
+def _read_image_file(path: str):
+    """(bytes, file size, EXIF capture time) for an image on disk"""
+    with open(path, "rb") as f:
+        content = f.read()
+    return content, len(content), read_capture_time(io.BytesIO(content))
+
+
+class BatchSummary:
+    """Running totals over the per-image records of a batch"""
+
+    def __init__(self, project_id: str, session_id: str, total_images: int, previous: Optional[dict] = None):
+        self.data = {
+            "project_id": project_id,
+            "session_id": session_id,
+            "total_images": total_images,
             "animals_detected": 0,
             "empty_images": 0,
             "low_quality": 0,
+            "prefiltered": 0,
             "species_count": {},
+            "images_saved": 0,
             "processing_time": None
         }
-        
-        start_time = time.time()
-        
+        self._start_time = time.time()
+        if previous:
+            # Resuming: carry on from the totals of the earlier attempts
+            for key in ("animals_detected", "empty_images", "low_quality", "prefiltered", "images_saved"):
+                self.data[key] = previous.get(key, 0)
+            self.data["species_count"] = dict(previous.get("species_count") or {})
+            self._start_time -= previous.get("processing_time") or 0
+
+    def add(self, record: dict):
+        result = record["result"]
+        if result.get("status") == "animal_detected":
+            self.data["animals_detected"] += 1
+            for species in {d["species"] for d in result.get("detections", [])}:
+                self.data["species_count"][species] = self.data["species_count"].get(species, 0) + 1
+        elif result.get("status") == "no_animal_detected":
+            self.data["empty_images"] += 1
+            if result.get("prefiltered"):
+                self.data["prefiltered"] += 1
+        else:
+            self.data["low_quality"] += 1
+        if record.get("image_id"):
+            self.data["images_saved"] += 1
+
+    def as_dict(self) -> dict:
+        self.data["processing_time"] = time.time() - self._start_time
+        return dict(self.data)
+
+
+def _progress_message(summary: BatchSummary) -> dict:
+    data = summary.data
+    return {
+        "type": "batch_progress",
+        "session_id": data["session_id"],
+        "processed": data["animals_detected"] + data["empty_images"] + data["low_quality"],
+        "total": data["total_images"],
+        "animals_detected": data["animals_detected"],
+    }
+
+
+class _Item:
+    """One image travelling through the pipeline stages"""
+    __slots__ = ("seq", "path", "content", "file_size", "capture_time", "cache_key", "image", "thumbnail",
+                 "detected", "result", "timings", "queued_at")
+
+    def __init__(self, seq: int, path: str):
+        self.seq = seq
+        self.path = path
+        self.content = None
+        self.file_size = None
+        self.capture_time = None
+        self.cache_key = None
+        self.image = None
+        self.thumbnail = None
+        self.detected = None
+        self.result = None
+        self.timings = {}
+        self.queued_at = time.perf_counter()
+
+    def enqueued(self):
+        self.queued_at = time.perf_counter()
+
+    def dequeued(self):
+        """Time since enqueued() counts as queue_wait"""
+        add_timing(self.timings, "queue_wait", time.perf_counter() - self.queued_at)
+
+    def take_timings(self, result: dict, elapsed: float, stages: tuple):
+        """Move the timings a model call put on result to the item, the rest of elapsed is queue_wait"""
+        set_queue_wait(result, elapsed, stages)
+        merge_timings(self.timings, result.pop("timings"))
+
+
+class BatchProcessor:
+    async def _get_processor(self) -> ImageProcessor:
+        """Processor of the active model version; a stream keeps the one it started with"""
+        return image_processor_singleton()
+
+    async def process_batch(self, image_paths: List[str], project_id: str,
+                            session_id: Optional[str] = None, location: Optional[str] = None) -> dict:
+        """Process multiple images in batch, store them in a session and return a summary"""
+        session_id = await run_in_threadpool(get_or_create_session, project_id, session_id, location)
+        # Walking SD-card trees is blocking filesystem work
+        image_paths = await run_in_threadpool(expand_image_paths, image_paths, IMPORT_ROOT)
+
+        summary = BatchSummary(project_id, session_id, len(image_paths))
+        channel = f"project:{project_id}"
+        async for record in self.stream_batch(image_paths, project_id, session_id, endpoint="batch"):
+            summary.add(record)
+            publish_message(channel, _progress_message(summary), throttle_key=f"batch:{session_id}")
+        result = summary.as_dict()
+        publish_message(channel, {"type": "batch_completed", **result})
+        return result
+
+    async def stream_batch(self, image_paths: List[str], project_id: str, session_id: str,
+                           prefilter: bool = PREFILTER_ENABLED, endpoint: str = "batch") -> AsyncIterator[dict]:
+        """
+        Staged pipeline: decode -> [prefilter ->] detect -> crop/classify -> persist, joined
+        by bounded queues with PIPELINE_*_WORKERS workers per stage. Decoding overlaps
+        inference and memory stays constant however many images there are.
+        The optional prefilter keeps static frames of a burst away from the detector
+        (see app/pipeline/prefilter.py).
+        Yields {"file_path", "result", "image_id"} per image as it is stored (completion order).
+        Stage timings go to result["timings"], the images row and the metrics (labelled endpoint).
+        """
         processor = await self._get_processor()
-        
-        # Process images concurrently
-        tasks = [self._process_single_image(img_path, project_id, processor) 
-                for img_path in image_paths]
-        batch_results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        # Aggregate results
-        for result in batch_results:
-            if isinstance(result, Exception):
-                results["low_quality"] += 1
-                continue
-                
-            if result.get("status") == "animal_detected":
-                results["animals_detected"] += 1
-                species = result.get("species", {}).get("name", "Unknown")
-                results["species_count"][species] = results["species_count"].get(species, 0) + 1
-            elif result.get("status") == "no_animal":
-                results["empty_images"] += 1
-            else:
-                results["low_quality"] += 1
-        
-        results["processing_time"] = time.time() - start_time
-        
-        return results
-    
-    async def _process_single_image(self, img_path: str, project_id: str, processor) -> dict:
-        """Process a single image"""
+        writer = ImageWriter(project_id, session_id)
+        metrics = metrics_singleton()
+
+        decode_q = asyncio.Queue(PIPELINE_QUEUE_SIZE)
+        prefilter_q = asyncio.Queue(PIPELINE_QUEUE_SIZE)
+        detect_q = asyncio.Queue(PIPELINE_QUEUE_SIZE)
+        classify_q = asyncio.Queue(PIPELINE_QUEUE_SIZE)
+        persist_q = asyncio.Queue(PIPELINE_QUEUE_SIZE)
+        out_q = asyncio.Queue(PIPELINE_QUEUE_SIZE)
+
+        async def feed():
+            for seq, path in enumerate(image_paths):
+                await decode_q.put(_Item(seq, path))
+            for _ in range(PIPELINE_DECODE_WORKERS):
+                await decode_q.put(_DONE)
+
+        async def decode(items: List[_Item]):
+            for item in items:
+                try:
+                    # read includes hashing and the cache lookup
+                    with timed(item.timings, "read"):
+                        item.content, item.file_size, item.capture_time = await run_in_threadpool(
+                            _read_image_file, item.path
+                        )
+                        digest = await asyncio.to_thread(content_digest, item.content)
+                        item.cache_key = ResultCache.make_key(processor.model_fingerprint, digest)
+                        # Duplicates skip decoding and inference entirely
+                        item.result = await processor.result_cache.get_async(item.cache_key)
+                    if item.result is None:
+                        with timed(item.timings, "decode"):
+                            item.image = await run_in_threadpool(decode_for_detection, item.content)
+                        if prefilter and item.capture_time is not None:
+                            with timed(item.timings, "prefilter"):
+                                item.thumbnail = await run_in_threadpool(thumbnail, item.image.pixels)
+                except Exception as e:
+                    item.result = processor._error_result(e)
+                finally:
+                    item.content = None
+
+        async def release_burst(items: List[_Item]):
+            # Waiting for the rest of the burst counts as queue_wait
+            for item in items:
+                item.dequeued()
+            start = time.perf_counter()
+            changed, static = await run_in_threadpool(plan_burst, [item.thumbnail for item in items])
+            seconds = time.perf_counter() - start
+            for item in items:
+                item.thumbnail = None
+                add_timing(item.timings, "prefilter", seconds)
+                item.enqueued()
+            # A lone static frame is just another frame for the detector
+            for index in changed if len(static) > 1 else changed + static:
+                await detect_q.put(items[index])
+            if len(static) < 2:
+                return
+
+            # Static frames follow their keyframe: skipped only if it comes back empty
+            keyframe, followers = items[static[0]], [items[index] for index in static[1:]]
+            try:
+                start = time.perf_counter()
+                keyframe.detected = (await processor.detect_images([keyframe.image]))[0]
+                keyframe.take_timings(keyframe.detected[0], time.perf_counter() - start, ("detect", "crop"))
+            except Exception as e:
+                keyframe.result = processor._error_result(e)
+            keyframe.image = None
+            keyframe.enqueued()
+            await (persist_q if keyframe.result is not None else classify_q).put(keyframe)
+            empty = keyframe.result is None and keyframe.detected[0].get("status") == "no_animal_detected"
+            for item in followers:
+                if empty:
+                    item.result = skipped_result()
+                    item.image = None
+                await (persist_q if empty else detect_q).put(item)
+
+        async def prefilter_bursts():
+            """Put decoded frames back in file order, hold them until their burst is complete, then release it"""
+            producers = PIPELINE_DECODE_WORKERS
+            grouper = BurstGrouper()
+            waiting, next_seq = {}, 0
+            while producers:
+                item = await prefilter_q.get()
+                if item is _DONE:
+                    producers -= 1
+                    continue
+                waiting[item.seq] = item
+                while next_seq in waiting:
+                    item = waiting.pop(next_seq)
+                    next_seq += 1
+                    if item.result is not None:
+                        await persist_q.put(item)
+                        continue
+                    for burst in grouper.add(item, os.path.dirname(item.path), item.capture_time):
+                        await release_burst(burst)
+            for burst in grouper.flush():
+                await release_burst(burst)
+            for _ in range(PIPELINE_DETECT_WORKERS):
+                await detect_q.put(_DONE)
+            await persist_q.put(_DONE)
+
+        async def detect(items: List[_Item]):
+            start = time.perf_counter()
+            detected = await processor.detect_images([item.image for item in items])
+            elapsed = time.perf_counter() - start
+            for item, entry in zip(items, detected):
+                item.take_timings(entry[0], elapsed, ("detect", "crop"))
+                item.detected = entry
+                item.image = None
+
+        async def classify(items: List[_Item]):
+            start = time.perf_counter()
+            results = await processor.classify_detections([item.detected for item in items])
+            elapsed = time.perf_counter() - start
+            for item, result in zip(items, results):
+                item.take_timings(result, elapsed, ("classify",))
+                item.result = result
+                item.detected = None
+                if result.get("status") != "error":
+                    processor.result_cache.put(item.cache_key, result)
+
+        async def persist():
+            # decode or the prefilter (cache hits/errors, skipped frames), detect (errors)
+            # and classify all feed this stage
+            producers = 3
+            pending = []
+            while producers:
+                item = await persist_q.get()
+                if item is _DONE:
+                    producers -= 1
+                else:
+                    item.dequeued()
+                    item.result["timings"] = item.timings
+                    record = {"file_path": item.path, "result": item.result, "image_id": None}
+                    if item.result.get("status") != "error":
+                        row = image_row(project_id, session_id, item.path, item.result,
+                                        item.file_size, item.capture_time)
+                        record["image_id"] = row["id"]
+                        writer.add(row)
+                    pending.append(record)
+                if writer.chunk_ready or not producers:
+                    # Records are released once their chunk is committed
+                    start = time.perf_counter()
+                    await run_in_threadpool(writer.flush)
+                    seconds = time.perf_counter() - start
+                    for record in pending:
+                        # Known only once the row is written: in the metrics and the record, not the row
+                        timings = record["result"]["timings"]
+                        add_timing(timings, "db_write", seconds)
+                        metrics.observe_image(timings, endpoint, processor.version, record["file_path"])
+                        await out_q.put(record)
+                    pending = []
+            await out_q.put(_DONE)
+
+        def unless_done(next_q: asyncio.Queue):
+            """Items that already have a result (cache hit or error) go straight to persist"""
+            return lambda item: persist_q if item.result is not None else next_q
+
+        stages = [
+            feed(),
+            self._stage(decode, decode_q, PIPELINE_DECODE_WORKERS, 1, lambda item: prefilter_q,
+                        [(prefilter_q, PIPELINE_DECODE_WORKERS)]) if prefilter else
+            self._stage(decode, decode_q, PIPELINE_DECODE_WORKERS, 1, unless_done(detect_q),
+                        [(detect_q, PIPELINE_DETECT_WORKERS), (persist_q, 1)]),
+            self._stage(detect, detect_q, PIPELINE_DETECT_WORKERS, MICRO_BATCH_SIZE, unless_done(classify_q),
+                        [(classify_q, PIPELINE_CLASSIFY_WORKERS), (persist_q, 1)]),
+            self._stage(classify, classify_q, PIPELINE_CLASSIFY_WORKERS, MICRO_BATCH_SIZE, lambda item: persist_q,
+                        [(persist_q, 1)]),
+            persist(),
+        ]
+        if prefilter:
+            stages.append(prefilter_bursts())
+        tasks = [asyncio.create_task(self._guard(stage, out_q)) for stage in stages]
+
+        try:
+            while True:
+                record = await out_q.get()
+                if record is _DONE:
+                    break
+                if isinstance(record, Exception):
+                    raise record
+                yield record
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _stage(self, handler, in_q: asyncio.Queue, workers: int, batch_size: int, route,
+                     downstream: list):
+        """
+        Run workers tasks that each take up to batch_size queued items per handler call,
+        pass every item on to route(item), and once all workers have seen the end marker,
+        send one end marker to each consumer listed in downstream [(queue, consumers)].
+        """
+        async def worker():
+            while True:
+                batch = [await in_q.get()]
+                while batch[-1] is not _DONE and len(batch) < batch_size and not in_q.empty():
+                    batch.append(in_q.get_nowait())
+                items = [item for item in batch if item is not _DONE]
+                for item in items:
+                    item.dequeued()
+                if items:
+                    try:
+                        await handler(items)
+                    except Exception as e:
+                        for item in items:
+                            item.result = ImageProcessor._error_result(e)
+                            item.image = item.detected = None
+                    for item in items:
+                        item.enqueued()
+                        await route(item).put(item)
+                if batch[-1] is _DONE:
+                    return
+
+        await asyncio.gather(*[worker() for _ in range(workers)])
+        for queue, consumers in downstream:
+            for _ in range(consumers):
+                await queue.put(_DONE)
+
+    @staticmethod
+    async def _guard(stage, out_q: asyncio.Queue):
+        """A crashed stage must fail the stream instead of leaving it waiting forever"""
         try:
-            result = await processor.process_image(img_path)
-            return result
+            await stage
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            return {"status": "error", "error": str(e)}
+            await out_q.put(e)
 
 
 # Singleton instance
@@ -73,4 +427,4 @@ def batch_processor_singleton():
     global _batch_processor_instance
     if _batch_processor_instance is None:
         _batch_processor_instance = BatchProcessor()
-    return _batch_processor_instance
\ No newline at end of file
+    return _batch_processor_instance
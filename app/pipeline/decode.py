@@ -0,0 +1,173 @@
+# app/pipeline/decode.py
+import io
+import math
+import os
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# The detector sees frames with at least this long side (its input size): 12-24 MP
+# JPEGs are decoded at 1/2, 1/4 or 1/8 scale by libjpeg's DCT scaling
+DETECT_DECODE_SIZE = int(os.getenv("DETECT_DECODE_SIZE", "640"))
+# Crops are cut from a decode where the box's short side keeps at least this many pixels
+CROP_MIN_SIZE = int(os.getenv("CROP_MIN_SIZE", "224"))
+
+_REDUCED_FLAGS = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+
+
+def decode_image_bytes(content: bytes) -> np.ndarray:
+    """
+    Decode an uploaded image once, straight from memory, into a contiguous
+    HxWx3 uint8 array in BGR order (what the YOLO models and the cropper consume).
+    Transparency is flattened onto a white background.
+    """
+    buffer = np.frombuffer(content, dtype=np.uint8)
+
+    if content[:2] == b"\xff\xd8":
+        # JPEG has no alpha: decode directly to BGR (honours EXIF orientation)
+        img = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+    else:
+        img = cv2.imdecode(buffer, cv2.IMREAD_UNCHANGED)
+
+    if img is None:
+        # GIF and anything else OpenCV can't read
+        return _decode_with_pil(content)
+    return _to_bgr(img)
+
+
+def _decode_with_pil(content: bytes) -> np.ndarray:
+    img = Image.open(io.BytesIO(content))
+    if img.mode in ('RGBA', 'LA', 'P', 'PA'):
+        rgba = np.asarray(img.convert('RGBA'))
+        return flatten_alpha(rgba[..., [2, 1, 0, 3]])
+    rgb = np.asarray(img.convert('RGB'))
+    return np.ascontiguousarray(rgb[..., ::-1])
+
+
+def _to_bgr(img: np.ndarray) -> np.ndarray:
+    """Normalise whatever cv2.imdecode returned to 8-bit 3-channel BGR"""
+    if img.dtype == np.uint16:
+        img = (img >> 8).astype(np.uint8)
+    elif img.dtype != np.uint8:
+        img = cv2.normalize(img, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+
+    if img.ndim == 2:
+        return cv2.cvtColor(img, cv2.COLOR_GRAY2BGR)
+    if img.shape[2] == 4:
+        return flatten_alpha(img)
+    return img
+
+
+def flatten_alpha(bgra: np.ndarray) -> np.ndarray:
+    """Composite a BGRA array onto white, in integer numpy"""
+    alpha = bgra[..., 3:4]
+    if alpha.min() == 255:
+        # Fully opaque, just drop the channel
+        return np.ascontiguousarray(bgra[..., :3])
+
+    alpha = alpha.astype(np.uint16)
+    color = bgra[..., :3].astype(np.uint16)
+    blended = (color * alpha + 255 * (255 - alpha) + 127) // 255
+    return blended.astype(np.uint8)
+
+
+# EXIF tags: DateTimeOriginal lives in the Exif sub-IFD, DateTime in IFD0
+_EXIF_IFD = 0x8769
+_DATETIME_ORIGINAL = 36867
+_DATETIME = 306
+
+
+def read_capture_time(source) -> Optional[datetime]:
+    """Capture time from EXIF of a path or file object (reads the header only, not the pixels)"""
+    try:
+        with Image.open(source) as img:
+            exif = img.getexif()
+            value = exif.get_ifd(_EXIF_IFD).get(_DATETIME_ORIGINAL) or exif.get(_DATETIME)
+        return datetime.strptime(str(value).strip("\x00 "), "%Y:%m:%d %H:%M:%S") if value else None
+    except Exception:
+        return None
+
+
+def _largest_factor(sizes: List[int], min_size: int) -> int:
+    """Largest decode scale factor that keeps every size at or above min_size"""
+    for factor in (8, 4, 2):
+        if min(sizes) / factor >= min_size:
+            return factor
+    return 1
+
+
+class DetectionFrame:
+    """
+    A frame decoded at reduced resolution for the detector. Full-resolution pixels are
+    only decoded (at the scale the crops need) when there are boxes to classify.
+    """
+    __slots__ = ("pixels", "size", "content", "full")
+
+    def __init__(self, pixels: np.ndarray, size: Tuple[int, int], content: Optional[bytes] = None,
+                 full: Optional[np.ndarray] = None):
+        self.pixels = pixels  # what the detector sees, BGR
+        self.size = size  # (width, height) at full resolution
+        self.content = content  # JPEG bytes to decode crops from...
+        self.full = full  # ...or the full-resolution array when there is nothing to re-decode
+
+    @property
+    def scale(self) -> Tuple[float, float]:
+        """Full-resolution pixels per detector pixel (x, y)"""
+        return self.size[0] / self.pixels.shape[1], self.size[1] / self.pixels.shape[0]
+
+    def crops(self, boxes: List[Tuple[int, int, int, int]]) -> List[np.ndarray]:
+        """Crops for full-resolution (x1, y1, x2, y2) boxes, from one decode at the scale they need"""
+        if not boxes:
+            return []
+        if self.full is not None:
+            source = self.full
+        else:
+            factor = _largest_factor([min(x2 - x1, y2 - y1) for x1, y1, x2, y2 in boxes], CROP_MIN_SIZE)
+            if factor >= round(self.scale[0]):
+                source = self.pixels
+            else:
+                buffer = np.frombuffer(self.content, dtype=np.uint8)
+                source = cv2.imdecode(buffer, _REDUCED_FLAGS[factor] if factor > 1 else cv2.IMREAD_COLOR)
+        sx, sy = self.size[0] / source.shape[1], self.size[1] / source.shape[0]
+        return [source[int(y1 / sy):math.ceil(y2 / sy), int(x1 / sx):math.ceil(x2 / sx)] for x1, y1, x2, y2 in boxes]
+
+
+def _oriented_size(header_size: Tuple[int, int], decoded: np.ndarray) -> Tuple[int, int]:
+    """Full-resolution (width, height) after the EXIF rotation OpenCV applied to decoded"""
+    width, height = header_size
+    if (width > height) != (decoded.shape[1] > decoded.shape[0]):
+        return height, width
+    return width, height
+
+
+def reduce_for_detection(image: np.ndarray, size: int = DETECT_DECODE_SIZE) -> DetectionFrame:
+    """DetectionFrame for an already decoded full-resolution array"""
+    height, width = image.shape[:2]
+    factor = _largest_factor([max(width, height)], size)
+    if factor == 1:
+        return DetectionFrame(image, (width, height), full=image)
+    reduced = cv2.resize(image, (math.ceil(width / factor), math.ceil(height / factor)), interpolation=cv2.INTER_AREA)
+    return DetectionFrame(reduced, (width, height), full=image)
+
+
+def decode_for_detection(content: bytes, size: int = DETECT_DECODE_SIZE) -> DetectionFrame:
+    """
+    Decode an upload for the detector: large JPEGs at reduced scale straight from the
+    DCT coefficients (a fraction of the CPU and memory of a full decode), anything
+    else fully, then downscaled.
+    """
+    if content[:2] == b"\xff\xd8":
+        try:
+            with Image.open(io.BytesIO(content)) as img:
+                header_size = img.size  # header only
+        except Exception:
+            header_size = None
+        factor = _largest_factor([max(header_size)], size) if header_size else 1
+        if factor > 1:
+            pixels = cv2.imdecode(np.frombuffer(content, dtype=np.uint8), _REDUCED_FLAGS[factor])
+            if pixels is not None:
+                return DetectionFrame(pixels, _oriented_size(header_size, pixels), content=content)
+    return reduce_for_detection(decode_image_bytes(content), size)
@@ -0,0 +1,140 @@
+# app/pipeline/executor.py
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable
+
+# "thread" keeps one copy of the models and relies on torch/cv2 releasing the GIL,
+# "process" gives each worker its own interpreter (and its own copy of the models)
+INFERENCE_EXECUTOR = os.getenv("INFERENCE_EXECUTOR", "thread")
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", "32"))
+INFERENCE_RETRY_AFTER = int(os.getenv("INFERENCE_RETRY_AFTER", "5"))
+
+
+class InferenceQueueFull(Exception):
+    """Raised when the inference queue cannot accept more work"""
+
+    def __init__(self, retry_after: int = INFERENCE_RETRY_AFTER):
+        super().__init__("Inference queue is full, retry later")
+        self.retry_after = retry_after
+
+
+def _timed_call(fn: Callable, args: tuple, enqueued_at: float):
+    """Run fn in the worker and report when it actually started"""
+    # time.monotonic is system-wide on Linux, so it is comparable across processes
+    started_at = time.monotonic()
+    return started_at - enqueued_at, fn(*args)
+
+
+class InferenceExecutor:
+    """Bounded thread/process pool that keeps inference off the event loop"""
+
+    def __init__(self, kind: str = INFERENCE_EXECUTOR, workers: int = INFERENCE_WORKERS,
+                 max_queue: int = INFERENCE_QUEUE_SIZE):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown inference executor: {kind}")
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+
+        if kind == "process":
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inference")
+
+        # Jobs handed to the pool that have not finished yet (running + waiting)
+        self._pending = 0
+        self._slot_freed: asyncio.Condition | None = None
+
+        self._submitted = 0
+        self._completed = 0
+        self._rejected = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+        self._last_wait = 0.0
+
+    @property
+    def capacity(self) -> int:
+        return self.workers + self.max_queue
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self._pending - self.workers)
+
+    @property
+    def full(self) -> bool:
+        """New calls submitted without wait would be rejected"""
+        return self._pending >= self.capacity
+
+    def _condition(self) -> asyncio.Condition:
+        if self._slot_freed is None:
+            self._slot_freed = asyncio.Condition()
+        return self._slot_freed
+
+    async def run(self, fn: Callable, *args, wait: bool = False) -> Any:
+        """
+        Run fn(*args) on the pool.
+        Raises InferenceQueueFull when the queue is at capacity, unless wait=True
+        in which case the caller is parked until a slot frees up.
+        """
+        if self.full:
+            if not wait:
+                self._rejected += 1
+                raise InferenceQueueFull()
+            condition = self._condition()
+            async with condition:
+                await condition.wait_for(lambda: self._pending < self.capacity)
+
+        self._pending += 1
+        self._submitted += 1
+        loop = asyncio.get_running_loop()
+        try:
+            wait_time, result = await loop.run_in_executor(
+                self._pool, _timed_call, fn, args, time.monotonic()
+            )
+        finally:
+            self._pending -= 1
+            if self._slot_freed is not None:
+                async with self._slot_freed:
+                    self._slot_freed.notify()
+
+        self._completed += 1
+        self._last_wait = wait_time
+        self._total_wait += wait_time
+        self._max_wait = max(self._max_wait, wait_time)
+        return result
+
+    def stats(self) -> dict:
+        """Queue depth and wait time snapshot"""
+        return {
+            "executor": self.kind,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": min(self._pending, self.workers),
+            "queue_depth": self.queue_depth,
+            "submitted": self._submitted,
+            "completed": self._completed,
+            "rejected": self._rejected,
+            "wait_ms": {
+                "last": round(self._last_wait * 1000, 2),
+                "avg": round(self._total_wait / self._completed * 1000, 2) if self._completed else 0.0,
+                "max": round(self._max_wait * 1000, 2),
+            },
+        }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+# Singleton
+_executor_instance = None
+
+
+def inference_executor_singleton() -> InferenceExecutor:
+    """Get or create the inference executor singleton"""
+    global _executor_instance
+    if _executor_instance is None:
+        _executor_instance = InferenceExecutor()
+    return _executor_instance
@@ -1,119 +1,400 @@
 # app/pipeline/image_processor.py
-from ultralytics import YOLO
+import asyncio
 import cv2
 import os
+import time
+import numpy as np
+from typing import List, Tuple, Union
+
+from app.pipeline.backends import INFERENCE_BACKEND, INFERENCE_INT8, load_model
+from app.pipeline.decode import DetectionFrame
+from app.pipeline.executor import inference_executor_singleton
+from app.pipeline.micro_batcher import MicroBatcher, MICRO_BATCH_SIZE
+from app.pipeline.result_cache import (
+    ResultCache, content_digest, file_digest, model_fingerprint, result_cache_singleton
+)
+from app.utils.metrics import add_timing, set_queue_wait
+
+# A file path, an already decoded HxWx3 BGR uint8 array, or a reduced-resolution
+# DetectionFrame (boxes are still reported in full-resolution pixels)
+ImageSource = Union[str, np.ndarray, DetectionFrame]
+
+DETECTION_CONFIDENCE = float(os.getenv("DETECTION_CONFIDENCE", "0.25"))
+
+# Max crops per classifier forward pass
+CLASSIFIER_BATCH_SIZE = int(os.getenv("CLASSIFIER_BATCH_SIZE", "64"))
+
+# Frame sizes (WxH) run through the models before serving: the letterbox keeps the
+# aspect ratio, so every ratio is its own input shape to initialise ("" disables)
+WARMUP_SIZES = [
+    tuple(map(int, size.split("x"))) for size in os.getenv("WARMUP_SIZES", "640x480,1920x1080").split(",") if size
+]
 
 
 class ImageProcessor:
-    def __init__(self):
+    def __init__(self, detector_path: str = 'models/animal_detector.pt',
+                 classifier_path: str = 'models/species_classifier.pt',
+                 version: str = "default", backend: str = INFERENCE_BACKEND, int8: bool = INFERENCE_INT8):
         """Initialize both detection and classification models"""
+        detector_model, classifier_model = self._load_models(detector_path, classifier_path, version, backend, int8)
+        # Requests currently using this processor, so a replaced model can drain before release
+        self.in_flight = 0
+
+        # Results are cached by image content + the exact models loaded, so swapping
+        # weights or backends (int8 results differ slightly) invalidates them
+        self.model_fingerprint = model_fingerprint(detector_model, classifier_model, conf=DETECTION_CONFIDENCE)
+        self.result_cache = result_cache_singleton()
+
+        # Concurrent process_image calls share batched forward passes
+        executor = inference_executor_singleton()
+        self.batcher = MicroBatcher(self._run_batch, max_pending=executor.capacity * MICRO_BATCH_SIZE)
+
+    @classmethod
+    def models_only(cls, detector_path: str, classifier_path: str, version: str = "default",
+                    backend: str = INFERENCE_BACKEND, int8: bool = INFERENCE_INT8) -> "ImageProcessor":
+        """
+        Just the models, for process-pool workers: the *_sync methods work, but there is
+        no result cache, micro-batcher or executor (the parent process has those)
+        """
+        processor = cls.__new__(cls)
+        processor._load_models(detector_path, classifier_path, version, backend, int8)
+        return processor
+
+    def _load_models(self, detector_path: str, classifier_path: str, version: str, backend: str, int8: bool):
+        """Load the detector and (if present) the classifier; returns the model files actually loaded"""
         # Stage 1: Detection model
-        detector_path = 'models/animal_detector.pt'
         if not os.path.exists(detector_path):
             raise FileNotFoundError(f"Animal detector not found at {detector_path}")
-        
-        self.animal_detector = YOLO(detector_path)
-        print("✅ Animal detector loaded")
-        
+
+        self.version = version
+        # Everything a process-pool worker needs to load the same models
+        self.spec = (detector_path, classifier_path, version, backend, int8)
+
+        # backend picks the .pt, ONNX or OpenVINO (optionally int8) artifacts
+        self.animal_detector, detector_model, self.backend = load_model(detector_path, "detect", backend, int8)
+        print(f"✅ Animal detector loaded ({self.backend}: {detector_model})")
+
         # Stage 2: Classification model
-        classifier_path = 'models/species_classifier.pt'
+        classifier_model = None
         if not os.path.exists(classifier_path):
             print("⚠️ Species classifier not found, using detection only")
             self.species_classifier = None
         else:
-            self.species_classifier = YOLO(classifier_path)
-            print("✅ Species classifier loaded")
-    
-    async def process_image(self, image_path: str) -> dict:
-        """Two-stage detection: detect then classify"""
+            self.species_classifier, classifier_model, classifier_backend = load_model(
+                classifier_path, "classify", backend, int8
+            )
+            print(f"✅ Species classifier loaded ({classifier_backend}: {classifier_model})")
+        return detector_model, classifier_model
+
+    async def process_image(self, image: ImageSource, wait: bool = False,
+                            image_bytes: bytes | None = None) -> dict:
+        """
+        Two-stage detection: detect then classify.
+        Accepts a file path or a decoded BGR array (see app.pipeline.decode); pass the
+        original upload as image_bytes so decoded arrays can be served from the result cache.
+        Requests are coalesced into micro-batches and run on the inference executor
+        so the event loop stays responsive; raises InferenceQueueFull when saturated
+        (unless wait=True).
+        """
+        self.in_flight += 1
         try:
-            # Stage 1: Detect animals
-            detection_results = self.animal_detector(image_path, conf=0.25)
-            
-            detections = []
-            
-            for result in detection_results:
-                boxes = result.boxes
-                
-                if len(boxes) == 0:
-                    return {
-                        "status": "no_animal_detected",
-                        "animals_detected": 0,
-                        "detections": []
-                    }
-                
-                # Read original image for cropping
-                img = cv2.imread(image_path)
-                
-                for box in boxes:
-                    x1, y1, x2, y2 = map(int, box.xyxy[0].cpu().numpy())
-                    detection_confidence = float(box.conf[0])
-                    
-                    # Stage 2: Classify the cropped region
-                    species_name = "unknown"
-                    classification_confidence = 0.0
-                    
-                    if self.species_classifier is not None:
-                        # Crop the detected animal
-                        cropped = img[y1:y2, x1:x2]
-                        
-                        if cropped.size > 0:  # Valid crop
-                            # Save crop temporarily
-                            temp_crop = f"/tmp/crop_{os.path.basename(image_path)}"
-                            cv2.imwrite(temp_crop, cropped)
-                            
-                            # Classify
-                            classify_results = self.species_classifier(temp_crop)
-                            
-                            # Get top prediction from classification
-                            if len(classify_results) > 0:
-                                probs = classify_results[0].probs
-                                if probs is not None:
-                                    top_class_id = probs.top1
-                                    species_name = classify_results[0].names[top_class_id]
-                                    classification_confidence = float(probs.top1conf)
-                            
-                            # Clean up
-                            if os.path.exists(temp_crop):
-                                os.remove(temp_crop)
-                    else:
-                        # Fallback: use detection class
-                        class_id = int(box.cls[0])
-                        species_name = result.names[class_id]
-                        classification_confidence = detection_confidence
-                    
-                    detections.append({
-                        "species": species_name,
-                        "detection_confidence": detection_confidence,
-                        "classification_confidence": classification_confidence,
-                        "bounding_box": {
-                            "x1": float(x1),
-                            "y1": float(y1),
-                            "x2": float(x2),
-                            "y2": float(y2)
-                        }
-                    })
-            
-            return {
-                "status": "animal_detected",
-                "animals_detected": len(detections),
-                "detections": detections
-            }
-            
+            cache_key = await self._cache_key(image, image_bytes)
+            if cache_key is not None:
+                cached = await self.result_cache.get_async(cache_key)
+                if cached is not None:
+                    return cached
+
+            start = time.perf_counter()
+            if self.batcher.max_batch_size == 1:
+                result = (await self._run_batch([image], wait=wait))[0]
+            else:
+                result = await self.batcher.submit(image, wait=wait)
+            set_queue_wait(result, time.perf_counter() - start)
+
+            if cache_key is not None and result.get("status") != "error":
+                self.result_cache.put(cache_key, result)
+            return result
+        finally:
+            self.in_flight -= 1
+
+    def warmup(self, sizes: List[Tuple[int, int]] = WARMUP_SIZES) -> float:
+        """Run blank frames through both stages so the first real requests don't pay for lazy init"""
+        start = time.perf_counter()
+        for index, (width, height) in enumerate(sizes):
+            frame = np.full((height, width, 3), 114, dtype=np.uint8)
+            # A full micro-batch once, single frames (the common case) for every size
+            self.detect_batch_sync([frame] * (MICRO_BATCH_SIZE if index == 0 else 1))
+            if self.species_classifier is not None:
+                self.species_classifier([frame[:224, :224]], verbose=False)
+        return time.perf_counter() - start
+
+    async def warm_workers(self):
+        """Load and warm this version in every process-pool worker (no-op for the thread executor)"""
+        executor = inference_executor_singleton()
+        if executor.kind == "process":
+            # Each call keeps a worker busy, so concurrent calls spread over all of them
+            await asyncio.gather(*[executor.run(_warmup_in_worker, self.spec, wait=True)
+                                   for _ in range(executor.workers)])
+
+    async def drain(self, timeout: float) -> bool:
+        """Wait for in-flight requests to finish; False if some were still running at timeout"""
+        deadline = time.monotonic() + timeout
+        while self.in_flight and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        return self.in_flight == 0
+
+    def close(self):
+        """Stop the micro-batcher of a processor that no longer serves requests"""
+        self.batcher.close()
+
+    async def queue_stats(self) -> dict:
+        """Inference executor, micro-batching and result cache stats"""
+        stats = inference_executor_singleton().stats()
+        stats["micro_batching"] = self.batcher.stats()
+        stats["result_cache"] = self.result_cache.stats()
+        stats["model_version"] = self.version
+        stats["backend"] = self.backend
+        return stats
+
+    async def _cache_key(self, image: ImageSource, image_bytes: bytes | None) -> str | None:
+        """Content-addressed cache key, None when the content can't be hashed"""
+        try:
+            if image_bytes is not None:
+                digest = await asyncio.to_thread(content_digest, image_bytes)
+            elif isinstance(image, str):
+                digest = await asyncio.to_thread(file_digest, image)
+            else:
+                return None
+        except OSError:
+            # Unreadable path, let the pipeline report the error
+            return None
+        return ResultCache.make_key(self.model_fingerprint, digest)
+
+    async def _run_batch(self, images: List[ImageSource], wait: bool = False) -> List[dict]:
+        """Run one batch on the inference executor"""
+        executor = inference_executor_singleton()
+        if executor.kind == "process":
+            # Bound methods can't cross the process boundary, each worker loads the models of self.spec
+            return await executor.run(_process_batch_in_worker, self.spec, images, wait=wait)
+        return await executor.run(self._process_batch_sync, images, wait=wait)
+
+    def _process_image_sync(self, image: ImageSource) -> dict:
+        """Blocking two-stage pipeline for a single image"""
+        return self._process_batch_sync([image])[0]
+
+    def _process_batch_sync(self, images: List[ImageSource]) -> List[dict]:
+        """
+        Blocking two-stage pipeline: one batched detector pass for all images,
+        then every crop of the batch classified in-memory in as few classifier calls as possible.
+        """
+        return self.classify_batch_sync(self.detect_batch_sync(images))
+
+    def detect_batch_sync(self, images: List[ImageSource]) -> List[Tuple[dict, list]]:
+        """
+        Stage 1 for a batch: (result, crops) per image, where crops are (array, detection)
+        pairs still waiting for classification.
+        """
+        inputs = [image.pixels if isinstance(image, DetectionFrame) else image for image in images]
+        start = time.perf_counter()
+        try:
+            detection_results = self.animal_detector(inputs, conf=DETECTION_CONFIDENCE, verbose=False)
         except Exception as e:
+            if len(images) == 1:
+                return [(self._error_result(e), [])]
+            # One unreadable image fails the whole batch, isolate it
+            return [self.detect_batch_sync([image])[0] for image in images]
+        detect_seconds = time.perf_counter() - start
+
+        detected = []
+        for image, result in zip(images, detection_results):
+            start = time.perf_counter()
+            try:
+                entry = self._collect_detections(image, result)
+            except Exception as e:
+                entry = (self._error_result(e), [])
+            # Stage timings travel with the result (see app/utils/metrics.py)
+            timings = entry[0]["timings"] = {}
+            add_timing(timings, "detect", detect_seconds)
+            add_timing(timings, "crop", time.perf_counter() - start)
+            detected.append(entry)
+        return detected
+
+    def classify_batch_sync(self, detected: List[Tuple[dict, list]]) -> List[dict]:
+        """Stage 2 for a batch: classify every crop of every image together"""
+        results = []
+        crops = []
+        owners = []  # (result index, detection dict) for each crop
+        for image_result, image_crops in detected:
+            for crop, detection in image_crops:
+                crops.append(crop)
+                owners.append((len(results), detection))
+            results.append(image_result)
+
+        if crops:
+            start = time.perf_counter()
+            try:
+                self._classify_crops(crops, [detection for _, detection in owners])
+            except Exception as e:
+                for index in {index for index, _ in owners}:
+                    results[index] = {**self._error_result(e), "timings": results[index].get("timings", {})}
+            seconds = time.perf_counter() - start
+            for index in {index for index, _ in owners}:
+                add_timing(results[index].setdefault("timings", {}), "classify", seconds)
+
+        return results
+
+    async def detect_images(self, images: List[ImageSource]) -> List[Tuple[dict, list]]:
+        """Stage 1 on the inference executor (waits for a slot)"""
+        executor = inference_executor_singleton()
+        self.in_flight += 1
+        try:
+            if executor.kind == "process":
+                return await executor.run(_detect_batch_in_worker, self.spec, images, wait=True)
+            return await executor.run(self.detect_batch_sync, images, wait=True)
+        finally:
+            self.in_flight -= 1
+
+    async def classify_detections(self, detected: List[Tuple[dict, list]]) -> List[dict]:
+        """Stage 2 on the inference executor (waits for a slot)"""
+        if not any(crops for _, crops in detected):
+            return [image_result for image_result, _ in detected]
+        executor = inference_executor_singleton()
+        self.in_flight += 1
+        try:
+            if executor.kind == "process":
+                return await executor.run(_classify_batch_in_worker, self.spec, detected, wait=True)
+            return await executor.run(self.classify_batch_sync, detected, wait=True)
+        finally:
+            self.in_flight -= 1
+
+    def _collect_detections(self, image: ImageSource, result) -> Tuple[dict, list]:
+        """Build the result for one image and return the crops still to be classified"""
+        boxes = result.boxes
+
+        if len(boxes) == 0:
             return {
-                "status": "error",
-                "error": str(e),
+                "status": "no_animal_detected",
                 "animals_detected": 0,
                 "detections": []
+            }, []
+
+        detections = []
+        crops = []
+
+        # Boxes in full-resolution pixels (the detector may have seen a reduced frame)
+        sx, sy = image.scale if isinstance(image, DetectionFrame) else (1.0, 1.0)
+        boxes_xyxy = [
+            (int(x1 * sx), int(y1 * sy), int(x2 * sx), int(y2 * sy))
+            for x1, y1, x2, y2 in (box.xyxy[0].cpu().numpy() for box in boxes)
+        ]
+
+        for box, (x1, y1, x2, y2) in zip(boxes, boxes_xyxy):
+            detection_confidence = float(box.conf[0])
+
+            detection = {
+                "species": "unknown",
+                "detection_confidence": detection_confidence,
+                "classification_confidence": 0.0,
+                "bounding_box": {
+                    "x1": float(x1),
+                    "y1": float(y1),
+                    "x2": float(x2),
+                    "y2": float(y2)
+                }
             }
 
+            if self.species_classifier is None:
+                # Fallback: use detection class
+                class_id = int(box.cls[0])
+                detection["species"] = result.names[class_id]
+                detection["classification_confidence"] = detection_confidence
+
+            detections.append(detection)
+
+        if self.species_classifier is not None:
+            if isinstance(image, DetectionFrame):
+                # Decodes full-resolution pixels only now that there is something to classify
+                box_crops = image.crops(boxes_xyxy)
+            else:
+                # The detector already decoded the frame, reuse it (BGR, like cv2.imread)
+                img = result.orig_img
+                if img is None:
+                    img = cv2.imread(image) if isinstance(image, str) else image
+                # Views into the decoded frame (no copy, no re-encode)
+                box_crops = [img[y1:y2, x1:x2] for x1, y1, x2, y2 in boxes_xyxy]
+            crops = [(crop, detection) for crop, detection in zip(box_crops, detections) if crop.size > 0]
+
+        return {
+            "status": "animal_detected",
+            "animals_detected": len(detections),
+            "detections": detections
+        }, crops
+
+    def _classify_crops(self, crops: list, detections: List[dict]):
+        """Classify in-memory crops in chunks and fill in species on their detections"""
+        for start in range(0, len(crops), CLASSIFIER_BATCH_SIZE):
+            chunk = crops[start:start + CLASSIFIER_BATCH_SIZE]
+            classify_results = self.species_classifier(chunk, verbose=False)
+
+            for detection, classify_result in zip(detections[start:start + CLASSIFIER_BATCH_SIZE], classify_results):
+                # Get top prediction from classification
+                probs = classify_result.probs
+                if probs is not None:
+                    detection["species"] = classify_result.names[probs.top1]
+                    detection["classification_confidence"] = float(probs.top1conf)
+
+    @staticmethod
+    def _error_result(e: Exception) -> dict:
+        return {
+            "status": "error",
+            "error": str(e),
+            "animals_detected": 0,
+            "detections": []
+        }
+
+
+_worker_processor = None
+
+
+def _processor_for(spec: tuple) -> "ImageProcessor":
+    """The models of a process-pool worker, reloaded when a new model version comes in"""
+    global _worker_processor
+    if _worker_processor is None or _worker_processor.spec != spec:
+        # Drop the old models before loading the new ones
+        _worker_processor = None
+        _worker_processor = ImageProcessor.models_only(*spec)
+    return _worker_processor
+
+
+def _warmup_in_worker(spec: tuple) -> float:
+    return _processor_for(spec).warmup()
+
+
+def _process_batch_in_worker(spec: tuple, images: List[ImageSource]) -> List[dict]:
+    """Entry points for process-pool workers"""
+    return _processor_for(spec)._process_batch_sync(images)
+
+
+def _detect_batch_in_worker(spec: tuple, images: List[ImageSource]) -> List[Tuple[dict, list]]:
+    return _processor_for(spec).detect_batch_sync(images)
+
+
+def _classify_batch_in_worker(spec: tuple, detected: List[Tuple[dict, list]]) -> List[dict]:
+    return _processor_for(spec).classify_batch_sync(detected)
 
-# Singleton
-_image_processor_instance = None
 
-def image_processor_singleton():
-    global _image_processor_instance
-    if _image_processor_instance is None:
-        _image_processor_instance = ImageProcessor()
-    return _image_processor_instance
\ No newline at end of file
+def image_processor_singleton() -> ImageProcessor:
+    """
+    Processor of the active model version (see app/pipeline/model_registry.py), or a
+    client of the node's model server when INFERENCE_SERVER_SOCKET is set
+    """
+    from app.pipeline.model_server import INFERENCE_SERVER_SOCKET, remote_processor_singleton
+    from app.utils.startup import ModelsNotReady, startup_tracker_singleton
+    if INFERENCE_SERVER_SOCKET:
+        return remote_processor_singleton()
+    tracker = startup_tracker_singleton()
+    if tracker.background_loading and not tracker.ready:
+        # Loading (or retrying after a failure) happens in the startup task, never on the event loop
+        raise ModelsNotReady()
+    from app.pipeline.model_registry import model_manager_singleton
+    return model_manager_singleton().active
@@ -0,0 +1,418 @@
+# app/pipeline/job_store.py
+"""
+Durable queue and state for background batch jobs.
+
+SQLiteJobStore (default) keeps everything in one local file and works offline;
+any number of worker processes on the host can share it. RedisJobStore does the
+same over Redis for workers on several hosts. Both record every image of a job
+as pending/done/failed, so a restarted job only processes what is left.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List, Optional
+
+JOBS_BACKEND = os.getenv("JOBS_BACKEND", "sqlite")
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "./jobs.sqlite")
+JOBS_REDIS_URL = os.getenv("JOBS_REDIS_URL", os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+
+# Item states
+PENDING, DONE, FAILED = 0, 1, 2
+
+# What a worker should do next with the job it holds
+RUN, CANCEL, LOST = "run", "cancel", "lost"
+
+FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return datetime.utcfromtimestamp(ts).isoformat() if ts else None
+
+
+def public_job(job: dict) -> dict:
+    """API representation of a stored job"""
+    processed = job["processed"] + job["failed"]
+    return {
+        "job_id": job["id"],
+        "project_id": job["project_id"],
+        "session_id": job["session_id"],
+        "status": job["status"],
+        "total": job["total"],
+        "processed": processed,
+        "failed": job["failed"],
+        "progress": round(processed / job["total"], 4) if job["total"] else 1.0,
+        "summary": job["summary"],
+        "error": job["error"],
+        "cancel_requested": bool(job["cancel_requested"]),
+        "attempts": job["attempts"],
+        "worker_id": job["worker_id"] or None,
+        "created_at": _iso(job["created_at"]),
+        "started_at": _iso(job["started_at"]),
+        "finished_at": _iso(job["finished_at"]),
+    }
+
+
+class SQLiteJobStore:
+    """Job queue in a local SQLite file; claims are serialised with BEGIN IMMEDIATE"""
+
+    def __init__(self, path: str = JOBS_DB_PATH):
+        self.path = path
+        self._db = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                project_id TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                status TEXT NOT NULL,
+                total INTEGER NOT NULL,
+                processed INTEGER NOT NULL DEFAULT 0,
+                failed INTEGER NOT NULL DEFAULT 0,
+                summary TEXT,
+                error TEXT,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                worker_id TEXT,
+                heartbeat_at REAL,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS ix_jobs_status_created ON jobs (status, created_at);
+            CREATE INDEX IF NOT EXISTS ix_jobs_project_created ON jobs (project_id, created_at);
+            CREATE TABLE IF NOT EXISTS job_items (
+                job_id TEXT NOT NULL,
+                path TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                state INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (job_id, path)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS ix_job_items_job_state_seq ON job_items (job_id, state, seq);
+        """)
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _row(row) -> Optional[dict]:
+        if row is None:
+            return None
+        job = dict(row)
+        job["summary"] = json.loads(job["summary"]) if job["summary"] else None
+        return job
+
+    def create(self, job_id: str, project_id: str, session_id: str, paths: List[str]) -> dict:
+        with self._transaction() as db:
+            db.execute(
+                "INSERT INTO jobs (id, project_id, session_id, status, total, created_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+                (job_id, project_id, session_id, len(paths), time.time())
+            )
+            db.executemany(
+                "INSERT INTO job_items (job_id, path, seq) VALUES (?, ?, ?)",
+                ((job_id, path, seq) for seq, path in enumerate(paths))
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row(row)
+
+    def list_jobs(self, project_id: str, limit: int = 50) -> List[dict]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM jobs WHERE project_id = ? ORDER BY created_at DESC LIMIT ?", (project_id, limit)
+            ).fetchall()
+        return [self._row(row) for row in rows]
+
+    def claim(self, worker_id: str) -> Optional[dict]:
+        """Take the oldest queued job and mark it running for worker_id"""
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute(
+                "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute(
+                "UPDATE jobs SET status = 'running', worker_id = ?, heartbeat_at = ?, attempts = attempts + 1, "
+                "started_at = COALESCE(started_at, ?) WHERE id = ?",
+                (worker_id, now, now, row["id"])
+            )
+        return self.get(row["id"])
+
+    def pending_paths(self, job_id: str) -> List[str]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT path FROM job_items WHERE job_id = ? AND state = ? ORDER BY seq", (job_id, PENDING)
+            ).fetchall()
+        return [row["path"] for row in rows]
+
+    def _control(self, db, job_id: str, worker_id: str) -> str:
+        row = db.execute("SELECT worker_id, status, cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None or row["worker_id"] != worker_id or row["status"] != "running":
+            return LOST
+        return CANCEL if row["cancel_requested"] else RUN
+
+    def heartbeat(self, job_id: str, worker_id: str) -> str:
+        with self._transaction() as db:
+            control = self._control(db, job_id, worker_id)
+            if control != LOST:
+                db.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time(), job_id))
+        return control
+
+    def checkpoint(self, job_id: str, worker_id: str, done: List[str], failed: List[str],
+                   summary: Optional[dict]) -> str:
+        """Record finished images and the running summary; returns RUN, CANCEL or LOST"""
+        with self._transaction() as db:
+            control = self._control(db, job_id, worker_id)
+            if control == LOST:
+                return control
+            for state, paths in ((DONE, done), (FAILED, failed)):
+                db.executemany(
+                    "UPDATE job_items SET state = ? WHERE job_id = ? AND path = ?",
+                    ((state, job_id, path) for path in paths)
+                )
+            db.execute(
+                "UPDATE jobs SET heartbeat_at = ?, summary = COALESCE(?, summary), "
+                "processed = (SELECT COUNT(*) FROM job_items WHERE job_id = ? AND state = ?), "
+                "failed = (SELECT COUNT(*) FROM job_items WHERE job_id = ? AND state = ?) WHERE id = ?",
+                (time.time(), json.dumps(summary) if summary is not None else None,
+                 job_id, DONE, job_id, FAILED, job_id)
+            )
+        return control
+
+    def finish(self, job_id: str, worker_id: str, status: str, error: Optional[str] = None):
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ?, heartbeat_at = NULL "
+                "WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (status, error, time.time(), job_id, worker_id)
+            )
+
+    def release(self, job_id: str, worker_id: str):
+        """Hand a running job back to the queue (worker shutting down)"""
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE jobs SET status = 'queued', worker_id = NULL, heartbeat_at = NULL "
+                "WHERE id = ? AND worker_id = ? AND status = 'running'",
+                (job_id, worker_id)
+            )
+
+    def cancel(self, job_id: str) -> Optional[dict]:
+        """Cancel a queued job at once; a running one stops at its next heartbeat"""
+        with self._transaction() as db:
+            db.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status IN ('queued', 'running')",
+                       (job_id,))
+            db.execute("UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+                       (time.time(), job_id))
+        return self.get(job_id)
+
+    def requeue_stale(self, stale_after: float) -> List[str]:
+        """Put running jobs whose worker stopped heartbeating back in the queue"""
+        with self._transaction() as db:
+            rows = db.execute(
+                "SELECT id FROM jobs WHERE status = 'running' AND heartbeat_at < ?", (time.time() - stale_after,)
+            ).fetchall()
+            ids = [row["id"] for row in rows]
+            db.executemany(
+                "UPDATE jobs SET status = 'queued', worker_id = NULL, heartbeat_at = NULL WHERE id = ?",
+                ((job_id,) for job_id in ids)
+            )
+        return ids
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {"backend": "sqlite", "path": self.path, "jobs": {row["status"]: row["n"] for row in rows}}
+
+
+# KEYS: queue, running  ARGV: now, worker_id, job key prefix
+_CLAIM_SCRIPT = """
+local job_id = redis.call('LPOP', KEYS[1])
+if not job_id then return false end
+local key = ARGV[3] .. job_id
+redis.call('ZADD', KEYS[2], ARGV[1], job_id)
+redis.call('HSET', key, 'status', 'running', 'worker_id', ARGV[2], 'heartbeat_at', ARGV[1])
+redis.call('HSETNX', key, 'started_at', ARGV[1])
+redis.call('HINCRBY', key, 'attempts', 1)
+return job_id
+"""
+
+# KEYS: running, queue  ARGV: heartbeat cutoff, job key prefix
+_REQUEUE_SCRIPT = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+for _, job_id in ipairs(ids) do
+  redis.call('ZREM', KEYS[1], job_id)
+  redis.call('HSET', ARGV[2] .. job_id, 'status', 'queued', 'worker_id', '')
+  redis.call('LPUSH', KEYS[2], job_id)
+end
+return ids
+"""
+
+
+class RedisJobStore:
+    """Job queue in Redis, for workers spread over several hosts"""
+
+    _FIELDS_INT = ("total", "processed", "failed", "cancel_requested", "attempts")
+    _FIELDS_FLOAT = ("heartbeat_at", "created_at", "started_at", "finished_at")
+
+    def __init__(self, url: str = JOBS_REDIS_URL, prefix: str = "jobs"):
+        import redis
+
+        self.url = url
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+        self._queue = f"{prefix}:queue"
+        self._running = f"{prefix}:running"
+        self._claim = self.redis.register_script(_CLAIM_SCRIPT)
+        self._requeue = self.redis.register_script(_REQUEUE_SCRIPT)
+
+    def _key(self, job_id: str, suffix: str = "") -> str:
+        return f"{self.prefix}:{job_id}{suffix}"
+
+    def _decode(self, data: dict) -> Optional[dict]:
+        if not data:
+            return None
+        job = {"error": None, "summary": None, "worker_id": None, **data}
+        for field in self._FIELDS_INT:
+            job[field] = int(job.get(field) or 0)
+        for field in self._FIELDS_FLOAT:
+            job[field] = float(job[field]) if job.get(field) else None
+        job["summary"] = json.loads(job["summary"]) if job["summary"] else None
+        job["error"] = job["error"] or None
+        return job
+
+    def create(self, job_id: str, project_id: str, session_id: str, paths: List[str]) -> dict:
+        now = time.time()
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.hset(self._key(job_id), mapping={
+            "id": job_id, "project_id": project_id, "session_id": session_id, "status": "queued",
+            "total": len(paths), "processed": 0, "failed": 0, "cancel_requested": 0, "attempts": 0,
+            "created_at": now,
+        })
+        for start in range(0, len(paths), 10000):
+            pipe.rpush(self._key(job_id, ":paths"), *paths[start:start + 10000])
+        pipe.zadd(f"{self.prefix}:project:{project_id}", {job_id: now})
+        pipe.rpush(self._queue, job_id)
+        pipe.execute()
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self._decode(self.redis.hgetall(self._key(job_id)))
+
+    def list_jobs(self, project_id: str, limit: int = 50) -> List[dict]:
+        ids = self.redis.zrevrange(f"{self.prefix}:project:{project_id}", 0, limit - 1)
+        pipe = self.redis.pipeline(transaction=False)
+        for job_id in ids:
+            pipe.hgetall(self._key(job_id))
+        return [job for job in map(self._decode, pipe.execute()) if job]
+
+    def claim(self, worker_id: str) -> Optional[dict]:
+        job_id = self._claim(keys=[self._queue, self._running], args=[time.time(), worker_id, f"{self.prefix}:"])
+        return self.get(job_id) if job_id else None
+
+    def pending_paths(self, job_id: str) -> List[str]:
+        finished = self.redis.sunion(self._key(job_id, ":done"), self._key(job_id, ":failed"))
+        return [path for path in self.redis.lrange(self._key(job_id, ":paths"), 0, -1) if path not in finished]
+
+    def _control(self, job_id: str, worker_id: str) -> str:
+        owner, status, cancel_requested = self.redis.hmget(self._key(job_id), "worker_id", "status", "cancel_requested")
+        if owner != worker_id or status != "running":
+            return LOST
+        return CANCEL if cancel_requested == "1" else RUN
+
+    def heartbeat(self, job_id: str, worker_id: str) -> str:
+        control = self._control(job_id, worker_id)
+        if control != LOST:
+            now = time.time()
+            self.redis.zadd(self._running, {job_id: now}, xx=True)
+            self.redis.hset(self._key(job_id), "heartbeat_at", now)
+        return control
+
+    def checkpoint(self, job_id: str, worker_id: str, done: List[str], failed: List[str],
+                   summary: Optional[dict]) -> str:
+        control = self.heartbeat(job_id, worker_id)
+        if control == LOST:
+            return control
+        pipe = self.redis.pipeline(transaction=True)
+        if done:
+            pipe.sadd(self._key(job_id, ":done"), *done)
+        if failed:
+            pipe.sadd(self._key(job_id, ":failed"), *failed)
+        if summary is not None:
+            pipe.hset(self._key(job_id), "summary", json.dumps(summary))
+        pipe.scard(self._key(job_id, ":done"))
+        pipe.scard(self._key(job_id, ":failed"))
+        processed, failed_count = pipe.execute()[-2:]
+        self.redis.hset(self._key(job_id), mapping={"processed": processed, "failed": failed_count})
+        return control
+
+    def finish(self, job_id: str, worker_id: str, status: str, error: Optional[str] = None):
+        if self._control(job_id, worker_id) == LOST:
+            return
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.zrem(self._running, job_id)
+        pipe.hset(self._key(job_id), mapping={"status": status, "error": error or "", "finished_at": time.time()})
+        pipe.delete(self._key(job_id, ":done"), self._key(job_id, ":failed"))
+        pipe.execute()
+
+    def release(self, job_id: str, worker_id: str):
+        if self._control(job_id, worker_id) == LOST:
+            return
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.zrem(self._running, job_id)
+        pipe.hset(self._key(job_id), mapping={"status": "queued", "worker_id": ""})
+        pipe.lpush(self._queue, job_id)
+        pipe.execute()
+
+    def cancel(self, job_id: str) -> Optional[dict]:
+        job = self.get(job_id)
+        if job is None or job["status"] in FINISHED_STATUSES:
+            return job
+        self.redis.hset(self._key(job_id), "cancel_requested", 1)
+        if self.redis.lrem(self._queue, 0, job_id):
+            self.redis.hset(self._key(job_id), mapping={"status": "cancelled", "finished_at": time.time()})
+        return self.get(job_id)
+
+    def requeue_stale(self, stale_after: float) -> List[str]:
+        return self._requeue(keys=[self._running, self._queue], args=[time.time() - stale_after, f"{self.prefix}:"])
+
+    def stats(self) -> dict:
+        return {
+            "backend": "redis",
+            "queued": self.redis.llen(self._queue),
+            "running": self.redis.zcard(self._running),
+        }
+
+
+# Singleton
+_job_store_instance = None
+
+
+def job_store_singleton():
+    """Get or create the job store configured by JOBS_BACKEND"""
+    global _job_store_instance
+    if _job_store_instance is None:
+        if JOBS_BACKEND == "redis":
+            _job_store_instance = RedisJobStore()
+        elif JOBS_BACKEND == "sqlite":
+            _job_store_instance = SQLiteJobStore()
+        else:
+            raise ValueError(f"Unknown jobs backend: {JOBS_BACKEND}")
+    return _job_store_instance
@@ -0,0 +1,257 @@
+# app/pipeline/jobs.py
+"""
+Background batch jobs: submit a batch, get a job id, poll or subscribe to its
+progress, cancel it.
+
+Workers claim jobs from the job store (see job_store.py), run them through the
+streaming batch pipeline and checkpoint every image once its chunk is committed.
+A job whose worker dies is requeued after JOBS_STALE_AFTER seconds without a
+heartbeat and resumes with the images that are still pending.
+
+The API runs JOBS_INLINE_WORKERS workers itself; more can run as separate processes:
+    python -m app.pipeline.jobs worker [--concurrency 2] [--drain]
+"""
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import time
+import uuid
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+
+from app.db.ingest import get_or_create_session
+from app.db.models import Image
+from app.db.session import get_db_session
+from app.pipeline.batch_processor import (
+    IMPORT_ROOT, BatchSummary, batch_processor_singleton, check_import_paths, expand_image_paths
+)
+from app.pipeline.job_store import CANCEL, LOST, RUN, public_job, job_store_singleton
+from app.utils.cache import publish_message
+
+JOBS_INLINE_WORKERS = int(os.getenv("JOBS_INLINE_WORKERS", "1"))
+JOBS_POLL_INTERVAL = float(os.getenv("JOBS_POLL_INTERVAL", "1"))
+JOBS_HEARTBEAT_INTERVAL = float(os.getenv("JOBS_HEARTBEAT_INTERVAL", "10"))
+JOBS_STALE_AFTER = float(os.getenv("JOBS_STALE_AFTER", "60"))
+# Finished images recorded per checkpoint write
+JOBS_CHECKPOINT_SIZE = int(os.getenv("JOBS_CHECKPOINT_SIZE", "100"))
+
+
+def submit_job(project_id: str, image_paths: List[str], session_id: Optional[str] = None,
+               location: Optional[str] = None) -> dict:
+    """
+    Queue a job over image files/directories on the server (blocking).
+    ValueError if a path is outside IMPORT_ROOT.
+    """
+    session_id = get_or_create_session(project_id, session_id, location)
+    check_import_paths(image_paths)
+    paths = list(dict.fromkeys(expand_image_paths(image_paths, IMPORT_ROOT)))
+    job = job_store_singleton().create(str(uuid.uuid4()), project_id, session_id, paths)
+    _publish(job)
+    return public_job(job)
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    job = job_store_singleton().get(job_id)
+    return public_job(job) if job else None
+
+
+def list_jobs(project_id: str, limit: int = 50) -> List[dict]:
+    return [public_job(job) for job in job_store_singleton().list_jobs(project_id, limit)]
+
+
+def cancel_job(job_id: str) -> Optional[dict]:
+    job = job_store_singleton().cancel(job_id)
+    if job is None:
+        return None
+    _publish(job)
+    return public_job(job)
+
+
+def stored_records(session_id: str, paths: List[str], since: float) -> List[dict]:
+    """
+    Images of a resumed job already stored in its session (committed after its last checkpoint).
+    Only images written since the job first started count: the session may hold other batches.
+    """
+    wanted = set(paths)
+    with get_db_session() as db:
+        rows = db.execute(
+            select(Image.id, Image.file_path, Image.has_animal, Image.species_detected)
+            .where(Image.session_id == session_id, Image.created_at >= datetime.utcfromtimestamp(since))
+        )
+        return [
+            {
+                "file_path": file_path,
+                "result": {
+                    "status": "animal_detected" if has_animal else "no_animal_detected",
+                    "detections": (species_detected or {}).get("detections", []),
+                },
+                "image_id": image_id,
+            }
+            for image_id, file_path, has_animal, species_detected in rows
+            if file_path in wanted
+        ]
+
+
+def _publish(job: dict, progress: bool = False):
+    # Progress updates are rate limited per job, status changes always go out
+    publish_message(f"project:{job['project_id']}", {"type": "job_progress", **public_job(job)},
+                    throttle_key=f"job:{job['id']}" if progress else None)
+
+
+def _report(store, job_id: str, progress: bool = False):
+    job = store.get(job_id)
+    if job:
+        _publish(job, progress)
+
+
+class JobWorker:
+    """Claims queued jobs and runs them one at a time"""
+
+    def __init__(self, store=None, worker_id: Optional[str] = None):
+        self.store = store or job_store_singleton()
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self.processor = batch_processor_singleton()
+
+    async def run(self, stop: Optional[asyncio.Event] = None, drain: bool = False):
+        """Claim and run jobs until stop is set (with drain, until the queue is empty)"""
+        stop = stop or asyncio.Event()
+        while not stop.is_set():
+            requeued = await run_in_threadpool(self.store.requeue_stale, JOBS_STALE_AFTER)
+            if requeued:
+                print(f"Requeued jobs of unresponsive workers: {', '.join(requeued)}")
+
+            job = await run_in_threadpool(self.store.claim, self.worker_id)
+            if job is None:
+                if drain:
+                    return
+                try:
+                    await asyncio.wait_for(stop.wait(), JOBS_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self.run_job(job)
+
+    async def run_job(self, job: dict) -> str:
+        """Run a claimed job to completion, cancellation or failure; returns the final status"""
+        job_id = job["id"]
+        print(f"Job {job_id}: attempt {job['attempts']} on {self.worker_id}")
+        consumer = asyncio.create_task(self._consume(job))
+        control, error = RUN, None
+        try:
+            while control == RUN:
+                done, _ = await asyncio.wait({consumer}, timeout=JOBS_HEARTBEAT_INTERVAL)
+                if done:
+                    control = consumer.result()
+                    break
+                control = await run_in_threadpool(self.store.heartbeat, job_id, self.worker_id)
+        except asyncio.CancelledError:
+            # Worker shutting down: hand the job back, it resumes from its last checkpoint
+            consumer.cancel()
+            await asyncio.gather(consumer, return_exceptions=True)
+            await run_in_threadpool(self.store.release, job_id, self.worker_id)
+            raise
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+
+        consumer.cancel()
+        await asyncio.gather(consumer, return_exceptions=True)
+        if control == LOST:
+            print(f"Job {job_id}: taken over by another worker, stopping")
+            return LOST
+
+        status = "failed" if error else "cancelled" if control == CANCEL else "completed"
+        await run_in_threadpool(self.store.finish, job_id, self.worker_id, status, error)
+        await run_in_threadpool(_report, self.store, job_id)
+        print(f"Job {job_id}: {status}" + (f" ({error})" if error else ""))
+        return status
+
+    async def _consume(self, job: dict) -> str:
+        """Stream the job's pending images through the pipeline, checkpointing committed results"""
+        job_id, project_id, session_id = job["id"], job["project_id"], job["session_id"]
+        paths = await run_in_threadpool(self.store.pending_paths, job_id)
+        summary = BatchSummary(project_id, session_id, job["total"], previous=job["summary"])
+
+        done, failed = [], []
+        if job["attempts"] > 1:
+            # Stored by an earlier attempt after its last checkpoint: don't store them twice
+            stored = await run_in_threadpool(stored_records, session_id, paths, job["started_at"])
+            for record in stored:
+                summary.add(record)
+                done.append(record["file_path"])
+            finished = set(done)
+            paths = [path for path in paths if path not in finished]
+
+        control = RUN
+        stream = self.processor.stream_batch(paths, project_id, session_id, endpoint="jobs")
+        try:
+            async for record in stream:
+                summary.add(record)
+                (done if record["image_id"] else failed).append(record["file_path"])
+                if len(done) + len(failed) >= JOBS_CHECKPOINT_SIZE:
+                    control = await self._checkpoint(job_id, done, failed, summary)
+                    done, failed = [], []
+                    if control != RUN:
+                        break
+        finally:
+            await stream.aclose()
+            if control != LOST:
+                control = await self._checkpoint(job_id, done, failed, summary)
+        return control
+
+    async def _checkpoint(self, job_id: str, done: List[str], failed: List[str], summary: BatchSummary) -> str:
+        control = await run_in_threadpool(
+            self.store.checkpoint, job_id, self.worker_id, done, failed, summary.as_dict()
+        )
+        await run_in_threadpool(_report, self.store, job_id, True)
+        return control
+
+
+_inline_workers: List[asyncio.Task] = []
+
+
+def start_inline_workers(count: int = JOBS_INLINE_WORKERS):
+    """Run job workers inside the API process (call from the event loop)"""
+    for _ in range(count):
+        _inline_workers.append(asyncio.create_task(JobWorker().run()))
+    if count:
+        print(f"Started {count} inline job worker(s)")
+
+
+async def stop_inline_workers():
+    """Cancel inline workers; their running jobs go back to the queue"""
+    for task in _inline_workers:
+        task.cancel()
+    await asyncio.gather(*_inline_workers, return_exceptions=True)
+    _inline_workers.clear()
+
+
+async def _run_workers(concurrency: int, drain: bool):
+    workers = [asyncio.create_task(JobWorker().run(drain=drain)) for _ in range(concurrency)]
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, lambda: [task.cancel() for task in workers])
+    await asyncio.gather(*workers, return_exceptions=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run background batch job workers")
+    parser.add_argument("command", choices=["worker"])
+    parser.add_argument("--concurrency", type=int, default=1, help="Jobs run at the same time by this process")
+    parser.add_argument("--drain", action="store_true", help="Exit once the queue is empty")
+    args = parser.parse_args()
+
+    from app.db.session import create_tables
+
+    create_tables()
+    start = time.time()
+    asyncio.run(_run_workers(args.concurrency, args.drain))
+    print(f"Worker stopped after {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# app/pipeline/micro_batcher.py
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, List
+
+from app.pipeline.executor import InferenceQueueFull
+
+MICRO_BATCH_SIZE = int(os.getenv("MICRO_BATCH_SIZE", "16"))
+MICRO_BATCH_WAIT_MS = float(os.getenv("MICRO_BATCH_WAIT_MS", "20"))
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-image requests into batches.
+    A batch is dispatched once it holds max_batch_size items or the oldest item
+    has waited max_wait_ms, whichever comes first. Each caller gets back its own result.
+    """
+
+    def __init__(self, run_batch: Callable[..., Awaitable[List[Any]]],
+                 max_batch_size: int = MICRO_BATCH_SIZE, max_wait_ms: float = MICRO_BATCH_WAIT_MS,
+                 max_pending: int = 512):
+        # run_batch(items, wait=...) -> one result per item
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self.max_pending = max_pending
+
+        self._queue: asyncio.Queue | None = None
+        self._collector: asyncio.Task | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        # Dispatched batches, referenced until done so they can't be garbage collected
+        self._tasks: set = set()
+        # Items submitted whose result has not been delivered yet
+        self._pending = 0
+
+        self._batches = 0
+        self._items = 0
+        self._rejected = 0
+
+    @property
+    def full(self) -> bool:
+        """New items submitted without wait would be rejected"""
+        return self._pending >= self.max_pending
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._collector is None or self._collector.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._collector = loop.create_task(self._collect())
+
+    async def submit(self, item: Any, wait: bool = False) -> Any:
+        """
+        Queue one item and wait for its result. With wait=False the item may fail with
+        InferenceQueueFull (here or when its batch reaches a saturated executor).
+        """
+        if self.full and not wait:
+            self._rejected += 1
+            raise InferenceQueueFull()
+
+        self._ensure_started()
+        future = self._loop.create_future()
+        self._pending += 1
+        try:
+            self._queue.put_nowait((item, future, wait))
+            return await future
+        finally:
+            self._pending -= 1
+
+    async def _collect(self):
+        """Form batches from the queue and hand them off without waiting for completion"""
+        while True:
+            batch = []
+            try:
+                batch.append(await self._queue.get())
+                deadline = self._loop.time() + self.max_wait
+
+                while len(batch) < self.max_batch_size:
+                    # Take whatever is already queued before considering the timer
+                    if not self._queue.empty():
+                        batch.append(self._queue.get_nowait())
+                        continue
+                    timeout = deadline - self._loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+            except BaseException:
+                # Stopped (close) while forming a batch: its callers must not wait forever
+                _cancel(batch)
+                raise
+
+            # Callers that gave up while queued don't need a forward pass
+            batch = [entry for entry in batch if not entry[1].done()]
+            if batch:
+                task = self._loop.create_task(self._dispatch(batch))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self, batch: list):
+        self._batches += 1
+        self._items += len(batch)
+        try:
+            await self._run(batch)
+        finally:
+            # Cancelled (or failed in an unexpected way): never leave a caller hanging
+            _cancel(batch)
+
+    async def _run(self, batch: list):
+        """Run batch with executor backpressure only if all of its callers accept it"""
+        try:
+            results = await self.run_batch([item for item, _, _ in batch], wait=all(wait for _, _, wait in batch))
+        except InferenceQueueFull as e:
+            # Callers that asked to wait still get their results, the others the 503
+            waiting = [entry for entry in batch if entry[2]]
+            for _, future, wait in batch:
+                if not wait and not future.done():
+                    future.set_exception(e)
+            if waiting:
+                await self._run(waiting)
+            return
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    def close(self):
+        """Stop collecting and cancel items still queued; items already dispatched still complete"""
+        if self._collector is not None:
+            self._collector.cancel()
+            self._collector = None
+        if self._queue is not None:
+            queued = []
+            while not self._queue.empty():
+                queued.append(self._queue.get_nowait())
+            _cancel(queued)
+
+    def stats(self) -> dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "pending": self._pending,
+            "batches": self._batches,
+            "items": self._items,
+            "avg_batch_size": round(self._items / self._batches, 2) if self._batches else 0.0,
+            "rejected": self._rejected,
+        }
+
+
+def _cancel(batch: list):
+    for _, future, _ in batch:
+        if not future.done():
+            future.cancel()
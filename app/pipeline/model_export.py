@@ -0,0 +1,196 @@
+# app/pipeline/model_export.py
+"""
+Export the YOLO detector/classifier for CPU inference backends.
+
+    python -m app.pipeline.model_export --format onnx
+    python -m app.pipeline.model_export --format onnx --int8 --calibration-dir /data/sample_cards
+    python -m app.pipeline.model_export --format openvino --int8 --calibration-dir /data/sample_cards
+
+Artifacts are written next to the .pt files (see app/pipeline/backends.py) and
+picked up at startup with INFERENCE_BACKEND=onnx|openvino [INFERENCE_INT8=1].
+
+int8 uses static quantization calibrated on real frames from --calibration-dir:
+ONNX Runtime's quantize_static (QDQ, per-channel weights) or NNCF for OpenVINO.
+The post-processing part of the head (box decoding, sigmoid, concat) stays in float,
+where int8 hurts accuracy most for next to no speed-up.
+
+Needs the optional CPU inference packages: pip install -r requirements-cpu.txt
+"""
+import argparse
+import os
+import random
+import re
+import shutil
+from typing import Iterator, List
+
+import cv2
+import numpy as np
+
+from app.pipeline.backends import artifact_path
+from app.pipeline.batch_processor import expand_image_paths
+from app.pipeline.decode import decode_image_bytes
+
+DETECTOR_IMGSZ = 640
+CLASSIFIER_IMGSZ = 224
+
+
+def letterbox(image: np.ndarray, size: int) -> np.ndarray:
+    """Resize keeping aspect ratio and pad to size x size with grey, like the ultralytics predictor"""
+    height, width = image.shape[:2]
+    ratio = min(size / height, size / width)
+    new_width, new_height = int(round(width * ratio)), int(round(height * ratio))
+    if (new_width, new_height) != (width, height):
+        image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    dw, dh = (size - new_width) / 2, (size - new_height) / 2
+    top, bottom = int(round(dh - 0.1)), int(round(dh + 0.1))
+    left, right = int(round(dw - 0.1)), int(round(dw + 0.1))
+    return cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=(114, 114, 114))
+
+
+def center_crop(image: np.ndarray, size: int) -> np.ndarray:
+    """Square centre crop resized to size, like the ultralytics classification transform"""
+    height, width = image.shape[:2]
+    side = min(height, width)
+    top, left = (height - side) // 2, (width - side) // 2
+    return cv2.resize(image[top:top + side, left:left + side], (size, size), interpolation=cv2.INTER_LINEAR)
+
+
+def to_tensor(image: np.ndarray) -> np.ndarray:
+    """BGR HxWx3 uint8 -> 1x3xHxW float32 RGB in [0, 1]"""
+    return np.ascontiguousarray(image[..., ::-1].transpose(2, 0, 1)[None], dtype=np.float32) / 255.0
+
+
+def calibration_samples(calibration_dir: str, task: str, imgsz: int, count: int, seed: int = 0) -> List[np.ndarray]:
+    """Preprocessed input tensors from a random sample of the images in calibration_dir"""
+    paths = expand_image_paths([calibration_dir])
+    if not paths:
+        raise ValueError(f"No images found in {calibration_dir}")
+    random.Random(seed).shuffle(paths)
+
+    samples = []
+    for path in paths[:count]:
+        with open(path, "rb") as f:
+            image = decode_image_bytes(f.read())
+        samples.append(to_tensor(letterbox(image, imgsz) if task == "detect" else center_crop(image, imgsz)))
+    print(f"Calibrating on {len(samples)} images from {calibration_dir}")
+    return samples
+
+
+def _head_postprocess_nodes(node_names: Iterator[str], node_types: Iterator[str]) -> List[str]:
+    """Names of the non-Conv nodes of the last module (the head) in an ultralytics ONNX graph"""
+    nodes = list(zip(node_names, node_types))
+    indices = [int(m.group(1)) for name, _ in nodes if (m := re.match(r"/model\.(\d+)/", name))]
+    if not indices:
+        return []
+    head = f"/model.{max(indices)}/"
+    return [name for name, op_type in nodes if name.startswith(head) and op_type != "Conv"]
+
+
+def quantize_onnx(model_path: str, output_path: str, samples: List[np.ndarray]) -> str:
+    """Static int8 quantization with ONNX Runtime"""
+    import onnx
+    from onnxruntime.quantization import (
+        CalibrationDataReader, CalibrationMethod, QuantFormat, QuantType, quantize_static
+    )
+
+    class _Reader(CalibrationDataReader):
+        def __init__(self, input_name: str):
+            self._inputs = iter([{input_name: sample} for sample in samples])
+
+        def get_next(self):
+            return next(self._inputs, None)
+
+    model = onnx.load(model_path)
+    input_name = model.graph.input[0].name
+    excluded = _head_postprocess_nodes((n.name for n in model.graph.node), (n.op_type for n in model.graph.node))
+
+    quantize_static(
+        model_path, output_path, _Reader(input_name),
+        quant_format=QuantFormat.QDQ,
+        per_channel=True,
+        weight_type=QuantType.QInt8,
+        activation_type=QuantType.QUInt8,
+        calibrate_method=CalibrationMethod.MinMax,
+        nodes_to_exclude=excluded,
+    )
+
+    # ultralytics reads names/task/imgsz from the model metadata, keep it
+    quantized = onnx.load(output_path)
+    del quantized.metadata_props[:]
+    quantized.metadata_props.extend(model.metadata_props)
+    onnx.save(quantized, output_path)
+    return output_path
+
+
+def quantize_openvino(model_dir: str, output_dir: str, samples: List[np.ndarray]) -> str:
+    """Static int8 quantization of an OpenVINO IR model with NNCF"""
+    import nncf
+    from openvino.runtime import Core, serialize
+
+    xml_path = next(os.path.join(model_dir, name) for name in os.listdir(model_dir) if name.endswith(".xml"))
+    model = Core().read_model(xml_path)
+    quantized = nncf.quantize(
+        model, nncf.Dataset(samples),
+        preset=nncf.QuantizationPreset.MIXED,
+        # Keep box decoding in float
+        ignored_scope=nncf.IgnoredScope(types=["Multiply", "Subtract", "Sigmoid"]),
+    )
+
+    os.makedirs(output_dir, exist_ok=True)
+    output_xml = os.path.join(output_dir, os.path.basename(xml_path))
+    serialize(quantized, output_xml)
+    shutil.copy(os.path.join(model_dir, "metadata.yaml"), os.path.join(output_dir, "metadata.yaml"))
+    return output_dir
+
+
+def export_model(weights_path: str, task: str, fmt: str, imgsz: int, int8: bool = False,
+                 calibration_dir: str | None = None, calibration_images: int = 200) -> str:
+    """Export weights_path to fmt (onnx|openvino), optionally int8; returns the artifact loaded at startup"""
+    from ultralytics import YOLO
+
+    target = artifact_path(weights_path, fmt)
+    if not os.path.exists(target):
+        # Dynamic batch axis so micro-batches run as one inference call
+        exported = YOLO(weights_path).export(format=fmt, imgsz=imgsz, dynamic=True, half=False)
+        if os.path.abspath(str(exported)) != os.path.abspath(target):
+            shutil.move(str(exported), target)
+    print(f"✅ {weights_path} -> {target}")
+
+    if not int8:
+        return target
+
+    if not calibration_dir:
+        raise ValueError("--int8 needs --calibration-dir with representative camera trap images")
+    samples = calibration_samples(calibration_dir, task, imgsz, calibration_images)
+    int8_target = artifact_path(weights_path, fmt, int8=True)
+    if fmt == "onnx":
+        quantize_onnx(target, int8_target, samples)
+    else:
+        quantize_openvino(target, int8_target, samples)
+    print(f"✅ {weights_path} -> {int8_target} (int8)")
+    return int8_target
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--format", choices=["onnx", "openvino"], required=True)
+    parser.add_argument("--detector", default="models/animal_detector.pt")
+    parser.add_argument("--classifier", default="models/species_classifier.pt")
+    parser.add_argument("--int8", action="store_true", help="Also write a statically quantized int8 model")
+    parser.add_argument("--calibration-dir", help="Folder of representative images for int8 calibration")
+    parser.add_argument("--calibration-images", type=int, default=200)
+    parser.add_argument("--detector-imgsz", type=int, default=DETECTOR_IMGSZ)
+    parser.add_argument("--classifier-imgsz", type=int, default=CLASSIFIER_IMGSZ)
+    args = parser.parse_args()
+
+    for weights_path, task, imgsz in ((args.detector, "detect", args.detector_imgsz),
+                                      (args.classifier, "classify", args.classifier_imgsz)):
+        if not os.path.exists(weights_path):
+            print(f"⚠️ {weights_path} not found, skipping")
+            continue
+        export_model(weights_path, task, args.format, imgsz, int8=args.int8,
+                     calibration_dir=args.calibration_dir, calibration_images=args.calibration_images)
+
+
+if __name__ == "__main__":
+    main()
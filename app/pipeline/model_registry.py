@@ -0,0 +1,278 @@
+# app/pipeline/model_registry.py
+"""
+Versioned models and zero-downtime switching between them.
+
+The registry (MODEL_REGISTRY_PATH, a JSON file next to the weights) lists every
+version with its detector/classifier paths, backend and checksums, plus the
+active version. ModelManager serves the active version and can activate another
+one in the background: load it (checksums verified), warm it up, switch new
+requests over atomically and release the old one once its in-flight requests
+have finished. Nothing else is reset, so the API and result caches stay warm.
+
+Every process watches the registry file, so activating a version in one
+process (or on one node of a shared volume) reaches all of them within
+MODEL_REGISTRY_POLL seconds.
+"""
+import asyncio
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.pipeline.backends import INFERENCE_BACKEND, INFERENCE_INT8, BACKENDS, artifact_path, resolve_model_path
+from app.pipeline.image_processor import ImageProcessor
+from app.pipeline.result_cache import path_digest
+
+MODEL_REGISTRY_PATH = os.getenv("MODEL_REGISTRY_PATH", "models/registry.json")
+DETECTOR_PATH = os.getenv("DETECTOR_PATH", "models/animal_detector.pt")
+CLASSIFIER_PATH = os.getenv("CLASSIFIER_PATH", "models/species_classifier.pt")
+# Max wait for requests still running on a replaced version before it is released
+MODEL_DRAIN_TIMEOUT = float(os.getenv("MODEL_DRAIN_TIMEOUT", "300"))
+MODEL_REGISTRY_POLL = float(os.getenv("MODEL_REGISTRY_POLL", "10"))
+# Registered weights must live under this directory (they are unpickled when loaded)
+MODELS_DIR = os.getenv("MODELS_DIR", "models")
+
+# Version used when nothing has been registered: the configured paths
+DEFAULT_VERSION = "default"
+
+
+class ModelVersionNotFound(Exception):
+    pass
+
+
+class ModelChecksumMismatch(Exception):
+    pass
+
+
+def check_model_path(path: str, models_dir: str = MODELS_DIR):
+    """ValueError unless path (symlinks resolved) is inside models_dir"""
+    root = os.path.realpath(models_dir)
+    if os.path.commonpath([root, os.path.realpath(path)]) != root:
+        raise ValueError(f"Model files must be inside {models_dir}: {path}")
+
+
+def _checksums(detector: str, classifier: Optional[str], backend: str, int8: bool) -> dict:
+    """Digests of the artifacts that will actually be loaded"""
+    checksums = {"detector": path_digest(resolve_model_path(detector, backend, int8)[0])}
+    if classifier and os.path.exists(classifier):
+        checksums["classifier"] = path_digest(resolve_model_path(classifier, backend, int8)[0])
+    return checksums
+
+
+class ModelRegistry:
+    """Model versions recorded in a JSON file"""
+
+    def __init__(self, path: str = MODEL_REGISTRY_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"active": None, "versions": {}}
+
+    def _write(self, data: dict):
+        # Write-then-rename so readers in other processes never see a partial file
+        tmp_path = f"{self.path}.tmp{os.getpid()}"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def mtime(self) -> float:
+        try:
+            return os.path.getmtime(self.path)
+        except OSError:
+            return 0.0
+
+    def versions(self) -> Dict[str, dict]:
+        versions = self._read()["versions"]
+        if DEFAULT_VERSION not in versions:
+            versions = {DEFAULT_VERSION: self.get(DEFAULT_VERSION), **versions}
+        return versions
+
+    def get(self, version: str) -> dict:
+        entry = self._read()["versions"].get(version)
+        if entry is None and version == DEFAULT_VERSION:
+            # Unverified: the configured files, whatever they currently contain
+            entry = {"version": DEFAULT_VERSION, "detector": DETECTOR_PATH, "classifier": CLASSIFIER_PATH,
+                     "backend": INFERENCE_BACKEND, "int8": INFERENCE_INT8, "checksums": None}
+        if entry is None:
+            raise ModelVersionNotFound(version)
+        return entry
+
+    def register(self, version: str, detector: str, classifier: Optional[str] = None,
+                 backend: str = INFERENCE_BACKEND, int8: bool = INFERENCE_INT8, notes: Optional[str] = None) -> dict:
+        """Record a version and the checksums of its artifacts (blocking: hashes the weights)"""
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown inference backend: {backend}")
+        for path in (detector, classifier):
+            if path:
+                check_model_path(path)
+                check_model_path(artifact_path(path, backend, int8))
+        if not os.path.exists(detector):
+            raise FileNotFoundError(f"Detector not found at {detector}")
+        entry = {
+            "version": version,
+            "detector": detector,
+            "classifier": classifier,
+            "backend": backend,
+            "int8": int8,
+            "checksums": _checksums(detector, classifier, backend, int8),
+            "notes": notes,
+            "registered_at": datetime.utcnow().isoformat(),
+        }
+        with self._lock:
+            data = self._read()
+            if version in data["versions"]:
+                raise ValueError(f"Model version {version} is already registered")
+            data["versions"][version] = entry
+            self._write(data)
+        return entry
+
+    def active_version(self) -> str:
+        return self._read().get("active") or DEFAULT_VERSION
+
+    def set_active(self, version: str):
+        with self._lock:
+            data = self._read()
+            data["active"] = version
+            self._write(data)
+
+
+class ModelManager:
+    """Serves the active model version and hot-swaps to another one"""
+
+    def __init__(self, registry: Optional[ModelRegistry] = None):
+        self.registry = registry or ModelRegistry()
+        self._active: Optional[ImageProcessor] = None
+        self._load_lock = threading.Lock()
+        self._swap_lock: Optional[asyncio.Lock] = None
+        self._activation: Optional[asyncio.Task] = None
+        # version -> {"state": cold|loading|warming|warm|active|draining|failed, ...}
+        self._states: Dict[str, dict] = {}
+
+    @property
+    def active(self) -> ImageProcessor:
+        """Processor for new requests (the registry's active version is loaded on first use)"""
+        if self._active is None:
+            with self._load_lock:
+                if self._active is None:
+                    version = self.registry.active_version()
+                    processor = self._load(version)
+                    self._warm(processor)
+                    self._set_state(version, "active")
+                    self._active = processor
+        return self._active
+
+    def _set_state(self, version: str, state: str, **details):
+        self._states[version] = {**self._states.get(version, {}), "state": state, **details}
+
+    def _load(self, version: str) -> ImageProcessor:
+        """Load a version's models, refusing files that don't match the registered checksums"""
+        self._set_state(version, "loading", error=None)
+        try:
+            entry = self.registry.get(version)
+            if entry.get("checksums"):
+                actual = _checksums(entry["detector"], entry.get("classifier"), entry["backend"], entry["int8"])
+                if actual != entry["checksums"]:
+                    raise ModelChecksumMismatch(f"Model files of version {version} changed since registration")
+            start = time.perf_counter()
+            processor = ImageProcessor(entry["detector"], entry.get("classifier") or "",
+                                       version=version, backend=entry["backend"], int8=entry["int8"])
+            self._set_state(version, "warming", load_seconds=round(time.perf_counter() - start, 3))
+            return processor
+        except Exception as e:
+            self._set_state(version, "failed", error=str(e))
+            raise
+
+    def _warm(self, processor: ImageProcessor):
+        seconds = processor.warmup()
+        self._set_state(processor.version, "warm", warmup_seconds=round(seconds, 3))
+
+    async def activate(self, version: str) -> dict:
+        """Load and warm version, then switch traffic to it and drain the previous one"""
+        if self._swap_lock is None:
+            self._swap_lock = asyncio.Lock()
+        async with self._swap_lock:
+            current = self._active
+            if current is not None and current.version == version:
+                return self.status()
+
+            processor = await run_in_threadpool(self._load, version)
+            try:
+                await run_in_threadpool(self._warm, processor)
+                await processor.warm_workers()
+            except Exception as e:
+                self._set_state(version, "failed", error=f"Warm-up failed: {e}")
+                raise
+
+            # Atomic switch: requests that start from now on get the new version
+            self._active = processor
+            self._set_state(version, "active", activated_at=datetime.utcnow().isoformat())
+            if self.registry.active_version() != version:
+                await run_in_threadpool(self.registry.set_active, version)
+            print(f"Model version {version} active")
+
+            if current is not None:
+                self._set_state(current.version, "draining")
+                drained = await current.drain(MODEL_DRAIN_TIMEOUT)
+                if not drained:
+                    print(f"Model version {current.version} released with {current.in_flight} requests in flight")
+                current.close()
+                self._set_state(current.version, "cold")
+        return self.status()
+
+    def start_activation(self, version: str) -> dict:
+        """Activate version in the background (call from the event loop)"""
+        self.registry.get(version)  # raises ModelVersionNotFound
+        if self._activation is not None and not self._activation.done():
+            raise RuntimeError("Another model version is being activated")
+        self._activation = asyncio.create_task(self._activate_logged(version))
+        return self.status()
+
+    async def _activate_logged(self, version: str):
+        try:
+            await self.activate(version)
+        except Exception as e:
+            print(f"Activating model version {version} failed: {e}")
+
+    async def watch_registry(self, interval: float = MODEL_REGISTRY_POLL):
+        """Follow active-version changes made by other processes or nodes"""
+        last_mtime = self.registry.mtime()
+        while True:
+            await asyncio.sleep(interval)
+            mtime = self.registry.mtime()
+            if mtime == last_mtime:
+                continue
+            last_mtime = mtime
+            version = self.registry.active_version()
+            if self._active is not None and self._active.version != version:
+                await self._activate_logged(version)
+
+    def status(self) -> dict:
+        active = self._active.version if self._active is not None else None
+        versions = []
+        for version, entry in self.registry.versions().items():
+            state = dict(self._states.get(version, {"state": "cold"}))
+            if version == active:
+                state["in_flight"] = self._active.in_flight
+            versions.append({**entry, **state})
+        return {"active": active, "versions": versions}
+
+
+# Singleton
+_model_manager_instance = None
+
+
+def model_manager_singleton() -> ModelManager:
+    """Get or create the model manager singleton"""
+    global _model_manager_instance
+    if _model_manager_instance is None:
+        _model_manager_instance = ModelManager()
+    return _model_manager_instance
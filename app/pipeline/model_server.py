@@ -0,0 +1,353 @@
+# app/pipeline/model_server.py
+"""
+Per-node model server: one process holds the models, API workers send it inference
+over a local Unix socket instead of each loading their own copy of the weights and
+the torch runtime.
+
+    python -m app.pipeline.model_server [--socket /tmp/trailguard-models.sock]
+    INFERENCE_SERVER_SOCKET=/tmp/trailguard-models.sock uvicorn app.main:app --workers 4
+
+Requests from all workers share the server's micro-batcher and inference executor,
+so batches fill up across workers too. Model versions are managed in the server
+(GET/POST /api/models are forwarded to it).
+
+Frames are length-prefixed pickles (protocol 5, so image arrays are written
+without extra copies); the socket is created 0600 and only local processes of
+the same user can connect.
+"""
+import argparse
+import asyncio
+import builtins
+import itertools
+import os
+import pickle
+import signal
+import struct
+import time
+import uuid
+from typing import List, Optional, Tuple
+
+from app.pipeline.executor import InferenceQueueFull
+from app.pipeline.image_processor import ImageProcessor
+from app.pipeline.result_cache import ResultCache, content_digest, file_digest, result_cache_singleton
+from app.utils.metrics import set_queue_wait
+
+# Set in API workers to use the model server instead of loading models in-process
+INFERENCE_SERVER_SOCKET = os.getenv("INFERENCE_SERVER_SOCKET")
+DEFAULT_SOCKET = "/tmp/trailguard-models.sock"
+
+_HEADER = struct.Struct("!Q")
+
+
+class ModelServerError(Exception):
+    """An error raised inside the model server"""
+
+
+def _write_frame(writer: asyncio.StreamWriter, message):
+    data = pickle.dumps(message, protocol=5)
+    writer.write(_HEADER.pack(len(data)))
+    writer.write(data)
+
+
+async def _read_frame(reader: asyncio.StreamReader):
+    (size,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    return pickle.loads(await reader.readexactly(size))
+
+
+def _encode_error(e: Exception) -> tuple:
+    if isinstance(e, InferenceQueueFull):
+        return ("queue_full", e.retry_after)
+    return (type(e).__name__, str(e))
+
+
+def _decode_error(error: tuple) -> Exception:
+    kind, detail = error
+    if kind == "queue_full":
+        return InferenceQueueFull(retry_after=detail)
+    if kind == "ModelVersionNotFound":
+        from app.pipeline.model_registry import ModelVersionNotFound
+        return ModelVersionNotFound(detail)
+    builtin = getattr(builtins, kind, None)
+    if isinstance(builtin, type) and issubclass(builtin, Exception):
+        return builtin(detail)
+    return ModelServerError(f"{kind}: {detail}")
+
+
+class ModelServer:
+    """Serves inference requests for the active model version"""
+
+    def __init__(self, path: str = DEFAULT_SOCKET):
+        from app.pipeline.model_registry import model_manager_singleton
+
+        self.path = path
+        self.manager = model_manager_singleton()
+        self.connections = 0
+        self.requests = 0
+
+    def info(self) -> dict:
+        processor = self.manager.active
+        return {
+            "version": processor.version,
+            "backend": processor.backend,
+            "fingerprint": processor.model_fingerprint,
+            "pid": os.getpid(),
+        }
+
+    async def _call(self, op: str, args: tuple):
+        processor = self.manager.active
+        if op == "process":
+            image, wait = args
+            return await processor.process_image(image, wait=wait)
+        if op == "detect":
+            return await processor.detect_images(*args)
+        if op == "classify":
+            return await processor.classify_detections(*args)
+        if op == "stats":
+            stats = await processor.queue_stats()
+            return {**stats, "server": {"pid": os.getpid(), "connections": self.connections, "requests": self.requests}}
+        if op == "models_status":
+            return self.manager.status()
+        if op == "activate":
+            return self.manager.start_activation(*args)
+        if op == "info":
+            return self.info()
+        raise ValueError(f"Unknown model server operation: {op}")
+
+    def _safe_info(self) -> dict:
+        """info() for replies; the active processor may itself fail to load (e.g. a failed activation)"""
+        try:
+            return self.info()
+        except Exception as e:
+            return {"error": f"{type(e).__name__}: {e}", "pid": os.getpid()}
+
+    async def _handle_request(self, writer: asyncio.StreamWriter, request_id: int, op: str, args: tuple):
+        self.requests += 1
+        try:
+            reply = (request_id, True, await self._call(op, args))
+        except Exception as e:
+            reply = (request_id, False, _encode_error(e))
+        # Every request gets a reply, or the client's call would never return
+        info = self._safe_info()
+        if not writer.is_closing():
+            try:
+                _write_frame(writer, (*reply, info))
+            except Exception as e:
+                # e.g. a result that can't be pickled; nothing was written yet
+                _write_frame(writer, (request_id, False, _encode_error(e), info))
+            await writer.drain()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        tasks = set()
+        try:
+            while True:
+                request_id, op, args = await _read_frame(reader)
+                # Requests on one connection run concurrently, replies carry their id
+                task = asyncio.create_task(self._handle_request(writer, request_id, op, args))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            # Client went away, or the server is shutting down
+            pass
+        finally:
+            self.connections -= 1
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def serve(self):
+        from fastapi.concurrency import run_in_threadpool
+
+        # Load and warm up before accepting connections
+        start = time.perf_counter()
+        processor = await run_in_threadpool(lambda: self.manager.active)
+        await processor.warm_workers()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        # Created 0600 from the start: a chmod after bind would leave a window where others can connect
+        umask = os.umask(0o177)
+        try:
+            server = await asyncio.start_unix_server(self._handle_connection, path=self.path)
+        finally:
+            os.umask(umask)
+        watcher = asyncio.create_task(self.manager.watch_registry())
+        print(f"Model server ({processor.version}) listening on {self.path}, "
+              f"ready after {time.perf_counter() - start:.1f}s")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            watcher.cancel()
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+
+class ModelServerClient:
+    """One multiplexed connection per event loop; reconnects after the server restarts"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.info: dict = {}
+        self._ids = itertools.count()
+        self._pending = {}
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._connecting: Optional[asyncio.Lock] = None
+
+    async def _connect(self) -> asyncio.StreamWriter:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._writer, self._connecting = loop, None, asyncio.Lock()
+        async with self._connecting:
+            if self._writer is None or self._writer.is_closing():
+                reader, self._writer = await asyncio.open_unix_connection(self.path)
+                loop.create_task(self._read_replies(reader, self._writer))
+        return self._writer
+
+    async def _read_replies(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_id, ok, payload, self.info = await _read_frame(reader)
+                future = self._pending.pop(request_id, None)
+                if future is not None and not future.done():
+                    if ok:
+                        future.set_result(payload)
+                    else:
+                        future.set_exception(_decode_error(payload))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+            if self._writer is writer:
+                self._writer = None
+            pending, self._pending = self._pending, {}
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(ConnectionError("Lost connection to the model server"))
+
+    async def call(self, op: str, *args):
+        writer = await self._connect()
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            _write_frame(writer, (request_id, op, args))
+            await writer.drain()
+            return await future
+        finally:
+            self._pending.pop(request_id, None)
+
+
+class RemoteImageProcessor:
+    """
+    ImageProcessor stand-in for API workers: same async interface, inference runs in
+    the model server. Results are still cached in this process.
+    """
+
+    _error_result = staticmethod(ImageProcessor._error_result)
+    drain = ImageProcessor.drain
+
+    # Requests are micro-batched in the server, across all workers
+    batcher = None
+
+    def __init__(self, path: str):
+        self.client = ModelServerClient(path)
+        self.result_cache = result_cache_singleton()
+        # Until the server has answered, nothing may match a cached result
+        self._unknown_fingerprint = uuid.uuid4().hex
+        self.in_flight = 0
+
+    @property
+    def model_fingerprint(self) -> str:
+        return self.client.info.get("fingerprint") or self._unknown_fingerprint
+
+    @property
+    def version(self) -> Optional[str]:
+        return self.client.info.get("version")
+
+    @property
+    def backend(self) -> Optional[str]:
+        return self.client.info.get("backend")
+
+    async def process_image(self, image, wait: bool = False, image_bytes: bytes | None = None) -> dict:
+        self.in_flight += 1
+        try:
+            cache_key = None
+            if image_bytes is not None:
+                cache_key = ResultCache.make_key(self.model_fingerprint, await asyncio.to_thread(content_digest, image_bytes))
+            elif isinstance(image, str) and os.path.exists(image):
+                cache_key = ResultCache.make_key(self.model_fingerprint, await asyncio.to_thread(file_digest, image))
+            if cache_key is not None:
+                cached = await self.result_cache.get_async(cache_key)
+                if cached is not None:
+                    return cached
+
+            start = time.perf_counter()
+            result = await self.client.call("process", image, wait)
+            # Includes the server's own queueing and the round trip
+            set_queue_wait(result, time.perf_counter() - start)
+            if cache_key is not None and result.get("status") != "error":
+                self.result_cache.put(cache_key, result)
+            return result
+        finally:
+            self.in_flight -= 1
+
+    async def detect_images(self, images: List) -> List[Tuple[dict, list]]:
+        self.in_flight += 1
+        try:
+            return await self.client.call("detect", images)
+        finally:
+            self.in_flight -= 1
+
+    async def classify_detections(self, detected: List[Tuple[dict, list]]) -> List[dict]:
+        if not any(crops for _, crops in detected):
+            return [image_result for image_result, _ in detected]
+        self.in_flight += 1
+        try:
+            return await self.client.call("classify", detected)
+        finally:
+            self.in_flight -= 1
+
+    async def warm_workers(self):
+        """The model server warms its models before it accepts connections"""
+
+    def close(self):
+        """Nothing to stop here, the server owns the models and the micro-batcher"""
+
+    async def queue_stats(self) -> dict:
+        stats = await self.client.call("stats")
+        stats["worker_result_cache"] = self.result_cache.stats()
+        return stats
+
+
+# Singleton
+_remote_processor_instance = None
+
+
+def remote_processor_singleton() -> RemoteImageProcessor:
+    global _remote_processor_instance
+    if _remote_processor_instance is None:
+        _remote_processor_instance = RemoteImageProcessor(INFERENCE_SERVER_SOCKET)
+    return _remote_processor_instance
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the detection models to the API workers of this node")
+    parser.add_argument("--socket", default=INFERENCE_SERVER_SOCKET or DEFAULT_SOCKET)
+    args = parser.parse_args()
+
+    async def run():
+        task = asyncio.create_task(ModelServer(args.socket).serve())
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, task.cancel)
+        try:
+            await task
+        except asyncio.CancelledError:
+            print("Model server stopped")
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# app/pipeline/prefilter.py
+"""
+Empty-frame prefilter for batch imports.
+
+Camera traps shoot bursts, and most of them are triggered by wind or light changes.
+Frames are grouped into bursts (same folder, EXIF capture times at most
+PREFILTER_BURST_GAP seconds apart) and each frame is compared with the burst's
+background (per-pixel median of small grey thumbnails, normalised for brightness):
+
+- frames with a significant change go to the detector as usual
+- the static frames are checked through one of them: if the detector finds nothing
+  there, the other static frames are marked no_animal_detected without inference
+
+An animal that stays put for a whole burst is static too, which is why static frames
+are only skipped after their keyframe came back empty. Frames without a capture time
+and single-frame bursts always go to the detector.
+"""
+import os
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+PREFILTER_ENABLED = os.getenv("PREFILTER_ENABLED", "0").lower() in ("1", "true", "yes")
+PREFILTER_BURST_GAP = float(os.getenv("PREFILTER_BURST_GAP", "10"))
+# Frames held back per burst (decoded frames in memory)
+PREFILTER_MAX_BURST = int(os.getenv("PREFILTER_MAX_BURST", "10"))
+PREFILTER_THUMBNAIL_WIDTH = int(os.getenv("PREFILTER_THUMBNAIL_WIDTH", "128"))
+# Relative brightness change for a thumbnail pixel to count as changed
+PREFILTER_PIXEL_THRESHOLD = float(os.getenv("PREFILTER_PIXEL_THRESHOLD", "0.15"))
+# Fraction of changed pixels above which a frame goes to the detector
+PREFILTER_MIN_CHANGE = float(os.getenv("PREFILTER_MIN_CHANGE", "0.001"))
+
+
+def thumbnail(image: np.ndarray, width: int = PREFILTER_THUMBNAIL_WIDTH) -> np.ndarray:
+    """Small grey float32 version of a BGR frame, divided by its mean brightness"""
+    height = max(1, round(image.shape[0] * width / image.shape[1]))
+    grey = cv2.cvtColor(cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+    grey = grey.astype(np.float32)
+    # Global light changes (clouds, dusk) scale the whole frame
+    return grey / max(float(grey.mean()), 1.0)
+
+
+class BurstGrouper:
+    """Groups consecutive frames into bursts; add() returns the bursts the new frame completed"""
+
+    def __init__(self, gap: float = PREFILTER_BURST_GAP, max_burst: int = PREFILTER_MAX_BURST):
+        self.gap = gap
+        self.max_burst = max_burst
+        self._burst: list = []
+        self._folder = self._start = self._end = None
+
+    def _same_burst(self, folder: str, capture_time: datetime) -> bool:
+        return (bool(self._burst) and len(self._burst) < self.max_burst and folder == self._folder
+                and (self._start - capture_time).total_seconds() <= self.gap
+                and (capture_time - self._end).total_seconds() <= self.gap)
+
+    def add(self, frame, folder: str, capture_time: Optional[datetime]) -> List[list]:
+        if capture_time is not None and self._same_burst(folder, capture_time):
+            self._burst.append(frame)
+            self._start, self._end = min(self._start, capture_time), max(self._end, capture_time)
+            return []
+        completed = self.flush()
+        if capture_time is None:
+            # Can't be placed in a burst: a burst of its own
+            return completed + [[frame]]
+        self._burst = [frame]
+        self._folder, self._start, self._end = folder, capture_time, capture_time
+        return completed
+
+    def flush(self) -> List[list]:
+        burst, self._burst = self._burst, []
+        return [burst] if burst else []
+
+
+def changed_fractions(thumbnails: List[np.ndarray], pixel_threshold: float = PREFILTER_PIXEL_THRESHOLD) -> np.ndarray:
+    """Fraction of pixels of each thumbnail that differ from the burst background"""
+    stack = np.stack(thumbnails)
+    background = np.median(stack, axis=0)
+    return (np.abs(stack - background) > pixel_threshold).mean(axis=(1, 2))
+
+
+def plan_burst(thumbnails: List[np.ndarray], pixel_threshold: float = PREFILTER_PIXEL_THRESHOLD,
+               min_change: float = PREFILTER_MIN_CHANGE) -> Tuple[List[int], List[int]]:
+    """
+    (changed, static) frame indices of a burst. Changed frames need the detector;
+    static[0] is the keyframe, the other static frames follow its result.
+    """
+    if len(thumbnails) < 2 or len({t.shape for t in thumbnails}) > 1:
+        return list(range(len(thumbnails))), []
+    fractions = changed_fractions(thumbnails, pixel_threshold)
+    changed = [i for i, fraction in enumerate(fractions) if fraction > min_change]
+    static = [i for i, fraction in enumerate(fractions) if fraction <= min_change]
+    return changed, static
+
+
+def skipped_result() -> dict:
+    """Result of a frame the prefilter kept away from the detector"""
+    return {"status": "no_animal_detected", "animals_detected": 0, "detections": [], "prefiltered": True}
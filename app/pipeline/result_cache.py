@@ -0,0 +1,225 @@
+# app/pipeline/result_cache.py
+import asyncio
+import hashlib
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "10000"))
+# SQLite file for the on-disk tier, unset keeps the cache in memory only
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH")
+RESULT_CACHE_DISK_SIZE = int(os.getenv("RESULT_CACHE_DISK_SIZE", "1000000"))
+
+_CHUNK_SIZE = 1024 * 1024
+# Max queued results committed to the disk tier in one transaction
+_WRITE_BATCH = 500
+
+
+def content_digest(content: bytes) -> str:
+    """Hash of raw image bytes"""
+    return hashlib.sha256(content).hexdigest()
+
+
+def file_digest(path: str) -> str:
+    """Hash of a file's bytes, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def path_digest(path: str) -> str:
+    """Hash of a model file, or of every file in an exported model directory (e.g. OpenVINO .xml + .bin)"""
+    if not os.path.isdir(path):
+        return file_digest(path)
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(path)):
+        digest.update(file_digest(os.path.join(path, name)).encode())
+    return digest.hexdigest()
+
+
+def model_fingerprint(*weight_paths: Optional[str], **settings) -> str:
+    """
+    Identifies the exact models and settings a result was produced with.
+    Replacing any weights file changes the fingerprint, which invalidates cached results.
+    """
+    digest = hashlib.sha256()
+    for path in weight_paths:
+        digest.update((path_digest(path) if path and os.path.exists(path) else "none").encode())
+    digest.update(json.dumps(settings, sort_keys=True).encode())
+    return digest.hexdigest()[:16]
+
+
+class ResultCache:
+    """
+    Two-tier (in-memory LRU + optional SQLite) cache of inference results.
+
+    Only the in-memory tier is touched on the caller's thread: async callers use
+    get_async(), which looks up the disk tier in a worker thread, and put() hands disk
+    writes to a background writer thread that commits them in batches.
+    """
+
+    def __init__(self, max_entries: int = RESULT_CACHE_SIZE, path: Optional[str] = RESULT_CACHE_PATH,
+                 max_disk_entries: int = RESULT_CACHE_DISK_SIZE):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._db = None
+        # Serialises the SQLite connection between lookups and the writer thread
+        self._db_lock = threading.Lock()
+        self._writes: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, result TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS ix_results_created_at ON results (created_at)")
+            self._db.commit()
+            threading.Thread(target=self._write_loop, name="result-cache-writer", daemon=True).start()
+        self._disk_writes = 0
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(fingerprint: str, digest: str) -> str:
+        return f"{fingerprint}:{digest}"
+
+    def _get_memory(self, key: str) -> Optional[dict]:
+        with self._lock:
+            payload = self._memory.get(key)
+            if payload is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return json.loads(payload)
+            if self._db is None:
+                self.misses += 1
+            return None
+
+    def _get_disk(self, key: str) -> Optional[dict]:
+        with self._db_lock:
+            row = self._db.execute("SELECT result FROM results WHERE key = ?", (key,)).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._remember(key, row[0])
+        return json.loads(row[0])
+
+    def get(self, key: str) -> Optional[dict]:
+        """Blocking lookup (the disk tier included): worker threads and CLI tools"""
+        result = self._get_memory(key)
+        if result is None and self._db is not None:
+            result = self._get_disk(key)
+        return result
+
+    async def get_async(self, key: str) -> Optional[dict]:
+        """get() for the event loop: memory hits inline, the disk tier in a worker thread"""
+        result = self._get_memory(key)
+        if result is None and self._db is not None:
+            result = await asyncio.to_thread(self._get_disk, key)
+        return result
+
+    def put(self, key: str, result: dict):
+        """Never blocks on disk: the SQLite write is queued for the writer thread"""
+        # Stored serialised, so callers never share (and mutate) a cached dict; stage
+        # timings describe the run that produced the result, not the result
+        payload = json.dumps({key: value for key, value in result.items() if key != "timings"})
+        with self._lock:
+            self._remember(key, payload)
+        if self._db is not None:
+            self._writes.put((key, payload, time.time()))
+
+    def _write_loop(self):
+        """Writer thread: everything queued since the last commit goes in one transaction"""
+        while True:
+            batch = [self._writes.get()]
+            while len(batch) < _WRITE_BATCH:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+            rows = [row for row in batch if row is not None]
+            try:
+                if rows:
+                    with self._db_lock:
+                        self._db.executemany(
+                            "INSERT OR REPLACE INTO results (key, result, created_at) VALUES (?, ?, ?)", rows
+                        )
+                        self._db.commit()
+                    previous, self._disk_writes = self._disk_writes, self._disk_writes + len(rows)
+                    if previous // 1000 != self._disk_writes // 1000:
+                        self._trim_disk()
+            except Exception as e:
+                print(f"⚠️ Result cache disk write failed: {e}")
+            finally:
+                for _ in batch:
+                    self._writes.task_done()
+
+    def flush(self):
+        """Wait until queued disk writes are committed"""
+        if self._db is not None:
+            self._writes.join()
+
+    def _remember(self, key: str, payload: str):
+        self._memory[key] = payload
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _trim_disk(self):
+        with self._db_lock:
+            self._db.execute(
+                "DELETE FROM results WHERE key IN ("
+                "SELECT key FROM results ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_disk_entries,)
+            )
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self._db is not None:
+            self.flush()
+            with self._db_lock:
+                self._db.execute("DELETE FROM results")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._memory),
+            "max_entries": self.max_entries,
+            "disk_tier": self._db is not None,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+# Singleton
+_result_cache_instance = None
+
+
+def result_cache_singleton() -> ResultCache:
+    """Get or create the result cache singleton"""
+    global _result_cache_instance
+    if _result_cache_instance is None:
+        _result_cache_instance = ResultCache()
+    return _result_cache_instance
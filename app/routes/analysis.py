@@ -1,22 +1,33 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from typing import List
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import List, Optional
+import asyncio
+import json
 import os
-import uuid
-from PIL import Image
+import time
 
+from app.pipeline.decode import decode_for_detection
 from app.pipeline.image_processor import image_processor_singleton
+from app.pipeline.executor import InferenceQueueFull, inference_executor_singleton
+from app.utils.metrics import merge_timings, metrics_singleton, timed
 
 router = APIRouter()
 
 # Allowed image formats
 ALLOWED_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.webp', '.bmp', '.tiff', '.gif'}
 
+# Files of one /analyze/batch request processed at the same time
+ANALYZE_BATCH_CONCURRENCY = int(os.getenv("ANALYZE_BATCH_CONCURRENCY", "8"))
+
 
 @router.post("/analyze/single")
 async def analyze_single_image(file: UploadFile = File(...)):
     """
     Analyze single image - supports PNG, JPG, JPEG, WEBP, BMP, TIFF
-    Automatically converts to JPG for YOLO processing
+    The upload is decoded in memory, at reduced scale for the detector; full-resolution
+    pixels are only decoded for the crops when an animal was found.
+    data.timings has the per-stage breakdown (seconds, see app/utils/metrics.py)
     """
     # Validate file extension
     file_ext = os.path.splitext(file.filename)[1].lower()
@@ -26,153 +37,170 @@ async def analyze_single_image(file: UploadFile = File(...)):
             detail=f"Invalid file format. Allowed: {', '.join(ALLOWED_EXTENSIONS)}"
         )
     
-    temp_dir = "/tmp"
-    os.makedirs(temp_dir, exist_ok=True)
-    
-    # Generate unique filename with original extension
-    unique_filename = f"{uuid.uuid4()}_{file.filename}"
-    temp_path = os.path.join(temp_dir, unique_filename)
-    
+    timings = {}
     try:
-        # Save uploaded file
-        with open(temp_path, "wb") as buffer:
+        with timed(timings, "read"):
             content = await file.read()
-            buffer.write(content)
         
-        # Convert to JPG if needed (YOLO works best with JPG)
-        processing_path = temp_path
-        if file_ext != '.jpg' and file_ext != '.jpeg':
-            try:
-                img = Image.open(temp_path)
-                # Convert RGBA to RGB (for PNG with transparency)
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    background = Image.new('RGB', img.size, (255, 255, 255))
-                    background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                    img = background
-                elif img.mode != 'RGB':
-                    img = img.convert('RGB')
-                
-                # Save as JPG
-                jpg_filename = f"{uuid.uuid4()}_converted.jpg"
-                processing_path = os.path.join(temp_dir, jpg_filename)
-                img.save(processing_path, 'JPEG', quality=95)
-            except Exception as e:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Failed to process image: {str(e)}"
-                )
+        try:
+            with timed(timings, "decode"):
+                image = await run_in_threadpool(decode_for_detection, content)
+        except Exception as e:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Failed to process image: {str(e)}"
+            )
         
         # Process image with YOLO
         processor = image_processor_singleton()
-        result = await processor.process_image(processing_path)
+        result = await processor.process_image(image, image_bytes=content)
+        result["timings"] = merge_timings(timings, result.get("timings"))
+        
+        # Rendered here so serialization is measured (added after the body is rendered)
+        with timed(timings, "serialize"):
+            response = JSONResponse({
+                "success": True,
+                "data": result,
+                "filename": file.filename,
+                "original_format": file_ext,
+                "file_size": len(content)
+            })
+        metrics_singleton().observe_image(timings, "/api/analyze/single", processor.version, file.filename)
+        return response
+        
+    except (HTTPException, InferenceQueueFull):
+        raise
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+
+async def _analyze_upload(file: UploadFile, processor, wait: bool = False) -> dict:
+    """Validate, decode and analyze one uploaded file with processor, returning its per-file record"""
+    file_ext = os.path.splitext(file.filename)[1].lower()
+    if file_ext not in ALLOWED_EXTENSIONS:
+        return {
+            "filename": file.filename,
+            "success": False,
+            "error": f"Invalid format: {file_ext}"
+        }
+    
+    timings = {}
+    try:
+        with timed(timings, "read"):
+            content = await file.read()
+        with timed(timings, "decode"):
+            image = await run_in_threadpool(decode_for_detection, content)
+        
+        # Process
+        result = await processor.process_image(image, wait=wait, image_bytes=content)
+        result["timings"] = merge_timings(timings, result.get("timings"))
+        metrics_singleton().observe_image(timings, "/api/analyze/batch", processor.version, file.filename)
         
         return {
+            "filename": file.filename,
             "success": True,
             "data": result,
-            "filename": file.filename,
-            "original_format": file_ext,
-            "file_size": len(content)
+            "original_format": file_ext
         }
         
-    except HTTPException:
+    except InferenceQueueFull:
         raise
     except Exception as e:
-        return {"success": False, "error": str(e)}
-    finally:
-        # Cleanup temporary files
-        for path in [temp_path, processing_path]:
-            if path and os.path.exists(path) and path != temp_path:
-                try:
-                    os.remove(path)
-                except Exception:
-                    pass
-        if os.path.exists(temp_path):
-            try:
-                os.remove(temp_path)
-            except Exception:
-                pass
+        return {
+            "filename": file.filename,
+            "success": False,
+            "error": str(e)
+        }
 
 
-@router.post("/analyze/batch")
-async def analyze_batch_images(files: List[UploadFile] = File(...)):
+def _admit_batch(processor):
     """
-    Analyze multiple images - supports all image formats
-    Returns processing results for each image
+    A batch request is admitted (or refused with 503) before any file is processed; once
+    admitted its files wait for inference slots, so none of its results are thrown away
     """
-    results = []
+    executor = inference_executor_singleton()
+    batcher = getattr(processor, "batcher", None)
+    if executor.full or (batcher is not None and batcher.full):
+        raise InferenceQueueFull()
+
+
+async def _iter_batch_results(files: List[UploadFile], processor, wait: bool = False):
+    """
+    Analyze files concurrently (bounded) and yield each record as soon as it is ready.
+    All files go to the same processor: a model swap mid-request doesn't mix versions,
+    and the old version isn't drained before the request is done with it.
+    """
+    semaphore = asyncio.Semaphore(ANALYZE_BATCH_CONCURRENCY)
     
-    for file in files:
-        # Validate format
-        file_ext = os.path.splitext(file.filename)[1].lower()
-        if file_ext not in ALLOWED_EXTENSIONS:
-            results.append({
-                "filename": file.filename,
-                "success": False,
-                "error": f"Invalid format: {file_ext}"
-            })
-            continue
-        
-        temp_dir = "/tmp"
-        os.makedirs(temp_dir, exist_ok=True)
-        
-        unique_filename = f"{uuid.uuid4()}_{file.filename}"
-        temp_path = os.path.join(temp_dir, unique_filename)
-        processing_path = temp_path
-        
-        try:
-            # Save file
-            with open(temp_path, "wb") as buffer:
-                content = await file.read()
-                buffer.write(content)
-            
-            # Convert if needed
-            if file_ext != '.jpg' and file_ext != '.jpeg':
-                img = Image.open(temp_path)
-                if img.mode in ('RGBA', 'LA', 'P'):
-                    background = Image.new('RGB', img.size, (255, 255, 255))
-                    background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-                    img = background
-                elif img.mode != 'RGB':
-                    img = img.convert('RGB')
-                
-                jpg_filename = f"{uuid.uuid4()}_converted.jpg"
-                processing_path = os.path.join(temp_dir, jpg_filename)
-                img.save(processing_path, 'JPEG', quality=95)
-            
-            # Process
-            processor = image_processor_singleton()
-            result = await processor.process_image(processing_path)
-            
-            results.append({
-                "filename": file.filename,
-                "success": True,
-                "data": result,
-                "original_format": file_ext
-            })
-            
-        except Exception as e:
-            results.append({
-                "filename": file.filename,
-                "success": False,
-                "error": str(e)
-            })
-        finally:
-            # Cleanup
-            for path in [temp_path, processing_path]:
-                if path and os.path.exists(path):
-                    try:
-                        os.remove(path)
-                    except Exception:
-                        pass
+    async def run(index: int, file: UploadFile) -> dict:
+        async with semaphore:
+            record = await _analyze_upload(file, processor, wait=wait)
+        return {"index": index, **record}
     
-    # Summary statistics
+    processor.in_flight += 1
+    tasks = [asyncio.create_task(run(index, file)) for index, file in enumerate(files)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+        processor.in_flight -= 1
+
+
+def _batch_summary(results: List[dict]) -> dict:
     total = len(results)
     successful = sum(1 for r in results if r.get("success"))
-    
     return {
         "success": True,
         "total_files": total,
         "processed": successful,
-        "failed": total - successful,
-        "results": results
-    }
\ No newline at end of file
+        "failed": total - successful
+    }
+
+
+@router.post("/analyze/batch")
+async def analyze_batch_images(
+    files: List[UploadFile] = File(...),
+    stream: Optional[str] = Query(None, pattern="^(ndjson|sse)$",
+                                  description="Stream each file's result as it finishes: ndjson or sse")
+):
+    """
+    Analyze multiple images - supports all image formats
+    Returns processing results for each image; with ?stream=ndjson|sse every result is
+    sent as soon as it is ready, followed by a summary record
+    """
+    # One model version for the whole request, even if another one is activated meanwhile
+    processor = image_processor_singleton()
+    _admit_batch(processor)
+    if stream is None:
+        results = [record async for record in _iter_batch_results(files, processor, wait=True)]
+        results.sort(key=lambda r: r.pop("index"))
+        return {**_batch_summary(results), "results": results}
+    
+    async def _events():
+        results = []
+        # Headers went out with the admission, so the stream can't fail with a 503 now
+        async for record in _iter_batch_results(files, processor, wait=True):
+            results.append({"success": record.get("success")})
+            start = time.perf_counter()
+            event = _format_event("result", record, stream)
+            metrics_singleton().observe("serialize", time.perf_counter() - start, "/api/analyze/batch",
+                                        processor.version)
+            yield event
+        yield _format_event("summary", _batch_summary(results), stream)
+    
+    media_type = "application/x-ndjson" if stream == "ndjson" else "text/event-stream"
+    return StreamingResponse(_events(), media_type=media_type, headers={"Cache-Control": "no-cache"})
+
+
+def _format_event(event: str, payload: dict, stream: str) -> str:
+    if stream == "sse":
+        return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+    return json.dumps({"type": event, **payload}) + "\n"
+
+
+@router.get("/analyze/queue")
+async def inference_queue_stats():
+    """Inference executor queue depth, wait times, micro-batching and result cache stats"""
+    return await image_processor_singleton().queue_stats()
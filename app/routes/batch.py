@@ -1,14 +1,37 @@
 # app/routes/batch.py
-from fastapi import APIRouter, UploadFile, File
-from typing import List
-import os
-import uuid
+from fastapi import APIRouter, Body, HTTPException
+from typing import List, Optional
 
-from app.pipeline.batch_processor import batch_processor_singleton  # This should work now
+from app.db.ingest import ProjectNotFound, SessionNotFound
+from app.pipeline.batch_processor import batch_processor_singleton, check_import_paths
 
 router = APIRouter()
 
-@router.post("/analyze/batch")
-async def analyze_batch_images(files: List[UploadFile] = File(...)):
-    # Your batch processing code here
-    pass
\ No newline at end of file
+
+@router.post("/projects/{project_id}/batch")
+async def ingest_batch(
+    project_id: str,
+    image_paths: List[str] = Body(..., description="Image files or directories (e.g. an SD card dump) on the server"),
+    session_id: Optional[str] = None,
+    location: Optional[str] = None
+):
+    """
+    Run the detection pipeline over images already on the server (inside IMPORT_ROOT)
+    and store the results. Creates a new session unless session_id is given.
+    """
+    if not image_paths:
+        raise HTTPException(status_code=400, detail="No image paths given")
+    try:
+        check_import_paths(image_paths)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    processor = batch_processor_singleton()
+    try:
+        summary = await processor.process_batch(image_paths, project_id, session_id=session_id, location=location)
+    except ProjectNotFound:
+        raise HTTPException(status_code=404, detail="Project not found")
+    except SessionNotFound:
+        raise HTTPException(status_code=404, detail="Session not found in this project")
+
+    return {"success": True, **summary}
@@ -0,0 +1,74 @@
+# app/routes/jobs.py
+from fastapi import APIRouter, Body, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Optional
+
+from app.db.ingest import ProjectNotFound, SessionNotFound
+from app.pipeline.batch_processor import check_import_paths
+from app.pipeline.jobs import cancel_job, get_job, list_jobs, submit_job
+
+router = APIRouter()
+
+
+@router.post("/projects/{project_id}/jobs", status_code=202)
+async def create_job(
+    project_id: str,
+    image_paths: List[str] = Body(..., description="Image files or directories (e.g. an SD card dump) on the server"),
+    session_id: Optional[str] = None,
+    location: Optional[str] = None
+):
+    """
+    Queue a background batch job over paths inside IMPORT_ROOT and return its id immediately.
+    Progress: GET /jobs/{job_id}, or job_progress messages on the project websocket.
+    """
+    if not image_paths:
+        raise HTTPException(status_code=400, detail="No image paths given")
+    try:
+        check_import_paths(image_paths)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        job = await run_in_threadpool(submit_job, project_id, image_paths, session_id, location)
+    except ProjectNotFound:
+        raise HTTPException(status_code=404, detail="Project not found")
+    except SessionNotFound:
+        raise HTTPException(status_code=404, detail="Session not found in this project")
+
+    return {"success": True, "task_id": job["job_id"], **job}
+
+
+@router.get("/projects/{project_id}/jobs")
+async def get_project_jobs(project_id: str, limit: int = 50):
+    """Most recent jobs of a project"""
+    return {"jobs": await run_in_threadpool(list_jobs, project_id, min(limit, 500))}
+
+
+@router.get("/projects/{project_id}/status")
+async def get_batch_status(project_id: str, task_id: Optional[str] = None):
+    """Status of a project's job (the latest one unless task_id is given)"""
+    if task_id:
+        job = await run_in_threadpool(get_job, task_id)
+    else:
+        jobs = await run_in_threadpool(list_jobs, project_id, 1)
+        job = jobs[0] if jobs else None
+    if job is None or job["project_id"] != project_id:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    job = await run_in_threadpool(get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.post("/jobs/{job_id}/cancel")
+async def cancel_job_endpoint(job_id: str):
+    """Cancel a job; a running job stops within one heartbeat and keeps what it stored"""
+    job = await run_in_threadpool(cancel_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"success": True, **job}
@@ -0,0 +1,69 @@
+# app/routes/models.py
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.concurrency import run_in_threadpool
+from typing import Optional
+import hmac
+import os
+
+from app.pipeline.backends import INFERENCE_BACKEND, INFERENCE_INT8
+from app.pipeline.model_registry import ModelVersionNotFound, model_manager_singleton
+from app.pipeline.model_server import INFERENCE_SERVER_SOCKET, remote_processor_singleton
+
+router = APIRouter()
+
+# Model administration requires the X-Admin-Token header; without a token it is disabled
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=503, detail="Model administration is disabled (ADMIN_TOKEN is not set)")
+    if x_admin_token is None or not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+
+@router.get("/models")
+async def list_model_versions():
+    """Registered model versions with their state (cold, loading, warming, warm, active, draining, failed)"""
+    if INFERENCE_SERVER_SOCKET:
+        # Models live in the node's model server
+        return await remote_processor_singleton().client.call("models_status")
+    return await run_in_threadpool(model_manager_singleton().status)
+
+
+@router.post("/models", dependencies=[Depends(require_admin)])
+async def register_model_version(
+    version: str,
+    detector: str,
+    classifier: Optional[str] = None,
+    backend: str = INFERENCE_BACKEND,
+    int8: bool = INFERENCE_INT8,
+    notes: Optional[str] = None
+):
+    """Register model files already under MODELS_DIR as a new version (checksums are recorded)"""
+    registry = model_manager_singleton().registry
+    try:
+        entry = await run_in_threadpool(registry.register, version, detector, classifier, backend, int8, notes)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"success": True, "model": entry}
+
+
+@router.post("/models/{version}/activate", status_code=202, dependencies=[Depends(require_admin)])
+async def activate_model_version(version: str):
+    """
+    Load and warm up a version in the background, then switch traffic to it once ready.
+    Requests already running on the previous version finish on it. Poll GET /models for progress.
+    """
+    try:
+        if INFERENCE_SERVER_SOCKET:
+            status = await remote_processor_singleton().client.call("activate", version)
+        else:
+            status = model_manager_singleton().start_activation(version)
+    except ModelVersionNotFound:
+        raise HTTPException(status_code=404, detail="Model version not found")
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"success": True, **status}
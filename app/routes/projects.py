@@ -1,89 +1,221 @@
-from fastapi import APIRouter, Query
-from typing import Dict, List
-from app.db.session import get_db_session
-from app.db.models import Project, Image, Session
-from app.utils.cache import cached_json, invalidate_pattern
-from sqlalchemy import func, case, desc
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import Dict, List, Optional
+from datetime import datetime
+import base64
+import json
+from app.db.export import EXPORT_FORMATS, ExportUnavailable, ProjectExport, check_format
+from app.db.session import get_async_db_session
+from app.db.models import Project, Image, Session, Detection, StatsRollup, SpeciesRollup
+from app.utils.cache import cached_json_async, invalidate_pattern
+from sqlalchemy import desc, func, select, tuple_
 
 router = APIRouter()
 
 
+def _encode_cursor(created_at: datetime, image_id: str) -> str:
+    """Opaque keyset cursor for the (created_at, id) position of the last row on a page"""
+    raw = json.dumps([created_at.isoformat(), image_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, image_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), str(image_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def _not_modified(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """
+    Tag the response with etag, or return the 304 to send instead when the client
+    already has it (If-None-Match, weak comparison as for any GET)
+    """
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if "*" in tags or etag in tags:
+            return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
+
+async def _project_version(project_id: str) -> Optional[int]:
+    """
+    Project.version (None for an unknown project), read fresh on every request: other
+    processes (job workers, other API workers) write without clearing this process' cache
+    """
+    async with get_async_db_session() as db:
+        return await db.scalar(select(func.coalesce(Project.version, 0)).where(Project.id == project_id))
+
+
+async def _projects_version() -> list:
+    """[project count, sum of versions]: changes whenever a project is created or changed (read fresh)"""
+    async with get_async_db_session() as db:
+        row = (await db.execute(
+            select(func.count(Project.id), func.coalesce(func.sum(func.coalesce(Project.version, 0)), 0))
+        )).one()
+        return [row[0], row[1]]
+
+
 @router.get("/projects")
-async def list_projects():
-    """List all projects"""
-    def _load_projects():
-        with get_db_session() as db:
-            projects = db.query(Project).order_by(desc(Project.created_at)).all()
+async def list_projects(
+    request: Request,
+    response: Response,
+    page: Optional[int] = Query(None, ge=1),
+    limit: Optional[int] = Query(None, ge=1, le=500)
+):
+    """
+    List projects, newest first; the total is in the X-Total-Count header.
+    Every project unless page or limit is given (pages of 100 by default then)
+    """
+    paged = page is not None or limit is not None
+    page, limit = page or 1, limit or 100
+    total, version = await _projects_version()
+    not_modified = _not_modified(request, response, f'"projects-{total}-{version}"')
+    if not_modified is not None:
+        return not_modified
+    response.headers["X-Total-Count"] = str(total)
+
+    async def _load_projects():
+        async with get_async_db_session() as db:
+            # One query: the session count is a correlated subquery (ix_sessions_project_start)
+            session_count = (
+                select(func.count(Session.id))
+                .where(Session.project_id == Project.id)
+                .correlate(Project)
+                .scalar_subquery()
+            )
+            query = (
+                select(Project.id, Project.name, Project.description, Project.created_at,
+                       session_count.label("session_count"))
+                .order_by(desc(Project.created_at), desc(Project.id))
+            )
+            if paged:
+                query = query.offset((page - 1) * limit).limit(limit)
+            rows = (await db.execute(query)).all()
             return [
                 {
                     "id": p.id,
                     "name": p.name,
                     "description": p.description,
                     "created_at": p.created_at.isoformat() if p.created_at else None,
-                    "session_count": len(p.sessions)
+                    "session_count": p.session_count
                 }
-                for p in projects
+                for p in rows
             ]
     
-    return cached_json("projects:list", 300, _load_projects)  # Cache for 5 minutes
+    pages = f"page:{page}:limit:{limit}" if paged else "all"
+    cache_key = f"projects:list:v{total}.{version}:{pages}"
+    return await cached_json_async(cache_key, 300, _load_projects)  # Cache for 5 minutes
 
 
 @router.post("/projects")
 async def create_project(name: str, description: str = None):
     """Create a new project"""
-    with get_db_session() as db:
+    async with get_async_db_session() as db:
         project = Project(name=name, description=description)
         db.add(project)
-        db.flush()
-        
-        # Invalidate cache
-        invalidate_pattern("projects:*")
-        
-        return {
+        await db.flush()
+        created = {
             "id": project.id,
             "name": project.name,
             "description": project.description,
             "created_at": project.created_at.isoformat()
         }
+    
+    # Invalidate cache once committed, so the listing can't be cached without the project again
+    invalidate_pattern("projects:*")
+    return created
 
 
 @router.get("/projects/{project_id}/results")
 async def get_project_results(
     project_id: str, 
+    request: Request,
+    response: Response,
     page: int = Query(1, ge=1), 
-    limit: int = Query(50, ge=1, le=100)
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page, replaces page"),
+    species: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
 ):
-    """Get paginated results for a project with caching"""
-    cache_key = f"project:{project_id}:results:page:{page}:limit:{limit}"
+    """
+    Get paginated results for a project with caching, optionally filtered by species / capture time.
+    Pass the returned next_cursor to page by keyset, which stays fast however deep you go.
+    The ETag is the project's version: If-None-Match gets a 304 until the project changes.
+    """
+    position = _decode_cursor(cursor) if cursor else None
+    version = await _project_version(project_id)
+    if version is not None:
+        not_modified = _not_modified(request, response, f'"{project_id}-{version}"')
+        if not_modified is not None:
+            return not_modified
+    page_key = f"cursor:{cursor}" if cursor else f"page:{page}"
+    # Keyed by version too, so a page is never older than the ETag sent with it
+    cache_key = (f"project:{project_id}:results:v{version}:{page_key}:limit:{limit}"
+                 f":species:{species}:start:{start}:end:{end}")
     
-    def _load_results():
-        with get_db_session() as db:
+    async def _load_results():
+        async with get_async_db_session() as db:
             skip = (page - 1) * limit
             
-            # Get images with animals
-            animal_images = db.query(Image).join(Session).filter(
-                Session.project_id == project_id,
+            # Get images with animals, served in order by the (project_id, has_animal, created_at, id) index
+            query = select(Image).where(
+                Image.project_id == project_id,
                 Image.has_animal == True
-            ).order_by(desc(Image.created_at)).offset(skip).limit(limit).all()
+            )
+            
+            if species or start or end:
+                # Served by the (project_id, species, capture_time) index on detections
+                matching = select(Detection.image_id).where(Detection.project_id == project_id)
+                if species:
+                    matching = matching.where(Detection.species == species)
+                if start:
+                    matching = matching.where(Detection.capture_time >= start)
+                if end:
+                    matching = matching.where(Detection.capture_time < end)
+                query = query.where(Image.id.in_(matching))
+            
+            query = query.order_by(desc(Image.created_at), desc(Image.id))
+            if position is not None:
+                query = query.where(tuple_(Image.created_at, Image.id) < tuple_(*position))
+            else:
+                query = query.offset(skip)
             
-            # Get statistics
-            stats = db.query(
-                func.count(Image.id).label('total_images'),
-                func.count(case((Image.has_animal == True, 1))).label('animal_images'),
-                func.count(func.distinct(Image.species_detected)).label('unique_species')
-            ).join(Session).filter(Session.project_id == project_id).first()
+            # One extra row tells us whether there is a next page
+            animal_images = (await db.scalars(query.limit(limit + 1))).all()
+            has_more = len(animal_images) > limit
+            animal_images = animal_images[:limit]
+            next_cursor = None
+            if has_more and animal_images[-1].created_at is not None:
+                next_cursor = _encode_cursor(animal_images[-1].created_at, animal_images[-1].id)
             
-            # Get species breakdown
-            species_query = db.query(
-                func.json_extract(Image.species_detected, '$.name').label('species'),
-                func.count(Image.id).label('count')
-            ).join(Session).filter(
-                Session.project_id == project_id,
-                Image.has_animal == True,
-                Image.species_detected.isnot(None)
-            ).group_by('species').all()
+            # Statistics come from the incrementally maintained rollups, O(species) not O(images)
+            stats = await db.get(StatsRollup, ("project", project_id))
+            total_images = stats.total_images if stats else 0
             
-            species_count = {row.species: row.count for row in species_query if row.species}
+            species_rows = (await db.execute(
+                select(SpeciesRollup.species, SpeciesRollup.image_count).where(
+                    SpeciesRollup.scope == "project",
+                    SpeciesRollup.scope_id == project_id,
+                    SpeciesRollup.image_count > 0
+                )
+            )).all()
+            
+            species_count = {row.species: row.image_count for row in species_rows}
+            
+            # Totals come from the rollups rather than a COUNT over the filtered images
+            if start or end:
+                total = None
+            elif species:
+                total = species_count.get(species, 0)
+            else:
+                total = total_images
             
             return {
                 "images": [
@@ -98,29 +230,35 @@ async def get_project_results(
                     for img in animal_images
                 ],
                 "pagination": {
-                    "page": page,
+                    "page": None if position is not None else page,
                     "limit": limit,
-                    "total": stats.total_images if stats else 0
+                    "total": total,
+                    "next_cursor": next_cursor
                 },
                 "statistics": {
-                    "total_processed": stats.total_images if stats else 0,
+                    "total_processed": total_images,
                     "animals_detected": stats.animal_images if stats else 0,
-                    "unique_species": stats.unique_species if stats else 0,
+                    "unique_species": len(species_count),
                     "species_count": species_count
                 }
             }
     
-    return cached_json(cache_key, 60, _load_results)  # Cache for 1 minute
+    return await cached_json_async(cache_key, 60, _load_results)  # Cache for 1 minute
 
 
 @router.get("/projects/{project_id}/sessions")
-async def get_project_sessions(project_id: str):
-    """Get all sessions for a project"""
-    def _load_sessions():
-        with get_db_session() as db:
-            sessions = db.query(Session).filter(
-                Session.project_id == project_id
-            ).order_by(desc(Session.start_date)).all()
+async def get_project_sessions(project_id: str, request: Request, response: Response):
+    """Get all sessions for a project (ETag: the project's version)"""
+    version = await _project_version(project_id)
+    if version is not None:
+        not_modified = _not_modified(request, response, f'"{project_id}-{version}"')
+        if not_modified is not None:
+            return not_modified
+    async def _load_sessions():
+        async with get_async_db_session() as db:
+            sessions = (await db.scalars(
+                select(Session).where(Session.project_id == project_id).order_by(desc(Session.start_date))
+            )).all()
             
             return [
                 {
@@ -133,5 +271,33 @@ async def get_project_sessions(project_id: str):
                 for s in sessions
             ]
     
-    return cached_json(f"project:{project_id}:sessions", 300, _load_sessions)
+    return await cached_json_async(f"project:{project_id}:sessions:v{version}", 300, _load_sessions)
+
 
+@router.get("/projects/{project_id}/export")
+async def export_project(
+    project_id: str,
+    fmt: str = Query("csv", alias="format", pattern="^(csv|parquet|camtrapdp)$"),
+    session_id: Optional[str] = None,
+    species: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    min_confidence: Optional[float] = Query(None, ge=0, le=1)
+):
+    """
+    Stream every image and detection of a project (or one session) as CSV, Parquet or a
+    Camtrap DP zip, optionally filtered by species / capture time / detection confidence
+    """
+    if await _project_version(project_id) is None:
+        raise HTTPException(status_code=404, detail="Project not found")
+    try:
+        check_format(fmt)
+    except ExportUnavailable as e:
+        raise HTTPException(status_code=501, detail=str(e))
+    
+    export = ProjectExport(project_id, session_id=session_id, species=species, start=start, end=end,
+                           min_confidence=min_confidence)
+    media_type, extension = EXPORT_FORMATS[fmt]
+    filename = f"{session_id or project_id}.{extension}"
+    return StreamingResponse(export.stream(fmt), media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
@@ -1,40 +1,52 @@
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from collections import defaultdict
 import json
 import asyncio
-from app.utils.cache import get_cache
+from app.utils.broker import Subscription, broker_singleton
 
 router = APIRouter()
-redis = get_cache()
+
+# Close code for clients dropped for not keeping up ("Try Again Later")
+SLOW_CONSUMER_CLOSE_CODE = 1013
 
 
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: dict[str, WebSocket] = {}
+        self.active_connections: dict[str, set[WebSocket]] = defaultdict(set)
 
     async def connect(self, websocket: WebSocket, project_id: str):
         await websocket.accept()
-        self.active_connections[project_id] = websocket
-
-    def disconnect(self, project_id: str):
-        if project_id in self.active_connections:
-            del self.active_connections[project_id]
+        self.active_connections[project_id].add(websocket)
 
-    async def send_to_project(self, project_id: str, message: dict):
-        if project_id in self.active_connections:
-            try:
-                await self.active_connections[project_id].send_text(json.dumps(message))
-            except Exception as e:
-                print(f"WebSocket send error: {e}")
-                self.disconnect(project_id)
+    def disconnect(self, websocket: WebSocket, project_id: str):
+        connections = self.active_connections.get(project_id)
+        if connections is not None:
+            connections.discard(websocket)
+            if not connections:
+                del self.active_connections[project_id]
 
 
 manager = ConnectionManager()
 
 
+async def _forward(subscription: Subscription, websocket: WebSocket):
+    """Send broker messages to the client (already serialised, one send per message)"""
+    async for payload in subscription:
+        await websocket.send_text(payload)
+
+
+async def _drain_client(websocket: WebSocket):
+    """Read (and ignore) client frames so a disconnect is noticed"""
+    while True:
+        await websocket.receive_text()
+
+
 @router.websocket("/ws/projects/{project_id}")
 async def project_websocket(websocket: WebSocket, project_id: str):
     await manager.connect(websocket, project_id)
-    
+    subscription = await broker_singleton().subscribe(f"project:{project_id}")
+    tasks = []
+
     try:
         # Send initial connection message
         await websocket.send_text(json.dumps({
@@ -42,34 +54,32 @@ async def project_websocket(websocket: WebSocket, project_id: str):
             "project_id": project_id,
             "message": "Connected to real-time updates"
         }))
-        
-        # Subscribe to Redis channel for this project
-        pubsub = redis.pubsub()
-        await pubsub.subscribe(f"project:{project_id}")
-        
-        # Listen for messages
-        async for message in pubsub.listen():
-            if message["type"] == "message":
-                try:
-                    data = json.loads(message["data"])
-                    await websocket.send_text(json.dumps(data))
-                except Exception as e:
-                    print(f"WebSocket message error: {e}")
-                    
+
+        tasks = [asyncio.create_task(_forward(subscription, websocket)),
+                 asyncio.create_task(_drain_client(websocket))]
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result()
+
+        if subscription.dropped:
+            await websocket.close(code=SLOW_CONSUMER_CLOSE_CODE, reason="Client too slow, reconnect")
+
     except WebSocketDisconnect:
-        manager.disconnect(project_id)
+        pass
     except Exception as e:
         print(f"WebSocket error: {e}")
-        manager.disconnect(project_id)
     finally:
-        await pubsub.unsubscribe(f"project:{project_id}")
-        await pubsub.close()
+        for task in tasks:
+            task.cancel()
+        subscription.close()
+        manager.disconnect(websocket, project_id)
 
 
 @router.get("/ws/health")
 async def websocket_health():
     """Check WebSocket connection health"""
     return {
-        "active_connections": len(manager.active_connections),
-        "projects": list(manager.active_connections.keys())
+        "active_connections": sum(len(c) for c in manager.active_connections.values()),
+        "projects": {project_id: len(c) for project_id, c in manager.active_connections.items()},
+        "broker": broker_singleton().stats()
     }
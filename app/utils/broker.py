@@ -0,0 +1,284 @@
+# app/utils/broker.py
+"""
+Pub/sub for real-time updates (project websockets).
+
+InProcessBroker fans messages out to subscribers of this process; RedisBroker
+(used when REDIS_URL is set and reachable) goes through Redis so subscribers in
+every API process see messages published by any process or worker.
+
+Every subscriber has a bounded queue. A client that falls BROKER_CLIENT_QUEUE
+messages behind is dropped instead of slowing down publishers. Messages are
+serialised once per publish, not once per subscriber.
+"""
+import asyncio
+import json
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Optional, Set
+
+REDIS_URL = os.getenv("REDIS_URL")
+BROKER_CLIENT_QUEUE = int(os.getenv("BROKER_CLIENT_QUEUE", "100"))
+# Throttled messages (progress) are published at most this often per key
+BROKER_THROTTLE_INTERVAL = float(os.getenv("BROKER_THROTTLE_INTERVAL", "0.5"))
+# Messages waiting for the Redis publisher thread before publishers fall back to local delivery
+BROKER_PUBLISH_QUEUE = int(os.getenv("BROKER_PUBLISH_QUEUE", "10000"))
+
+_CLOSED = None
+
+
+class Subscription:
+    """One subscriber's bounded message queue; iterate to receive JSON strings"""
+
+    def __init__(self, broker: "InProcessBroker", channel: str, maxsize: int):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.closed = False
+        self.dropped = False
+
+    def _deliver(self, payload: str):
+        """Runs on the subscriber's event loop"""
+        if self.closed:
+            return
+        try:
+            self.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            # Slow consumer: cut it loose rather than buffer without bound
+            self.dropped = True
+            self.broker.dropped += 1
+            self.close()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.broker._remove(self)
+        # Wake a reader waiting in get(); whatever is still queued is discarded
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(_CLOSED)
+
+    async def get(self) -> Optional[str]:
+        """Next message, or None once the subscription is closed"""
+        if self.closed and self.queue.empty():
+            return None
+        return await self.queue.get()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        payload = await self.get()
+        if payload is _CLOSED:
+            raise StopAsyncIteration
+        return payload
+
+
+class InProcessBroker:
+    """Fan-out to subscribers in this process; publish() is safe from any thread"""
+
+    backend = "memory"
+
+    def __init__(self, client_queue: int = BROKER_CLIENT_QUEUE, throttle_interval: float = BROKER_THROTTLE_INTERVAL):
+        self.client_queue = client_queue
+        self.throttle_interval = throttle_interval
+        self._subscribers: Dict[str, Set[Subscription]] = defaultdict(set)
+        self._lock = threading.Lock()
+        self._last_sent: Dict[str, float] = {}
+
+        self.published = 0
+        self.throttled = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    async def subscribe(self, channel: str) -> Subscription:
+        subscription = Subscription(self, channel, self.client_queue)
+        with self._lock:
+            first = not self._subscribers[channel]
+            self._subscribers[channel].add(subscription)
+        if first:
+            await self._watch(channel)
+        return subscription
+
+    def _remove(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is None:
+                return
+            subscribers.discard(subscription)
+            last = not subscribers
+            if last:
+                del self._subscribers[subscription.channel]
+        if last:
+            self._unwatch(subscription.channel)
+
+    def publish(self, channel: str, message: dict, throttle_key: Optional[str] = None) -> bool:
+        """
+        Send message to every subscriber of channel. With throttle_key, messages sharing the
+        key are sent at most once per throttle interval and the rest are dropped (use it for
+        progress updates, never for state changes). Returns whether the message was sent.
+        """
+        if throttle_key is not None:
+            now = time.monotonic()
+            with self._lock:
+                if now - self._last_sent.get(throttle_key, float("-inf")) < self.throttle_interval:
+                    self.throttled += 1
+                    return False
+                self._last_sent[throttle_key] = now
+                if len(self._last_sent) > 10000:
+                    self._last_sent = {k: t for k, t in self._last_sent.items() if now - t < self.throttle_interval}
+
+        self.published += 1
+        self._send(channel, json.dumps(message))
+        return True
+
+    def _send(self, channel: str, payload: str):
+        self._fan_out(channel, payload)
+
+    def _fan_out(self, channel: str, payload: str):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._deliver, payload)
+                self.delivered += 1
+            except RuntimeError:
+                self._discard(subscription)
+
+    def _discard(self, subscription: Subscription):
+        """Close a subscription whose loop refused a callback, on that loop if it still runs"""
+        try:
+            subscription.loop.call_soon_threadsafe(subscription.close)
+        except RuntimeError:
+            # Loop closed: nobody can read the queue any more, just forget the subscription
+            subscription.closed = True
+            self._remove(subscription)
+
+    async def _watch(self, channel: str):
+        """First local subscriber of channel"""
+
+    def _unwatch(self, channel: str):
+        """Last local subscriber of channel left"""
+
+    def stats(self) -> dict:
+        with self._lock:
+            channels = len(self._subscribers)
+            subscribers = sum(len(s) for s in self._subscribers.values())
+        return {
+            "backend": self.backend,
+            "channels": channels,
+            "subscribers": subscribers,
+            "published": self.published,
+            "throttled": self.throttled,
+            "delivered": self.delivered,
+            "dropped_clients": self.dropped,
+        }
+
+
+class RedisBroker(InProcessBroker):
+    """
+    Publishes through Redis. Each process holds one Redis pub/sub connection subscribed
+    to the channels its local clients watch, and fans incoming messages out locally.
+    Publishing is handed to a background thread, so publish() never waits on Redis.
+    """
+
+    backend = "redis"
+
+    def __init__(self, url: str, **kwargs):
+        super().__init__(**kwargs)
+        import redis
+
+        self.url = url
+        self._redis = redis.Redis.from_url(url, socket_timeout=1, socket_connect_timeout=1)
+        self._redis.ping()
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+        self._outbox: queue.Queue = queue.Queue(BROKER_PUBLISH_QUEUE)
+        threading.Thread(target=self._publish_loop, name="broker-publisher", daemon=True).start()
+        self.redis_errors = 0
+
+    def _send(self, channel: str, payload: str):
+        try:
+            self._outbox.put_nowait((channel, payload))
+        except queue.Full:
+            self.redis_errors += 1
+            self._fan_out(channel, payload)
+
+    def _publish_loop(self):
+        """Publisher thread: messages go out in publish order"""
+        while True:
+            channel, payload = self._outbox.get()
+            try:
+                self._redis.publish(channel, payload)
+            except Exception as e:
+                self.redis_errors += 1
+                print(f"Redis publish failed, delivering locally only: {e}")
+                self._fan_out(channel, payload)
+
+    async def _watch(self, channel: str):
+        if self._pubsub is None:
+            import redis.asyncio
+
+            client = redis.asyncio.Redis.from_url(self.url, decode_responses=True)
+            self._pubsub = client.pubsub(ignore_subscribe_messages=True)
+            self._loop = asyncio.get_running_loop()
+        await self._pubsub.subscribe(channel)
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+    def _unwatch(self, channel: str):
+        if self._pubsub is not None:
+            try:
+                self._loop.call_soon_threadsafe(lambda: asyncio.ensure_future(self._unsubscribe_if_idle(channel)))
+            except RuntimeError:
+                # The pub/sub connection's loop is gone, and the subscription with it
+                pass
+
+    async def _unsubscribe_if_idle(self, channel: str):
+        with self._lock:
+            if self._subscribers.get(channel):
+                # Somebody subscribed again in the meantime
+                return
+        await self._pubsub.unsubscribe(channel)
+
+    async def _listen(self):
+        while True:
+            if not self._pubsub.subscribed:
+                await asyncio.sleep(1.0)
+                continue
+            try:
+                message = await self._pubsub.get_message(timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.redis_errors += 1
+                print(f"Redis subscription error: {e}")
+                await asyncio.sleep(1.0)
+                continue
+            if message and message["type"] == "message":
+                self._fan_out(message["channel"], message["data"])
+
+    def stats(self) -> dict:
+        return {**super().stats(), "publish_queue": self._outbox.qsize(), "redis_errors": self.redis_errors}
+
+
+# Singleton
+_broker_instance = None
+
+
+def broker_singleton() -> InProcessBroker:
+    """Redis broker when REDIS_URL is set and reachable, in-process otherwise"""
+    global _broker_instance
+    if _broker_instance is None:
+        if REDIS_URL:
+            try:
+                _broker_instance = RedisBroker(REDIS_URL)
+            except Exception as e:
+                print(f"Redis unavailable at {REDIS_URL}, using in-process broker: {e}")
+        if _broker_instance is None:
+            _broker_instance = InProcessBroker()
+    return _broker_instance
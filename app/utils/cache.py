@@ -1,23 +1,322 @@
+import asyncio
+import fnmatch
+import inspect
 import json
-from typing import Any, Callable
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+REDIS_URL = os.getenv("REDIS_URL")
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "2048"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# With Redis as the shared tier, other workers can invalidate keys we still hold locally,
+# so the in-process copy is only trusted for this long
+CACHE_LOCAL_TTL = int(os.getenv("CACHE_LOCAL_TTL", "5"))
+
+
+class LocalCache:
+    """In-process TTL + LRU cache of serialised JSON, bounded by entry count and (UTF-8) bytes"""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, max_bytes: int = CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        # key -> (expires at, payload, encoded size)
+        self._entries: OrderedDict[str, tuple[float, str, int]] = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, payload, _ = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return payload
+
+    def set(self, key: str, payload: str, ttl: float):
+        size = len(payload.encode())
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + ttl, payload, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def delete_pattern(self, pattern: str) -> int:
+        with self._lock:
+            keys = [key for key in self._entries if fnmatch.fnmatchcase(key, pattern)]
+            for key in keys:
+                self._remove(key)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class JsonCache:
+    """
+    Read-through JSON cache: in-process tier, optional Redis tier, and single-flight
+    loading so concurrent misses on one key run the loader only once.
+    """
+
+    def __init__(self, redis_client=None, local: LocalCache | None = None):
+        self.redis = redis_client
+        self.local = local or LocalCache()
+        self._inflight: dict[str, Future] = {}
+        self._inflight_lock = threading.Lock()
+
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.redis_errors = 0
+
+    def get_or_load(self, key: str, ttl: int, loader: Callable[[], Any]) -> Any:
+        while True:
+            payload = self.local.get(key)
+            if payload is not None:
+                self.local_hits += 1
+                return json.loads(payload)
+
+            payload = self._redis_get(key)
+            if payload is not None:
+                self.redis_hits += 1
+                self.local.set(key, payload, self._local_ttl(ttl))
+                return json.loads(payload)
+
+            future, leader = self._join(key)
+            if not leader:
+                # Someone else is already loading this key, share their result
+                self.coalesced += 1
+                payload = future.result()
+                if payload is None:
+                    # The leader was interrupted: try again, one of the waiters loads it
+                    continue
+                return json.loads(payload)
+
+            self.misses += 1
+            try:
+                payload = json.dumps(loader())
+                self.local.set(key, payload, self._local_ttl(ttl))
+                self._redis_set(key, payload, ttl)
+            except Exception as e:
+                self._finish(key, future, exception=e)
+                raise
+            except BaseException:
+                self._finish(key, future, None)
+                raise
+            self._finish(key, future, payload)
+            return json.loads(payload)
+
+    async def get_or_load_async(self, key: str, ttl: int, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """get_or_load for an async loader; Redis calls go to the threadpool, the loader runs on the loop"""
+        while True:
+            payload = self.local.get(key)
+            if payload is not None:
+                self.local_hits += 1
+                return json.loads(payload)
+
+            if self.redis is not None:
+                payload = await run_in_threadpool(self._redis_get, key)
+                if payload is not None:
+                    self.redis_hits += 1
+                    self.local.set(key, payload, self._local_ttl(ttl))
+                    return json.loads(payload)
+
+            future, leader = self._join(key)
+            if not leader:
+                self.coalesced += 1
+                # Shielded: a waiter going away must not cancel the load shared with the others
+                payload = await asyncio.shield(asyncio.wrap_future(future))
+                if payload is None:
+                    continue
+                return json.loads(payload)
+
+            self.misses += 1
+            try:
+                payload = json.dumps(await loader())
+                self.local.set(key, payload, self._local_ttl(ttl))
+                if self.redis is not None:
+                    await run_in_threadpool(self._redis_set, key, payload, ttl)
+            except Exception as e:
+                self._finish(key, future, exception=e)
+                raise
+            except BaseException:
+                # Cancelled (the client disconnected): that's no error for the waiters
+                self._finish(key, future, None)
+                raise
+            self._finish(key, future, payload)
+            return json.loads(payload)
+
+    def _join(self, key: str) -> tuple:
+        """(future of the load in flight for key, whether this caller has to run it)"""
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future, False
+            future = self._inflight[key] = Future()
+            return future, True
+
+    def _finish(self, key: str, future: Future, payload: Optional[str] = None, exception: Optional[Exception] = None):
+        """Hand the leader's outcome to the waiters; payload None sends them back to retry the load"""
+        with self._inflight_lock:
+            self._inflight.pop(key, None)
+        if exception is not None:
+            future.set_exception(exception)
+        else:
+            future.set_result(payload)
+
+    def invalidate(self, pattern: str) -> int:
+        removed = self.local.delete_pattern(pattern)
+        if self.redis is not None:
+            try:
+                keys = list(self.redis.scan_iter(match=pattern, count=500))
+                for start in range(0, len(keys), 500):
+                    self.redis.delete(*keys[start:start + 500])
+                # Redis holds every key, the local tier only a subset of them
+                removed = max(removed, len(keys))
+            except Exception as e:
+                self._redis_failed(e)
+        return removed
+
+    def _local_ttl(self, ttl: int) -> int:
+        return min(ttl, CACHE_LOCAL_TTL) if self.redis is not None else ttl
+
+    def _redis_get(self, key: str) -> Optional[str]:
+        if self.redis is None:
+            return None
+        try:
+            payload = self.redis.get(key)
+        except Exception as e:
+            self._redis_failed(e)
+            return None
+        if isinstance(payload, bytes):
+            payload = payload.decode()
+        return payload
+
+    def _redis_set(self, key: str, payload: str, ttl: int):
+        if self.redis is None:
+            return
+        try:
+            self.redis.setex(key, ttl, payload)
+        except Exception as e:
+            self._redis_failed(e)
+
+    def _redis_failed(self, e: Exception):
+        # Redis being down degrades to the in-process tier, it never fails a request
+        self.redis_errors += 1
+        print(f"Redis cache error: {e}")
+
+    def stats(self) -> dict:
+        lookups = self.local_hits + self.redis_hits + self.misses + self.coalesced
+        return {
+            "backend": "redis" if self.redis is not None else "memory",
+            "entries": len(self.local),
+            "bytes": self.local._bytes,
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.local.evictions,
+            "expirations": self.local.expirations,
+            "redis_errors": self.redis_errors,
+            "hit_rate": round((lookups - self.misses) / lookups, 4) if lookups else 0.0,
+        }
+
+
+_cache: JsonCache | None = None
+
+
+def _connect_redis():
+    if not REDIS_URL:
+        return None
+    try:
+        import redis
+        client = redis.Redis.from_url(REDIS_URL, socket_timeout=1, socket_connect_timeout=1)
+        client.ping()
+        return client
+    except Exception as e:
+        print(f"Redis unavailable at {REDIS_URL}, using in-process cache only: {e}")
+        return None
+
+
+def configure_cache(redis_client=None, local: LocalCache | None = None) -> JsonCache:
+    """Replace the cache, e.g. with a fake Redis client in tests"""
+    global _cache
+    _cache = JsonCache(redis_client=redis_client, local=local)
+    return _cache
+
+
+def json_cache() -> JsonCache:
+    """Get or create the process-wide JSON cache"""
+    global _cache
+    if _cache is None:
+        _cache = JsonCache(redis_client=_connect_redis())
+    return _cache
+
 
 def get_cache():
-    """Dummy cache function - returns None since we're not using Redis"""
-    return None
+    """Redis client backing the cache, or None when running without Redis"""
+    return json_cache().redis
+
 
 def cached_json(key: str, ttl: int, loader: Callable[[], Any]) -> Any:
+    """Return the cached value for key, calling loader() (once, even under concurrency) on a miss"""
+    return json_cache().get_or_load(key, ttl, loader)
+
+
+async def cached_json_async(key: str, ttl: int, loader: Callable[[], Any]) -> Any:
     """
-    Cache JSON data - simplified version without Redis
-    Just calls the loader function directly (no actual caching)
-    For production, you'd use Redis for proper caching
+    cached_json for async routes: hits are served inline; on a miss an async loader is
+    awaited, a blocking one runs in the threadpool
     """
-    # Simply call the loader and return data without caching
-    return loader()
+    cache = json_cache()
+    if inspect.iscoroutinefunction(loader):
+        return await cache.get_or_load_async(key, ttl, loader)
+    payload = cache.local.get(key)
+    if payload is not None:
+        cache.local_hits += 1
+        return json.loads(payload)
+    return await run_in_threadpool(cache.get_or_load, key, ttl, loader)
+
 
 def invalidate_pattern(pattern: str):
-    """Invalidate cache pattern - no-op without Redis"""
-    pass
+    """Drop every cached key matching a glob pattern, e.g. "project:123:*" """
+    return json_cache().invalidate(pattern)
+
+
+def publish_message(channel: str, message: dict, throttle_key: Optional[str] = None):
+    """Publish a message to real-time subscribers (see app/utils/broker.py)"""
+    from app.utils.broker import broker_singleton
+    return broker_singleton().publish(channel, message, throttle_key=throttle_key)
+
 
-def publish_message(channel: str, message: dict):
-    """Publish message - no-op without Redis"""
-    pass
\ No newline at end of file
+def cache_stats() -> dict:
+    return json_cache().stats()
@@ -0,0 +1,202 @@
+# app/utils/metrics.py
+"""
+Per-stage latency of the inference path, exposed on /metrics (Prometheus text format).
+
+Every analysed image carries a {stage: seconds} breakdown in result["timings"]:
+
+- read, decode, prefilter: the API route or the batch pipeline
+- detect, crop, classify: wherever the models run (thread, process pool or model server)
+- queue_wait: waiting for the micro-batcher, an executor slot, the model server or
+  the next pipeline stage
+- serialize, db_write: building the response or the images row, and its chunk commit
+
+Stages of a batched call (detect, classify, db_write) count the wall time of the
+call for every image in it, i.e. what each image waited for. Histograms are kept per
+stage, endpoint and model version, per process like the other stats endpoints.
+The METRICS_SLOWEST slowest images are kept with their breakdown (/metrics/slowest),
+images slower than METRICS_SLOW_LOG_MS are printed.
+"""
+import bisect
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+METRICS_BUCKETS = [
+    float(bound) for bound in
+    os.getenv("METRICS_BUCKETS", "0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10").split(",")
+]
+METRICS_SLOWEST = int(os.getenv("METRICS_SLOWEST", "20"))
+# 0 disables the log line
+METRICS_SLOW_LOG_MS = float(os.getenv("METRICS_SLOW_LOG_MS", "0"))
+
+# Stages that run with the models; the rest of a model call's wall time is queue_wait
+MODEL_STAGES = ("detect", "crop", "classify")
+
+
+@contextmanager
+def timed(timings: dict, stage: str):
+    """Add the time spent in the block to timings[stage]"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_timing(timings, stage, time.perf_counter() - start)
+
+
+def add_timing(timings: dict, stage: str, seconds: float):
+    timings[stage] = round(timings.get(stage, 0.0) + seconds, 6)
+
+
+def merge_timings(timings: dict, other: Optional[dict]) -> dict:
+    for stage, seconds in (other or {}).items():
+        add_timing(timings, stage, seconds)
+    return timings
+
+
+def set_queue_wait(result: dict, elapsed: float, stages=MODEL_STAGES):
+    """
+    The part of a model call's wall time (elapsed) that the models didn't spend on
+    result becomes its queue_wait (replacing the one of an inner call, e.g. the model server's)
+    """
+    timings = result.setdefault("timings", {})
+    busy = sum(timings.get(stage, 0.0) for stage in stages)
+    timings["queue_wait"] = round(max(0.0, elapsed - busy), 6)
+
+
+def _escape(value) -> str:
+    return str(value if value is not None else "").replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+
+
+class Histogram:
+    """Cumulative-on-render bucket counts, sum and count"""
+
+    def __init__(self, buckets: List[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last one is +Inf only
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + [float("inf")], self.counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class Metrics:
+    """Stage and per-image latency histograms plus the slowest images seen"""
+
+    def __init__(self, buckets: List[float] = METRICS_BUCKETS, slowest: int = METRICS_SLOWEST,
+                 slow_log_ms: float = METRICS_SLOW_LOG_MS):
+        self.buckets = sorted(buckets)
+        self.max_slowest = slowest
+        self.slow_log_ms = slow_log_ms
+        self._stages: Dict[Tuple[str, str, str], Histogram] = {}
+        self._images: Dict[Tuple[str, str], Histogram] = {}
+        # Min-heap of (seconds, tie breaker, record), the fastest of the slowest on top
+        self._slowest: list = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float, endpoint: str, model_version: Optional[str]):
+        """One stage of one image (or of a whole call, e.g. a streamed response)"""
+        key = (stage, endpoint, model_version or "")
+        with self._lock:
+            histogram = self._stages.get(key)
+            if histogram is None:
+                histogram = self._stages[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def observe_image(self, timings: Optional[dict], endpoint: str, model_version: Optional[str],
+                      name: Optional[str] = None):
+        """Every stage of one image plus its total"""
+        if not timings:
+            return
+        for stage, seconds in timings.items():
+            self.observe(stage, seconds, endpoint, model_version)
+        total = sum(timings.values())
+        with self._lock:
+            key = (endpoint, model_version or "")
+            histogram = self._images.get(key)
+            if histogram is None:
+                histogram = self._images[key] = Histogram(self.buckets)
+            histogram.observe(total)
+
+            if self.max_slowest > 0 and (len(self._slowest) < self.max_slowest or total > self._slowest[0][0]):
+                record = {
+                    "name": name,
+                    "endpoint": endpoint,
+                    "model_version": model_version,
+                    "total_seconds": round(total, 6),
+                    "timings": dict(timings),
+                    "at": datetime.utcnow().isoformat(),
+                }
+                entry = (total, next(self._seq), record)
+                if len(self._slowest) < self.max_slowest:
+                    heapq.heappush(self._slowest, entry)
+                else:
+                    heapq.heapreplace(self._slowest, entry)
+
+        if self.slow_log_ms and total * 1000 >= self.slow_log_ms:
+            breakdown = ", ".join(f"{stage} {seconds * 1000:.0f}" for stage, seconds in timings.items())
+            print(f"⚠️ Slow image {name or ''} ({endpoint}, {model_version}): {total * 1000:.0f} ms [{breakdown}]")
+
+    def slowest(self) -> List[dict]:
+        with self._lock:
+            return [record for _, _, record in sorted(self._slowest, reverse=True)]
+
+    def render(self) -> str:
+        """Histograms in Prometheus text exposition format"""
+        with self._lock:
+            lines = [
+                "# HELP trailguard_stage_seconds Time an image spent in one stage of the inference path",
+                "# TYPE trailguard_stage_seconds histogram",
+            ]
+            for (stage, endpoint, version), histogram in sorted(self._stages.items()):
+                lines += histogram.render("trailguard_stage_seconds",
+                                          _labels(stage=stage, endpoint=endpoint, model_version=version))
+            lines += [
+                "# HELP trailguard_image_seconds Sum of the stage times of one image",
+                "# TYPE trailguard_image_seconds histogram",
+            ]
+            for (endpoint, version), histogram in sorted(self._images.items()):
+                lines += histogram.render("trailguard_image_seconds", _labels(endpoint=endpoint, model_version=version))
+        return "\n".join(lines) + "\n"
+
+
+def render_values(metrics: List[Tuple[str, str, str, float]]) -> str:
+    """(name, type, help, value) gauges/counters in Prometheus text format"""
+    lines = []
+    for name, kind, help_text, value in metrics:
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {value}"]
+    return "\n".join(lines) + "\n"
+
+
+# Singleton
+_metrics_instance = None
+
+
+def metrics_singleton() -> Metrics:
+    global _metrics_instance
+    if _metrics_instance is None:
+        _metrics_instance = Metrics()
+    return _metrics_instance
@@ -1,22 +1,28 @@
 import torch
-from ultralytics import YOLO
 from typing import Dict, Any
 import os
 
+from app.pipeline.backends import load_model
+
 _models: Dict[str, Any] = {}
 
-def get_model(name: str, model_path: str) -> Any:
-    """Lazy load YOLO models with device selection"""
+def get_model(name: str, model_path: str, task: str = "detect") -> Any:
+    """Lazy load YOLO models on the configured backend (INFERENCE_BACKEND) with device selection"""
     if name not in _models:
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        print(f"Loading {name} model on {device}")
-        
         # Check if model file exists
         if not os.path.exists(model_path):
             print(f"Warning: Model file {model_path} not found, using placeholder")
             _models[name] = None
         else:
-            _models[name] = YOLO(model_path).to(device)
+            model, path, backend = load_model(model_path, task=task)
+            if backend == "pytorch":
+                device = "cuda" if torch.cuda.is_available() else "cpu"
+                model = model.to(device)
+            else:
+                # ONNX Runtime / OpenVINO artifacts are exported for CPU nodes
+                device = "cpu"
+            print(f"Loading {name} model ({backend}: {path}) on {device}")
+            _models[name] = model
     
     return _models[name]
 
@@ -0,0 +1,91 @@
+# app/utils/startup.py
+"""
+Startup phases and readiness.
+
+The API answers /health as soon as it is up; /ready only once the models are
+loaded and warmed up, so autoscaled instances don't take traffic while the first
+requests would still pay for lazy initialisation. Phase timings are exposed on
+/ready to make cold starts measurable.
+"""
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from app.pipeline.executor import INFERENCE_RETRY_AFTER, InferenceQueueFull
+
+# Seconds between attempts to load the models after a failed one
+STARTUP_RETRY_INTERVAL = float(os.getenv("STARTUP_RETRY_INTERVAL", "30"))
+
+
+class ModelsNotReady(InferenceQueueFull):
+    """Raised for inference requests that arrive before startup has loaded the models (or after it failed)"""
+
+    def __init__(self, retry_after: int = INFERENCE_RETRY_AFTER):
+        super().__init__(retry_after)
+        self.args = ("Models are still loading, retry later",)
+
+
+def _process_started_at() -> Optional[float]:
+    """Unix time the process started (Linux), to include interpreter and server start-up"""
+    try:
+        with open("/proc/self/stat") as f:
+            # Fields after the parenthesised command name; starttime is field 22
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/stat") as f:
+            boot_time = next(int(line.split()[1]) for line in f if line.startswith("btime"))
+        return boot_time + start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, StopIteration):
+        return None
+
+
+class StartupTracker:
+    """Current startup phase, how long each phase took and whether the app is ready"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.process_started_at = _process_started_at()
+        self.phase = "starting"
+        self.ready = False
+        # Set by the API: the models load in a background task and requests get 503 until ready
+        self.background_loading = False
+        self.error: Optional[str] = None
+        self.timings: Dict[str, float] = {}
+
+    def record(self, name: str, seconds: float):
+        self.timings[name] = round(seconds, 3)
+        print(f"Startup: {name} took {seconds:.2f}s")
+
+    @contextmanager
+    def timed(self, name: str):
+        self.phase = name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def mark_ready(self):
+        self.phase = "ready"
+        self.ready = True
+        self.error = None
+        self.record("until_ready", time.time() - (self.process_started_at or self.started_at))
+
+    def mark_failed(self, error: Exception):
+        self.phase = "failed"
+        self.error = str(error)
+        print(f"⚠️ Startup failed: {error}")
+
+    def status(self) -> dict:
+        return {"ready": self.ready, "phase": self.phase, "error": self.error, "timings": self.timings}
+
+
+# Singleton
+_startup_tracker_instance = None
+
+
+def startup_tracker_singleton() -> StartupTracker:
+    global _startup_tracker_instance
+    if _startup_tracker_instance is None:
+        _startup_tracker_instance = StartupTracker()
+    return _startup_tracker_instance
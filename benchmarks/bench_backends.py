@@ -0,0 +1,189 @@
+# benchmarks/bench_backends.py
+"""
+CPU throughput of the PyTorch, ONNX Runtime and OpenVINO backends (fp32 and int8),
+and how far each drifts from the .pt models: detector mAP@0.5 and classifier top-1
+agreement, both measured against the PyTorch predictions.
+
+    python -m benchmarks.bench_backends --images 64
+    python -m benchmarks.bench_backends --detector models/animal_detector.pt \\
+        --classifier models/species_classifier.pt --images-dir /data/sample_cards
+
+Missing exports are created first (int8 calibrates on the benchmark images unless
+--calibration-dir is given). Variants whose packages are not installed are skipped.
+"""
+import argparse
+import os
+import tempfile
+import time
+from typing import List, Optional
+
+import numpy as np
+
+from benchmarks.common import make_random_weights, make_synthetic_images
+
+VARIANTS = {
+    "pytorch": ("pytorch", False),
+    "onnx": ("onnx", False),
+    "onnx-int8": ("onnx", True),
+    "openvino": ("openvino", False),
+    "openvino-int8": ("openvino", True),
+}
+
+
+def _box_iou(box: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+
+def map50(reference: list, predictions: list) -> Optional[float]:
+    """
+    mAP@0.5 of predictions with the reference predictions as ground truth.
+    Both are per-image (boxes Nx4, classes N, scores N) tuples.
+    """
+    classes = {int(c) for _, ref_classes, _ in reference for c in ref_classes}
+    if not classes:
+        return None
+
+    aps = []
+    for cls in classes:
+        truth = [boxes[ref_classes == cls] for boxes, ref_classes, _ in reference]
+        matched = [np.zeros(len(t), dtype=bool) for t in truth]
+        total = sum(len(t) for t in truth)
+        detections = sorted(
+            ((score, i, box) for i, (boxes, pred_classes, scores) in enumerate(predictions)
+             for box, pred_class, score in zip(boxes, pred_classes, scores) if int(pred_class) == cls),
+            key=lambda d: -d[0]
+        )
+
+        hits = []
+        for _, i, box in detections:
+            hit = False
+            if len(truth[i]):
+                ious = _box_iou(box, truth[i])
+                j = int(np.argmax(ious))
+                if ious[j] >= 0.5 and not matched[i][j]:
+                    matched[i][j] = hit = True
+            hits.append(hit)
+
+        tp = np.cumsum(hits)
+        recall = tp / total if len(hits) else np.zeros(0)
+        precision = tp / np.arange(1, len(hits) + 1) if len(hits) else np.zeros(0)
+        # All-point interpolated area under the precision/recall curve
+        recall = np.concatenate([[0.0], recall, [1.0]])
+        precision = np.concatenate([[1.0], precision, [0.0]])
+        precision = np.flip(np.maximum.accumulate(np.flip(precision)))
+        steps = np.where(recall[1:] != recall[:-1])[0]
+        aps.append(float(np.sum((recall[steps + 1] - recall[steps]) * precision[steps + 1])))
+    return float(np.mean(aps))
+
+
+def _batches(items: list, size: int):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def run_detector(model, images: List[np.ndarray], batch: int, conf: float):
+    """(seconds, per-image (boxes, classes, scores))"""
+    model(images[:batch], conf=conf, verbose=False)  # warm up
+    outputs = []
+    start = time.perf_counter()
+    for chunk in _batches(images, batch):
+        for result in model(chunk, conf=conf, verbose=False):
+            boxes = result.boxes
+            outputs.append((boxes.xyxy.cpu().numpy(), boxes.cls.cpu().numpy(), boxes.conf.cpu().numpy()))
+    return time.perf_counter() - start, outputs
+
+
+def run_classifier(model, crops: List[np.ndarray], batch: int):
+    """(seconds, top-1 class per crop)"""
+    model(crops[:batch], verbose=False)  # warm up
+    top1 = []
+    start = time.perf_counter()
+    for chunk in _batches(crops, batch):
+        top1.extend(int(result.probs.top1) for result in model(chunk, verbose=False))
+    return time.perf_counter() - start, top1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=64)
+    parser.add_argument("--images-dir", help="Benchmark on real frames instead of synthetic ones")
+    parser.add_argument("--size", default="1920x1080")
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--conf", type=float,
+                        help="Detector confidence (default: DETECTION_CONFIDENCE, 0.001 for random weights)")
+    parser.add_argument("--variants", default=",".join(VARIANTS))
+    parser.add_argument("--detector")
+    parser.add_argument("--classifier")
+    parser.add_argument("--calibration-dir")
+    parser.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "trailguard-bench"))
+    args = parser.parse_args()
+
+    from app.pipeline.backends import load_model
+    from app.pipeline.batch_processor import expand_image_paths
+    from app.pipeline.decode import decode_image_bytes
+    from app.pipeline.image_processor import DETECTION_CONFIDENCE
+    from app.pipeline.model_export import CLASSIFIER_IMGSZ, DETECTOR_IMGSZ, export_model
+
+    if args.images_dir:
+        image_paths = expand_image_paths([args.images_dir])[:args.images]
+    else:
+        width, height = map(int, args.size.split("x"))
+        image_paths = make_synthetic_images(os.path.join(args.work_dir, "images"), args.images, (width, height))
+    images = []
+    for path in image_paths:
+        with open(path, "rb") as f:
+            images.append(decode_image_bytes(f.read()))
+    # Classifier input: the middle third of every frame
+    crops = [image[image.shape[0] // 3:2 * image.shape[0] // 3, image.shape[1] // 3:2 * image.shape[1] // 3]
+             for image in images]
+    calibration_dir = args.calibration_dir or os.path.dirname(image_paths[0])
+
+    detector, classifier, conf = args.detector, args.classifier, args.conf
+    if detector is None:
+        detector, classifier = make_random_weights(os.path.join(args.work_dir, "weights"))
+        # Untrained heads score everything low, keep enough boxes to compare
+        conf = 0.001 if conf is None else conf
+    conf = DETECTION_CONFIDENCE if conf is None else conf
+
+    reference_boxes = reference_top1 = None
+    print(f"{len(images)} images, batch {args.batch}, conf {conf}")
+    print(f"{'variant':>14} {'det img/s':>10} {'cls img/s':>10} {'mAP50 vs .pt':>13} {'top-1 vs .pt':>13}")
+    for name in args.variants.split(","):
+        backend, int8 = VARIANTS[name]
+        try:
+            if backend != "pytorch":
+                export_model(detector, "detect", backend, DETECTOR_IMGSZ, int8=int8, calibration_dir=calibration_dir)
+                export_model(classifier, "classify", backend, CLASSIFIER_IMGSZ, int8=int8,
+                             calibration_dir=calibration_dir)
+            det_model, _, det_backend = load_model(detector, "detect", backend, int8)
+            cls_model, _, _ = load_model(classifier, "classify", backend, int8)
+        except ImportError as e:
+            print(f"{name:>14} skipped ({e})")
+            continue
+        if det_backend != backend:
+            print(f"{name:>14} skipped (export failed)")
+            continue
+
+        det_seconds, boxes = run_detector(det_model, images, args.batch, conf)
+        cls_seconds, top1 = run_classifier(cls_model, crops, args.batch)
+        if name == "pytorch":
+            reference_boxes, reference_top1 = boxes, top1
+
+        det_drift = cls_drift = "n/a"
+        if reference_boxes is not None:
+            score = map50(reference_boxes, boxes)
+            det_drift = f"{score:.3f}" if score is not None else "no boxes"
+            cls_drift = f"{np.mean(np.array(top1) == np.array(reference_top1)):.3f}"
+        print(f"{name:>14} {len(images) / det_seconds:>10.2f} {len(crops) / cls_seconds:>10.2f} "
+              f"{det_drift:>13} {cls_drift:>13}")
+
+
+if __name__ == "__main__":
+    main()
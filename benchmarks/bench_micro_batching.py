@@ -0,0 +1,74 @@
+# benchmarks/bench_micro_batching.py
+"""
+Throughput and latency of ImageProcessor under concurrent load for different
+micro-batch sizes (CPU).
+
+    python -m benchmarks.bench_micro_batching --images 128
+    python -m benchmarks.bench_micro_batching --detector models/animal_detector.pt --classifier models/species_classifier.pt
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from benchmarks.common import make_random_weights, make_synthetic_images, percentile
+
+
+async def _run_load(processor, image_paths, concurrency: int) -> list:
+    """Closed-loop clients, each submitting one image at a time"""
+    queue = list(image_paths)
+    latencies = []
+
+    async def client():
+        while queue:
+            path = queue.pop()
+            start = time.perf_counter()
+            await processor.process_image(path, wait=True)
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    return latencies
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=128)
+    parser.add_argument("--batch-sizes", default="1,2,4,8,16,32")
+    parser.add_argument("--max-wait-ms", type=float, default=20)
+    parser.add_argument("--size", default="1280x720")
+    parser.add_argument("--detector")
+    parser.add_argument("--classifier")
+    parser.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "trailguard-bench"))
+    args = parser.parse_args()
+
+    from app.pipeline.image_processor import ImageProcessor
+    from app.pipeline.micro_batcher import MicroBatcher
+
+    width, height = map(int, args.size.split("x"))
+    image_paths = make_synthetic_images(os.path.join(args.work_dir, "images"), args.images, (width, height))
+
+    detector, classifier = args.detector, args.classifier
+    if detector is None:
+        detector, classifier = make_random_weights(os.path.join(args.work_dir, "weights"))
+    processor = ImageProcessor(detector_path=detector, classifier_path=classifier or "")
+
+    print(f"{'batch':>5} {'img/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'avg batch':>9}")
+    for batch_size in [int(b) for b in args.batch_sizes.split(",")]:
+        processor.batcher = MicroBatcher(processor._run_batch, max_batch_size=batch_size,
+                                         max_wait_ms=args.max_wait_ms, max_pending=10 ** 6)
+        # Warm up graph/thread pools for this batch size
+        await _run_load(processor, image_paths[:batch_size], batch_size)
+        processor.batcher._batches = processor.batcher._items = 0
+
+        start = time.perf_counter()
+        latencies = await _run_load(processor, image_paths, concurrency=batch_size)
+        elapsed = time.perf_counter() - start
+
+        print(f"{batch_size:>5} {len(latencies) / elapsed:>8.2f} "
+              f"{percentile(latencies, 50) * 1000:>8.1f} {percentile(latencies, 99) * 1000:>8.1f} "
+              f"{processor.batcher.stats()['avg_batch_size']:>9}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
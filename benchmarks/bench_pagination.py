@@ -0,0 +1,113 @@
+# benchmarks/bench_pagination.py
+"""
+Latency of /api/projects/{id}/results at page 1 vs. deep pages, OFFSET paging
+vs. keyset cursors, on a seeded SQLite database.
+
+    python -m benchmarks.bench_pagination --images 1000000 --deep-page 10000
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import statistics
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+
+def seed(db_path: str, images: int, sessions: int = 4):
+    """Bulk-load images straight through sqlite3 (the ORM would dominate seeding time)"""
+    from app.db.session import create_tables
+
+    create_tables()
+    connection = sqlite3.connect(db_path)
+    project_id = str(uuid.uuid4())
+    session_ids = [str(uuid.uuid4()) for _ in range(sessions)]
+    connection.execute("INSERT INTO projects (id, name, created_at) VALUES (?, ?, ?)",
+                       (project_id, "bench", datetime.utcnow()))
+    connection.executemany("INSERT INTO sessions (id, project_id, total_images) VALUES (?, ?, ?)",
+                           [(sid, project_id, images // sessions) for sid in session_ids])
+
+    start_time = datetime(2024, 1, 1)
+    chunk = 50_000
+    for offset in range(0, images, chunk):
+        rows = []
+        for i in range(offset, min(images, offset + chunk)):
+            rows.append((
+                str(uuid.uuid4()), session_ids[i % sessions], project_id, f"/cards/{i:08d}.jpg",
+                i % 3 != 0, 1 if i % 3 != 0 else 0,
+                (start_time + timedelta(seconds=i)).isoformat(sep=" "),
+            ))
+        connection.executemany(
+            "INSERT INTO images (id, session_id, project_id, file_path, has_animal, animal_count, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+        )
+    animal_images = images - len(range(0, images, 3))
+    connection.execute(
+        "INSERT INTO stats_rollups (scope, scope_id, total_images, animal_images) VALUES ('project', ?, ?, ?)",
+        (project_id, images, animal_images)
+    )
+    connection.commit()
+    connection.execute("ANALYZE")
+    connection.close()
+    return project_id
+
+
+async def timed(call, repeat: int) -> float:
+    from app.utils.cache import invalidate_pattern
+
+    timings = []
+    for _ in range(repeat):
+        invalidate_pattern("project:*")
+        start = time.perf_counter()
+        await call()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", type=int, default=1_000_000)
+    parser.add_argument("--deep-page", type=int, default=10_000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--db", default=os.path.join(tempfile.gettempdir(), "trailguard-bench-pagination.db"))
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        os.remove(args.db)
+    os.environ["DATABASE_URL"] = f"sqlite:///{args.db}"
+
+    from app.routes.projects import get_project_results, _encode_cursor
+
+    start = time.perf_counter()
+    project_id = seed(args.db, args.images)
+    print(f"Seeded {args.images} images in {time.perf_counter() - start:.1f}s")
+
+    # Cursor positioned where OFFSET paging would start the deep page
+    connection = sqlite3.connect(args.db)
+    created_at, image_id = connection.execute(
+        "SELECT created_at, id FROM images WHERE project_id = ? AND has_animal = 1 "
+        "ORDER BY created_at DESC, id DESC LIMIT 1 OFFSET ?",
+        (project_id, (args.deep_page - 1) * args.limit - 1)
+    ).fetchone()
+    connection.close()
+    deep_cursor = _encode_cursor(datetime.fromisoformat(created_at), image_id)
+
+    scenarios = {
+        "offset page 1": lambda: get_project_results(project_id, page=1, limit=args.limit, cursor=None,
+                                                     species=None, start=None, end=None),
+        f"offset page {args.deep_page}": lambda: get_project_results(project_id, page=args.deep_page, limit=args.limit,
+                                                                     cursor=None, species=None, start=None, end=None),
+        "cursor page 1": lambda: get_project_results(project_id, page=1, limit=args.limit, cursor=None,
+                                                     species=None, start=None, end=None),
+        f"cursor page {args.deep_page}": lambda: get_project_results(project_id, page=1, limit=args.limit,
+                                                                     cursor=deep_cursor, species=None, start=None, end=None),
+    }
+    for name, call in scenarios.items():
+        print(f"{name:>22}: {await timed(call, args.repeat) * 1000:8.2f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,154 @@
+# benchmarks/bench_prefilter.py
+"""
+Skip rate and recall of the empty-frame prefilter (app/pipeline/prefilter.py).
+
+    python -m benchmarks.bench_prefilter --bursts 200
+    python -m benchmarks.bench_prefilter --images-dir /data/sample_cards --labels labels.csv \\
+        --detector models/animal_detector.pt
+
+--labels is a CSV of path,has_animal (1/0), paths relative to --images-dir; without
+it a synthetic sample is generated: bursts of frames with light changes and sensor
+noise, a share of them with an animal walking through or standing still.
+
+Static frames are skipped only when their burst's keyframe comes back empty. By
+default the labels stand in for the detector on keyframes, so recall measures the
+prefilter alone; with --detector the model decides, as in production.
+
+recall = animal frames that still reach the detector / all animal frames
+"""
+import argparse
+import csv
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from benchmarks.common import make_synthetic_image
+
+
+def make_bursts(out_dir: str, bursts: int, frames: int, animal_share: float, size=(1920, 1080),
+                seed: int = 0) -> dict:
+    """Write synthetic bursts with EXIF capture times; returns {path: has_animal}"""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    r = random.Random(seed)
+    width, height = size
+    start = datetime(2024, 5, 1, 6, 0, 0)
+    labels = {}
+    for burst in range(bursts):
+        background = np.asarray(make_synthetic_image(width, height, animals=0, seed=seed + burst), dtype=np.float32)
+        kind = "empty" if r.random() >= animal_share else r.choice(["walking", "walking", "standing"])
+        w, h = r.randint(width // 16, width // 5), r.randint(height // 16, height // 5)
+        x, y = r.randint(0, width - w), r.randint(height // 3, height - h)
+        step = r.choice([-1, 1]) * r.randint(w // 3, w)
+        for frame in range(frames):
+            pixels = background * r.uniform(0.85, 1.15) + rng.normal(0, 4, background.shape)
+            img = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8), "RGB")
+            has_animal = kind != "empty"
+            if has_animal:
+                fx = x + (step * frame if kind == "walking" else 0)
+                # Walking animals can leave the frame during the burst
+                has_animal = fx + w > 0 and fx < width
+                shade = r.randint(25, 70)
+                ImageDraw.Draw(img).ellipse([fx, y, fx + w, y + h], fill=(shade, shade - 10, shade // 2))
+            exif = Image.Exif()
+            exif[306] = (start + timedelta(minutes=10 * burst, seconds=frame)).strftime("%Y:%m:%d %H:%M:%S")
+            path = os.path.join(out_dir, f"burst{burst:04d}_{frame:02d}.jpg")
+            img.save(path, quality=90, exif=exif)
+            labels[path] = has_animal
+    return labels
+
+
+def read_labels(images_dir: str, labels_path: str) -> dict:
+    with open(labels_path, newline="") as f:
+        return {os.path.join(images_dir, row[0]): row[1].strip().lower() in ("1", "true", "yes")
+                for row in csv.reader(f) if row and row[0] != "path"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bursts", type=int, default=100)
+    parser.add_argument("--frames", type=int, default=3, help="Frames per synthetic burst")
+    parser.add_argument("--animal-share", type=float, default=0.3, help="Share of synthetic bursts with an animal")
+    parser.add_argument("--images-dir")
+    parser.add_argument("--labels")
+    parser.add_argument("--detector", help="Decide keyframes with this detector instead of the labels")
+    parser.add_argument("--min-change", default="0.0005,0.001,0.002,0.005",
+                        help="PREFILTER_MIN_CHANGE values to compare")
+    parser.add_argument("--pixel-threshold", type=float)
+    parser.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "trailguard-bench"))
+    args = parser.parse_args()
+
+    from app.pipeline.decode import decode_for_detection, read_capture_time
+    from app.pipeline.prefilter import PREFILTER_PIXEL_THRESHOLD, BurstGrouper, changed_fractions, thumbnail
+
+    if args.labels:
+        labels = read_labels(args.images_dir, args.labels)
+    else:
+        out_dir = os.path.join(args.work_dir, f"bursts_{args.bursts}x{args.frames}_{args.animal_share}")
+        labels = make_bursts(out_dir, args.bursts, args.frames, args.animal_share)
+    paths = sorted(labels)
+    pixel_threshold = args.pixel_threshold if args.pixel_threshold is not None else PREFILTER_PIXEL_THRESHOLD
+
+    detector = None
+    if args.detector:
+        from app.pipeline.image_processor import ImageProcessor
+        detector = ImageProcessor(args.detector, "")
+
+    # Thumbnails and burst background differences once, thresholds compared afterwards
+    grouper = BurstGrouper()
+    bursts, images = [], {}
+    prefilter_seconds = 0.0
+    for path in paths:
+        with open(path, "rb") as f:
+            content = f.read()
+        image = decode_for_detection(content)
+        start = time.perf_counter()
+        frame = {"path": path, "thumbnail": thumbnail(image.pixels)}
+        prefilter_seconds += time.perf_counter() - start
+        if detector is not None:
+            images[path] = image
+        bursts.extend(grouper.add(frame, os.path.dirname(path), read_capture_time(path)))
+    bursts.extend(grouper.flush())
+
+    start = time.perf_counter()
+    for burst in bursts:
+        fractions = changed_fractions([frame["thumbnail"] for frame in burst], pixel_threshold) \
+            if len(burst) > 1 else np.ones(1)
+        for frame, fraction in zip(burst, fractions):
+            frame["change"] = float(fraction)
+    prefilter_seconds += time.perf_counter() - start
+
+    keyframe_cache = {}
+
+    def keyframe_empty(path: str) -> bool:
+        if detector is None:
+            return not labels[path]
+        if path not in keyframe_cache:
+            result, _ = detector.detect_batch_sync([images[path]])[0]
+            keyframe_cache[path] = result.get("status") == "no_animal_detected"
+        return keyframe_cache[path]
+
+    animal_frames = sum(labels.values())
+    print(f"{len(paths)} frames in {len(bursts)} bursts, {animal_frames} with an animal, "
+          f"pixel threshold {pixel_threshold}, prefilter {prefilter_seconds / len(paths) * 1000:.2f} ms/frame")
+    print(f"{'min change':>10} {'skip rate':>10} {'empty skipped':>14} {'recall':>8} {'missed':>7}")
+    for min_change in (float(value) for value in args.min_change.split(",")):
+        skipped = set()
+        for burst in bursts:
+            static = [frame["path"] for frame in burst if frame["change"] <= min_change]
+            if len(static) > 1 and keyframe_empty(static[0]):
+                skipped.update(static[1:])
+        missed = sum(labels[path] for path in skipped)
+        empty_frames = len(paths) - animal_frames
+        print(f"{min_change:>10} {len(skipped) / len(paths):>10.1%} "
+              f"{(len(skipped) - missed) / max(empty_frames, 1):>14.1%} "
+              f"{1 - missed / max(animal_frames, 1):>8.3f} {missed:>7}")
+
+
+if __name__ == "__main__":
+    main()
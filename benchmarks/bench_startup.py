@@ -0,0 +1,134 @@
+# benchmarks/bench_startup.py
+"""
+Cold start of the API: time until /health answers, until /ready turns true, and the
+latency of the first requests after that, with and without the warm-up pass.
+
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --detector models/animal_detector.pt \\
+        --classifier models/species_classifier.pt --runs 3
+
+Each run starts a fresh uvicorn process. "steady" is the median of the requests
+that follow the first one of each frame size.
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+from benchmarks.common import make_random_weights, make_synthetic_images, multipart_body
+
+MODES = {"warmup": None, "no-warmup": ""}  # WARMUP_SIZES (None = default)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _get(url: str):
+    """(status, json body) or (None, None) while the server is not listening"""
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+    except OSError:
+        return None, None
+
+
+def _post_image(url: str, path: str) -> float:
+    """Upload path to /api/analyze/single; seconds until the response arrived"""
+    body, content_type = multipart_body(path)
+    request = urllib.request.Request(url, data=body, headers={"Content-Type": content_type})
+    start = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=300) as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+def run_once(env: dict, image_sets: list, requests: int) -> dict:
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port)],
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        live = ready = None
+        while ready is None:
+            if server.poll() is not None:
+                raise RuntimeError("API process exited during startup")
+            status, _ = _get(f"{base}/health")
+            if status == 200 and live is None:
+                live = time.perf_counter() - start
+            status, body = _get(f"{base}/ready")
+            if status == 200:
+                ready = time.perf_counter() - start
+                timings = body["timings"]
+            elif body and body.get("phase") == "failed":
+                raise RuntimeError(f"Startup failed: {body['error']}")
+            time.sleep(0.05)
+
+        first, steady = [], []
+        for paths in image_sets:
+            latencies = [_post_image(f"{base}/api/analyze/single", path) for path in paths[:requests]]
+            first.append(latencies[0])
+            steady.extend(latencies[1:])
+        return {"live": live, "ready": ready, "first": first,
+                "steady": statistics.median(steady) if steady else None, "timings": timings}
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--requests", type=int, default=5, help="Requests per frame size after startup")
+    parser.add_argument("--sizes", default="1920x1080,2048x1536", help="Frame sizes of the first requests")
+    parser.add_argument("--detector")
+    parser.add_argument("--classifier")
+    parser.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "trailguard-bench"))
+    args = parser.parse_args()
+
+    detector, classifier = args.detector, args.classifier
+    if detector is None:
+        detector, classifier = make_random_weights(os.path.join(args.work_dir, "weights"))
+    sizes = [tuple(map(int, size.split("x"))) for size in args.sizes.split(",")]
+    # Distinct images per request, so the result cache never answers
+    image_sets = [make_synthetic_images(os.path.join(args.work_dir, "images"), args.requests * args.runs, size,
+                                        seed=1000 * index) for index, size in enumerate(sizes)]
+
+    print(f"{'mode':>10} {'live s':>7} {'ready s':>8} " + " ".join(f"{'1st ' + s:>15}" for s in args.sizes.split(","))
+          + f" {'steady ms':>10}")
+    for mode, warmup_sizes in MODES.items():
+        for run in range(args.runs):
+            run_dir = tempfile.mkdtemp(dir=args.work_dir)
+            env = {
+                **os.environ,
+                "DETECTOR_PATH": detector,
+                "CLASSIFIER_PATH": classifier or "",
+                "MODEL_REGISTRY_PATH": os.path.join(run_dir, "registry.json"),
+                "DATABASE_URL": f"sqlite:///{os.path.join(run_dir, 'bench.db')}",
+                "JOBS_INLINE_WORKERS": "0",
+                "PYTHONPATH": os.pathsep.join(filter(None, [os.getcwd(), os.environ.get("PYTHONPATH")])),
+            }
+            if warmup_sizes is not None:
+                env["WARMUP_SIZES"] = warmup_sizes
+            offset = run * args.requests
+            report = run_once(env, [paths[offset:offset + args.requests] for paths in image_sets], args.requests)
+            first = " ".join(f"{seconds * 1000:>12.0f} ms" for seconds in report["first"])
+            steady = f"{report['steady'] * 1000:>10.0f}" if report["steady"] is not None else f"{'n/a':>10}"
+            print(f"{mode:>10} {report['live']:>7.2f} {report['ready']:>8.2f} {first} {steady}")
+            print(f"{'':>10} phases: {report['timings']}")
+
+
+if __name__ == "__main__":
+    main()
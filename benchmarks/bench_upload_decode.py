@@ -0,0 +1,115 @@
+# benchmarks/bench_upload_decode.py
+"""
+Per-format cost of turning an upload into model input: the old temp-file path
+(write upload, PIL convert, re-encode JPEG q95, read back for YOLO and again for
+cropping), decoding the bytes once in memory at full resolution, and the reduced
+decode the detector gets now (JPEG DCT scaling, see DETECT_DECODE_SIZE). For JPEG
+also the cost of the crops when a box is found: small boxes need a full decode,
+large ones are cut from a 1/2-1/8 scale decode.
+
+    python -m benchmarks.bench_upload_decode --size 4000x3000 --repeat 10
+
+Peak allocation is measured with tracemalloc, which sees numpy/OpenCV output
+arrays but not PIL's internal buffers.
+"""
+import argparse
+import io
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+import cv2
+from PIL import Image
+
+from app.pipeline.decode import decode_for_detection, decode_image_bytes
+from benchmarks.common import make_synthetic_image
+
+FORMATS = {"png": "PNG", "webp": "WEBP", "tiff": "TIFF", "bmp": "BMP", "jpg": "JPEG"}
+
+
+def legacy_temp_file_path(content: bytes, file_ext: str, temp_dir: str):
+    """What /api/analyze/single did before: temp file, JPEG re-encode, two disk reads"""
+    temp_path = os.path.join(temp_dir, f"{uuid.uuid4()}_upload{file_ext}")
+    processing_path = temp_path
+    try:
+        with open(temp_path, "wb") as buffer:
+            buffer.write(content)
+
+        if file_ext not in ('.jpg', '.jpeg'):
+            img = Image.open(temp_path)
+            if img.mode in ('RGBA', 'LA', 'P'):
+                background = Image.new('RGB', img.size, (255, 255, 255))
+                background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
+                img = background
+            elif img.mode != 'RGB':
+                img = img.convert('RGB')
+            processing_path = os.path.join(temp_dir, f"{uuid.uuid4()}_converted.jpg")
+            img.save(processing_path, 'JPEG', quality=95)
+
+        # The detector read the file, then process_image read it again for cropping
+        detector_input = cv2.imread(processing_path)
+        crop_source = cv2.imread(processing_path)
+        return detector_input, crop_source
+    finally:
+        for path in {temp_path, processing_path}:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def measure(fn, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(timings), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", default="4000x3000")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--alpha", action="store_true", help="Encode lossless formats with an alpha channel")
+    args = parser.parse_args()
+
+    width, height = map(int, args.size.split("x"))
+    frame = make_synthetic_image(width, height, animals=2)
+
+    print(f"{'format':>6} {'bytes':>10} {'legacy ms':>10} {'in-mem ms':>10} {'reduced ms':>11} "
+          f"{'legacy peak MB':>15} {'in-mem peak MB':>15} {'reduced peak MB':>16}")
+    jpeg = None
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for ext, pil_format in FORMATS.items():
+            img = frame.convert("RGBA") if args.alpha and ext in ("png", "webp", "tiff") else frame
+            encoded = io.BytesIO()
+            img.save(encoded, pil_format, **({"quality": 90} if pil_format in ("JPEG", "WEBP") else {}))
+            content = encoded.getvalue()
+
+            legacy_time, legacy_peak = measure(lambda: legacy_temp_file_path(content, f".{ext}", temp_dir), args.repeat)
+            new_time, new_peak = measure(lambda: decode_image_bytes(content), args.repeat)
+            reduced_time, reduced_peak = measure(lambda: decode_for_detection(content), args.repeat)
+            if ext == "jpg":
+                jpeg = content
+
+            print(f"{ext:>6} {len(content):>10} {legacy_time * 1000:>10.1f} {new_time * 1000:>10.1f} "
+                  f"{reduced_time * 1000:>11.1f} {legacy_peak / 2 ** 20:>15.1f} {new_peak / 2 ** 20:>15.1f} "
+                  f"{reduced_peak / 2 ** 20:>16.1f}")
+
+    print(f"\n{'jpg crops':>16} {'ms':>8} {'peak MB':>8}")
+    frame = decode_for_detection(jpeg)
+    for name, side in (("small box", width // 20), ("large box", width // 3)):
+        box = (width // 2, height // 2, width // 2 + side, height // 2 + side)
+        crop_time, crop_peak = measure(lambda: frame.crops([box]), args.repeat)
+        print(f"{name:>16} {crop_time * 1000:>8.1f} {crop_peak / 2 ** 20:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# benchmarks/bench_worker_memory.py
+"""
+Memory per API worker with models loaded in every worker vs one model server per node
+(INFERENCE_SERVER_SOCKET, see app/pipeline/model_server.py).
+
+    python -m benchmarks.bench_worker_memory --workers 4
+    python -m benchmarks.bench_worker_memory --workers 8 --detector models/animal_detector.pt \\
+        --classifier models/species_classifier.pt
+
+Each worker imports app.main and analyses a few images, like a warmed-up uvicorn
+worker; all workers stay alive while they are measured. RSS counts shared pages in
+every process, PSS splits them between the processes sharing them, so the PSS total
+is what the node actually spends.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.common import make_random_weights, make_synthetic_images
+
+
+def memory_mb(pid: int) -> dict:
+    """RSS and PSS of a process in MB (Linux /proc)"""
+    with open(f"/proc/{pid}/status") as f:
+        rss = next(int(line.split()[1]) for line in f if line.startswith("VmRSS:"))
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        pss = next(int(line.split()[1]) for line in f if line.startswith("Pss:"))
+    return {"rss": rss / 1024, "pss": pss / 1024}
+
+
+def run_child(image_paths: list):
+    """A worker: import the app, analyse the images, report ready and wait to be measured"""
+    import app.main  # noqa: F401  (everything a uvicorn worker imports)
+    from app.pipeline.decode import decode_for_detection
+    from app.pipeline.image_processor import image_processor_singleton
+
+    async def analyse():
+        processor = image_processor_singleton()
+        for path in image_paths:
+            with open(path, "rb") as f:
+                data = f.read()
+            await processor.process_image(decode_for_detection(data), wait=True, image_bytes=data)
+
+    asyncio.run(analyse())
+    print("ready", flush=True)
+    sys.stdin.read()
+
+
+def _wait_for_socket(path: str, process: subprocess.Popen, timeout: float = 300):
+    deadline = time.monotonic() + timeout
+    while not os.path.exists(path):
+        if process.poll() is not None or time.monotonic() > deadline:
+            raise RuntimeError("Model server did not start")
+        time.sleep(0.2)
+
+
+def measure(mode: str, workers: int, image_paths: list, env: dict, work_dir: str) -> dict:
+    env = dict(env)
+    server = None
+    if mode == "model-server":
+        socket_path = os.path.join(work_dir, "models.sock")
+        env["INFERENCE_SERVER_SOCKET"] = socket_path
+        server = subprocess.Popen([sys.executable, "-m", "app.pipeline.model_server", "--socket", socket_path],
+                                  env=env, stdout=subprocess.DEVNULL)
+        _wait_for_socket(socket_path, server)
+
+    children = [
+        subprocess.Popen([sys.executable, "-m", "benchmarks.bench_worker_memory", "--child", *image_paths],
+                         env=env, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        for _ in range(workers)
+    ]
+    try:
+        for child in children:
+            # Skip the model loading messages
+            if "ready\n" not in iter(child.stdout.readline, ""):
+                raise RuntimeError(f"Worker {child.pid} failed")
+        report = {"workers": [memory_mb(child.pid) for child in children]}
+        report["server"] = memory_mb(server.pid) if server else None
+    finally:
+        for child in children:
+            child.stdin.close()
+            child.wait()
+        if server:
+            server.terminate()
+            server.wait()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--images", type=int, default=4, help="Images analysed by each worker before measuring")
+    parser.add_argument("--detector")
+    parser.add_argument("--classifier")
+    parser.add_argument("--json", action="store_true", help="Print the raw report as JSON")
+    parser.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "trailguard-bench"))
+    parser.add_argument("--child", nargs="*", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        run_child(args.child)
+        return
+
+    detector, classifier = args.detector, args.classifier
+    if detector is None:
+        detector, classifier = make_random_weights(os.path.join(args.work_dir, "weights"))
+    image_paths = make_synthetic_images(os.path.join(args.work_dir, "images"), args.images)
+    run_dir = tempfile.mkdtemp(dir=args.work_dir)
+    env = {
+        **os.environ,
+        "DETECTOR_PATH": detector,
+        "CLASSIFIER_PATH": classifier or "",
+        "MODEL_REGISTRY_PATH": os.path.join(run_dir, "registry.json"),
+        "DATABASE_URL": f"sqlite:///{os.path.join(run_dir, 'bench.db')}",
+        "JOBS_INLINE_WORKERS": "0",
+        "PYTHONPATH": os.pathsep.join(filter(None, [os.getcwd(), os.environ.get("PYTHONPATH")])),
+    }
+    env.pop("INFERENCE_SERVER_SOCKET", None)
+
+    reports = {mode: measure(mode, args.workers, image_paths, env, run_dir)
+               for mode in ("in-process", "model-server")}
+    if args.json:
+        print(json.dumps(reports, indent=2))
+        return
+
+    print(f"{args.workers} workers, {args.images} images each (MB)")
+    print(f"{'mode':>13} {'RSS/worker':>11} {'PSS/worker':>11} {'server PSS':>11} {'node PSS':>9}")
+    for mode, report in reports.items():
+        workers = report["workers"]
+        rss = sum(w["rss"] for w in workers) / len(workers)
+        pss = sum(w["pss"] for w in workers) / len(workers)
+        server_pss = report["server"]["pss"] if report["server"] else 0.0
+        total = sum(w["pss"] for w in workers) + server_pss
+        print(f"{mode:>13} {rss:>11.1f} {pss:>11.1f} {server_pss:>11.1f} {total:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+# benchmarks/common.py
+"""Shared helpers for the offline benchmarks (synthetic data, tiny models, stats, HTTP)"""
+import asyncio
+import math
+import mimetypes
+import os
+import random
+import uuid
+from typing import List, Tuple
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+
+def make_synthetic_image(width: int = 1920, height: int = 1080, animals: int = 1,
+                         seed: int = 0) -> Image.Image:
+    """Camera-trap-like frame: vegetation-ish noisy background with a few dark blobs"""
+    rng = np.random.default_rng(seed)
+    base = np.linspace(60, 140, height, dtype=np.float32)[:, None, None]
+    noise = rng.normal(0, 18, size=(height, width, 3)).astype(np.float32)
+    tint = np.array([0.8, 1.0, 0.7], dtype=np.float32)
+    pixels = np.clip(base * tint + noise, 0, 255).astype(np.uint8)
+
+    img = Image.fromarray(pixels, "RGB")
+    draw = ImageDraw.Draw(img)
+    r = random.Random(seed)
+    for _ in range(animals):
+        w = r.randint(width // 12, width // 4)
+        h = r.randint(height // 12, height // 4)
+        x = r.randint(0, width - w)
+        y = r.randint(height // 3, height - h)
+        shade = r.randint(20, 90)
+        draw.ellipse([x, y, x + w, y + h], fill=(shade, shade - 10, shade // 2))
+    return img
+
+
+def make_synthetic_images(out_dir: str, count: int, size: Tuple[int, int] = (1920, 1080),
+                          fmt: str = "jpg", animals: int = 1, seed: int = 0) -> List[str]:
+    """Write count synthetic frames to out_dir and return their paths"""
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = os.path.join(out_dir, f"synthetic_{size[0]}x{size[1]}_{animals}_{i:05d}.{fmt}")
+        if not os.path.exists(path):
+            img = make_synthetic_image(size[0], size[1], animals=animals, seed=seed + i)
+            if fmt in ("png", "webp", "tiff") and i % 2:
+                # Exercise the alpha-flattening path on half of the non-JPEG files
+                img = img.convert("RGBA")
+            if fmt in ("jpg", "jpeg", "webp"):
+                img.save(path, quality=90)
+            else:
+                img.save(path)
+        paths.append(path)
+    return paths
+
+
+def make_random_weights(out_dir: str, detector_cfg: str = "yolov8n.yaml",
+                        classifier_cfg: str = "yolov8n-cls.yaml") -> Tuple[str, str]:
+    """
+    Build randomly initialised YOLO detector/classifier checkpoints from the
+    ultralytics model configs, so benchmarks never need to download weights.
+    """
+    import torch
+    from ultralytics import YOLO
+
+    # Same weights on every machine, so runs stay comparable
+    torch.manual_seed(0)
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for cfg in (detector_cfg, classifier_cfg):
+        path = os.path.join(out_dir, os.path.splitext(cfg)[0] + "-random.pt")
+        if not os.path.exists(path):
+            model = YOLO(cfg).model
+            torch.save({"model": model, "train_args": {}}, path)
+        paths.append(path)
+    return paths[0], paths[1]
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile, values in any order"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = math.ceil(p / 100 * len(ordered))
+    return ordered[min(len(ordered), max(1, rank)) - 1]
+
+
+def multipart_body(path: str, field: str = "file") -> Tuple[bytes, str]:
+    """(body, content type) of a multipart/form-data upload of one file"""
+    boundary = uuid.uuid4().hex
+    content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    with open(path, "rb") as f:
+        content = f.read()
+    body = (f"--{boundary}\r\nContent-Disposition: form-data; name=\"{field}\"; "
+            f"filename=\"{os.path.basename(path)}\"\r\nContent-Type: {content_type}\r\n\r\n").encode() \
+        + content + f"\r\n--{boundary}--\r\n".encode()
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+async def asgi_request(app, method: str, url: str, body: bytes = b"", content_type: str = None) -> Tuple[int, bytes]:
+    """One request straight into an ASGI app, no server or socket in between: (status, body)"""
+    path, _, query = url.partition("?")
+    headers = [(b"host", b"bench"), (b"content-length", str(len(body)).encode())]
+    if content_type:
+        headers.append((b"content-type", content_type.encode()))
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+        "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+        "root_path": "", "headers": headers, "client": ("127.0.0.1", 0), "server": ("bench", 80),
+    }
+    sent = False
+    status, chunks = None, []
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        # The client never disconnects
+        await asyncio.Event().wait()
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return status, b"".join(chunks)
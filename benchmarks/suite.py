@@ -0,0 +1,424 @@
+# benchmarks/suite.py
+"""
+Offline benchmark suite for the detection pipeline and the API, one JSON report per run.
+
+    python -m benchmarks.suite --output before.json
+    python -m benchmarks.suite --output after.json --compare before.json
+    python -m benchmarks.suite --scenarios single,http --quick
+    python -m benchmarks.suite --report after.json --compare before.json   # compare only
+
+CPU-only and no network: synthetic camera-trap frames at several resolutions and
+formats, randomly initialised YOLO weights (seeded) unless --detector/--classifier
+are given, and a throwaway SQLite database. Scenarios:
+
+- single: sequential decode + ImageProcessor latency per resolution and format
+- batch: BatchProcessor.stream_batch throughput, stored into SQLite
+- multi_animal: latency by number of animals drawn into the frame
+- results: GET /api/projects/{id}/results on a seeded database (first page, deep
+  OFFSET page, keyset cursor, API cache hit)
+- http: concurrent POST /api/analyze/single clients, straight into the ASGI app
+
+Every scenario also reports the median of each pipeline stage (result timings, see
+app/utils/metrics.py). The result cache is off, so repeated frames are inferred again.
+Random weights rarely produce boxes at the default confidence; --conf 0.001 makes
+them, so crop/classify are exercised too.
+
+--compare prints the change of every *_ms (lower is better) and *_per_s (higher is
+better) value and exits with 1 when one got worse by more than --threshold percent.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from benchmarks.common import (
+    asgi_request, make_random_weights, make_synthetic_images, multipart_body, percentile
+)
+
+SCENARIOS = ("single", "batch", "multi_animal", "results", "http")
+
+
+def _latency_stats(latencies: list) -> dict:
+    return {
+        "n": len(latencies),
+        "mean_ms": round(statistics.mean(latencies) * 1000, 3) if latencies else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+class _StageTimings:
+    """Collects result["timings"] of many images, reports the median per stage"""
+
+    def __init__(self):
+        self.values = defaultdict(list)
+
+    def add(self, timings: dict):
+        for stage, seconds in (timings or {}).items():
+            self.values[stage].append(seconds)
+
+    def medians(self) -> dict:
+        return {f"{stage}_ms": round(statistics.median(values) * 1000, 3) for stage, values in self.values.items()}
+
+
+def _git(*args) -> str:
+    try:
+        return subprocess.run(["git", *args], capture_output=True, text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def _environment(args, weights: str) -> dict:
+    versions = {}
+    for module in ("torch", "ultralytics", "cv2", "numpy", "PIL", "fastapi", "sqlalchemy"):
+        try:
+            versions[module] = getattr(__import__(module), "__version__", None)
+        except ImportError:
+            versions[module] = None
+    threads = None
+    if versions["torch"]:
+        import torch
+        threads = torch.get_num_threads()
+    return {
+        "commit": _git("rev-parse", "--short", "HEAD") or None,
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "started_at": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "torch_threads": threads,
+        "versions": versions,
+        "weights": weights,
+        "args": vars(args),
+    }
+
+
+async def bench_single(processor, args) -> dict:
+    """Sequential requests: decode of the upload bytes + both model stages"""
+    from app.pipeline.decode import decode_for_detection
+
+    report = {}
+    for size in args.sizes:
+        for fmt in args.formats:
+            paths = make_synthetic_images(os.path.join(args.work_dir, "images", fmt), args.images + 1, size, fmt=fmt,
+                                          seed=100)
+            stages = _StageTimings()
+            latencies = []
+            for index, path in enumerate(paths):
+                with open(path, "rb") as f:
+                    content = f.read()
+                start = time.perf_counter()
+                image = await asyncio.to_thread(decode_for_detection, content)
+                decoded = time.perf_counter()
+                result = await processor.process_image(image, wait=True)
+                if index == 0:
+                    continue  # first frame of a shape pays for lazy initialisation
+                latencies.append(time.perf_counter() - start)
+                stages.add({"decode": decoded - start, **result.get("timings", {})})
+            report[f"{size[0]}x{size[1]}.{fmt}"] = {**_latency_stats(latencies), "stages": stages.medians()}
+            print(f"  single {size[0]}x{size[1]}.{fmt}: p50 {report[f'{size[0]}x{size[1]}.{fmt}']['p50_ms']:.1f} ms")
+    return report
+
+
+async def bench_batch(args) -> dict:
+    """One batch import through the staged pipeline, rows written to SQLite"""
+    from app.db.ingest import get_or_create_session
+    from app.db.models import Project
+    from app.db.session import get_db_session
+    from app.pipeline.batch_processor import batch_processor_singleton
+
+    with get_db_session() as db:
+        project = Project(name="bench-batch")
+        db.add(project)
+        db.flush()
+        project_id = project.id
+    session_id = get_or_create_session(project_id)
+
+    size = args.sizes[min(1, len(args.sizes) - 1)]
+    paths = make_synthetic_images(os.path.join(args.work_dir, "images", "batch"), args.batch_images, size, seed=200)
+    stages = _StageTimings()
+    statuses = defaultdict(int)
+    start = time.perf_counter()
+    async for record in batch_processor_singleton().stream_batch(paths, project_id, session_id):
+        stages.add(record["result"].get("timings"))
+        statuses[record["result"].get("status")] += 1
+    elapsed = time.perf_counter() - start
+    print(f"  batch {len(paths)} x {size[0]}x{size[1]}: {len(paths) / elapsed:.1f} img/s")
+    return {
+        "images": len(paths),
+        "size": f"{size[0]}x{size[1]}",
+        "seconds": round(elapsed, 3),
+        "images_per_s": round(len(paths) / elapsed, 3),
+        "statuses": dict(statuses),
+        "stages": stages.medians(),
+    }
+
+
+async def bench_multi_animal(processor, args) -> dict:
+    """Latency by number of animals in the frame (crops and classifier work grow with detections)"""
+    from app.pipeline.decode import decode_for_detection
+
+    report = {}
+    size = args.sizes[min(1, len(args.sizes) - 1)]
+    for animals in args.animals:
+        paths = make_synthetic_images(os.path.join(args.work_dir, "images", "animals"), args.images + 1, size,
+                                      animals=animals, seed=300)
+        stages = _StageTimings()
+        latencies, detections = [], []
+        for index, path in enumerate(paths):
+            with open(path, "rb") as f:
+                content = f.read()
+            start = time.perf_counter()
+            result = await processor.process_image(await asyncio.to_thread(decode_for_detection, content), wait=True)
+            if index == 0:
+                continue
+            latencies.append(time.perf_counter() - start)
+            detections.append(result.get("animals_detected", 0))
+            stages.add(result.get("timings"))
+        report[f"animals_{animals}"] = {
+            **_latency_stats(latencies),
+            "mean_detections": round(statistics.mean(detections), 2),
+            "stages": stages.medians(),
+        }
+        print(f"  multi_animal {animals}: p50 {report[f'animals_{animals}']['p50_ms']:.1f} ms, "
+              f"{report[f'animals_{animals}']['mean_detections']} detections")
+    return report
+
+
+async def bench_results(app, args) -> dict:
+    """Results endpoint on a seeded database, through the ASGI app"""
+    from app.utils.cache import invalidate_pattern
+    from benchmarks.bench_pagination import seed
+
+    start = time.perf_counter()
+    project_id = seed(args.db_path, args.seed_images)
+    print(f"  seeded {args.seed_images} images in {time.perf_counter() - start:.1f}s")
+    limit = 50
+    # Deepest page that still exists
+    deep_page = max(1, min(1000, args.seed_images * 2 // 3 // limit))
+
+    async def get(url: str, cold: bool = True) -> tuple:
+        if cold:
+            invalidate_pattern("project:*")
+        start = time.perf_counter()
+        status, body = await asgi_request(app, "GET", url)
+        if status != 200:
+            raise RuntimeError(f"GET {url}: {status} {body[:200]!r}")
+        return time.perf_counter() - start, json.loads(body)
+
+    base = f"/api/projects/{project_id}/results?limit={limit}"
+    cases = {"first_page": [], "deep_offset_page": [], "cursor_page": [], "cached_page": []}
+    for _ in range(args.repeat):
+        seconds, first = await get(base)
+        cases["first_page"].append(seconds)
+        cases["deep_offset_page"].append((await get(f"{base}&page={deep_page}"))[0])
+        # Keyset pages a few pages in
+        cursor = first["data"]["pagination"]["next_cursor"] if "data" in first else first["pagination"]["next_cursor"]
+        for _ in range(3):
+            seconds, page = await get(f"{base}&cursor={cursor}")
+            cases["cursor_page"].append(seconds)
+            pagination = (page.get("data") or page)["pagination"]
+            cursor = pagination["next_cursor"]
+        await get(base)
+        cases["cached_page"].append((await get(base, cold=False))[0])
+
+    report = {"seeded_images": args.seed_images, "deep_page": deep_page}
+    for name, latencies in cases.items():
+        report[name] = _latency_stats(latencies)
+        print(f"  results {name}: p50 {report[name]['p50_ms']:.2f} ms")
+    return report
+
+
+async def bench_http(app, args) -> dict:
+    """Closed-loop clients uploading frames to /api/analyze/single at several concurrency levels"""
+    size = args.sizes[min(1, len(args.sizes) - 1)]
+    paths = make_synthetic_images(os.path.join(args.work_dir, "images", "http"), args.http_requests, size, seed=400)
+    uploads = [multipart_body(path) for path in paths]
+
+    report = {}
+    for concurrency in args.concurrency:
+        queue = list(uploads)
+        latencies, statuses = [], defaultdict(int)
+        stages = _StageTimings()
+
+        async def client():
+            while queue:
+                body, content_type = queue.pop()
+                start = time.perf_counter()
+                status, response = await asgi_request(app, "POST", "/api/analyze/single", body, content_type)
+                latencies.append(time.perf_counter() - start)
+                statuses[status] += 1
+                if status == 200:
+                    stages.add(json.loads(response).get("data", {}).get("timings"))
+
+        start = time.perf_counter()
+        await asyncio.gather(*[client() for _ in range(concurrency)])
+        elapsed = time.perf_counter() - start
+        report[f"concurrency_{concurrency}"] = {
+            **_latency_stats(latencies),
+            "requests_per_s": round(len(latencies) / elapsed, 3),
+            "statuses": {str(status): count for status, count in statuses.items()},
+            "stages": stages.medians(),
+        }
+        print(f"  http x{concurrency}: {len(latencies) / elapsed:.1f} req/s, p99 {percentile(latencies, 99) * 1000:.0f} ms, "
+              f"statuses {dict(statuses)}")
+    return report
+
+
+def _flatten(report: dict, prefix: str = "") -> dict:
+    values = {}
+    for key, value in report.items():
+        if isinstance(value, dict):
+            values.update(_flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[f"{prefix}{key}"] = value
+    return values
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> bool:
+    """Print the change of every comparable value; True if something regressed beyond threshold (%)"""
+    old, new = _flatten(baseline["scenarios"]), _flatten(current["scenarios"])
+    print(f"\nBaseline {baseline['environment'].get('commit')} -> {current['environment'].get('commit')}"
+          f"{' (dirty)' if current['environment'].get('dirty') else ''}")
+    regressed = False
+    for key in sorted(old.keys() & new.keys()):
+        lower_is_better = key.endswith("_ms")
+        if not (lower_is_better or key.endswith("_per_s")) or not old[key]:
+            continue
+        change = (new[key] - old[key]) / old[key] * 100
+        worse = change > threshold if lower_is_better else change < -threshold
+        regressed |= worse
+        print(f"{'⚠️' if worse else '  '} {key:<60} {old[key]:>10.2f} {new[key]:>10.2f} {change:>+8.1f}%")
+    return regressed
+
+
+async def run(args) -> dict:
+    from app.main import app
+    from app.pipeline.image_processor import image_processor_singleton
+    from app.utils.startup import startup_tracker_singleton
+
+    scenarios = {}
+    # The app's own startup and shutdown: tables, model load and warm-up
+    async with app.router.lifespan_context(app):
+        tracker = startup_tracker_singleton()
+        while not tracker.ready:
+            if tracker.phase == "failed":
+                raise RuntimeError(f"Startup failed: {tracker.error}")
+            await asyncio.sleep(0.05)
+        processor = image_processor_singleton()
+
+        for name in args.scenarios:
+            print(f"{name}:")
+            if name == "single":
+                scenarios[name] = await bench_single(processor, args)
+            elif name == "batch":
+                scenarios[name] = await bench_batch(args)
+            elif name == "multi_animal":
+                scenarios[name] = await bench_multi_animal(processor, args)
+            elif name == "results":
+                scenarios[name] = await bench_results(app, args)
+            elif name == "http":
+                scenarios[name] = await bench_http(app, args)
+    return {"startup": tracker.timings, **scenarios}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--quick", action="store_true", help="Fewer and smaller frames, a smaller database")
+    parser.add_argument("--sizes", help="Frame sizes (default 640x480,1920x1080,4000x3000)")
+    parser.add_argument("--formats", default="jpg,png,webp")
+    parser.add_argument("--images", type=int, help="Timed frames per size/format and per animal count (default 20)")
+    parser.add_argument("--animals", default="0,1,4,12")
+    parser.add_argument("--batch-images", type=int, help="Frames of the batch scenario (default 200)")
+    parser.add_argument("--seed-images", type=int, help="Images seeded for the results scenario (default 100000)")
+    parser.add_argument("--http-requests", type=int, help="Uploads per concurrency level (default 64)")
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--conf", type=float, help="Detector confidence (DETECTION_CONFIDENCE)")
+    parser.add_argument("--threads", type=int, help="torch/OpenCV threads, pin for comparable runs")
+    parser.add_argument("--detector")
+    parser.add_argument("--classifier")
+    parser.add_argument("--output", help="JSON report path (default in --work-dir, named after the commit)")
+    parser.add_argument("--compare", help="Baseline JSON report to compare against")
+    parser.add_argument("--report", help="With --compare: compare this report instead of running")
+    parser.add_argument("--threshold", type=float, default=10.0, help="Regression threshold in percent")
+    parser.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "trailguard-bench"))
+    args = parser.parse_args()
+
+    if args.report:
+        if not args.compare:
+            parser.error("--report needs --compare")
+        with open(args.compare) as f, open(args.report) as g:
+            sys.exit(1 if compare(json.load(f), json.load(g), args.threshold) else 0)
+
+    quick = args.quick
+    args.scenarios = [name for name in args.scenarios.split(",") if name]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    args.sizes = [tuple(map(int, size.split("x"))) for size in
+                  (args.sizes or ("640x480,1920x1080" if quick else "640x480,1920x1080,4000x3000")).split(",")]
+    args.formats = args.formats.split(",")
+    args.animals = [int(count) for count in args.animals.split(",")]
+    args.concurrency = [int(count) for count in args.concurrency.split(",")]
+    args.images = args.images or (5 if quick else 20)
+    args.batch_images = args.batch_images or (32 if quick else 200)
+    args.seed_images = args.seed_images or (10_000 if quick else 100_000)
+    args.http_requests = args.http_requests or (16 if quick else 64)
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    detector, classifier = args.detector, args.classifier
+    weights = "given"
+    if detector is None:
+        detector, classifier = make_random_weights(os.path.join(args.work_dir, "weights"))
+        weights = "random"
+
+    # A throwaway database and registry; nothing cached between runs or shared with other processes
+    run_dir = tempfile.mkdtemp(dir=args.work_dir)
+    args.db_path = os.path.join(run_dir, "bench.db")
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{args.db_path}",
+        "MODEL_REGISTRY_PATH": os.path.join(run_dir, "registry.json"),
+        "DETECTOR_PATH": detector,
+        "CLASSIFIER_PATH": classifier or "",
+        "RESULT_CACHE_SIZE": "0",
+        "JOBS_INLINE_WORKERS": "0",
+    })
+    for name in ("RESULT_CACHE_PATH", "INFERENCE_SERVER_SOCKET", "REDIS_URL"):
+        os.environ.pop(name, None)
+    if args.conf is not None:
+        os.environ["DETECTION_CONFIDENCE"] = str(args.conf)
+    if args.threads:
+        import cv2
+        import torch
+        torch.set_num_threads(args.threads)
+        cv2.setNumThreads(args.threads)
+
+    environment = _environment(args, weights)
+    report = {"environment": environment, "scenarios": asyncio.run(run(args))}
+    environment["finished_at"] = datetime.utcnow().isoformat()
+
+    output = args.output or os.path.join(
+        args.work_dir, f"suite-{environment['commit'] or 'nogit'}-{datetime.utcnow():%Y%m%d-%H%M%S}.json"
+    )
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"Report written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            sys.exit(1 if compare(json.load(f), report, args.threshold) else 0)
+
+
+if __name__ == "__main__":
+    main()
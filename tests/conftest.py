@@ -0,0 +1,63 @@
+# tests/conftest.py
+"""Point the app at throwaway storage before any app module reads its settings"""
+import asyncio
+import os
+import tempfile
+from types import SimpleNamespace
+
+_tmp = tempfile.mkdtemp(prefix="trailguard-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{_tmp}/trailguard.db"
+os.environ["JOBS_DB_PATH"] = f"{_tmp}/jobs.sqlite"
+os.environ["IMPORT_ROOT"] = f"{_tmp}/imports"
+os.environ["JOBS_INLINE_WORKERS"] = "0"
+for name in ("REDIS_URL", "RESULT_CACHE_PATH", "INFERENCE_SERVER_SOCKET", "ADMIN_TOKEN"):
+    os.environ.pop(name, None)
+os.makedirs(os.environ["IMPORT_ROOT"])
+
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def import_root():
+    return os.environ["IMPORT_ROOT"]
+
+
+@pytest.fixture
+def db():
+    """Empty tables for every test"""
+    from app.db.models import Base
+    from app.db.session import dispose_async_engine, engine, get_db_session
+
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    from app.utils.cache import invalidate_pattern
+    invalidate_pattern("*")
+    with get_db_session() as session:
+        yield session
+    # Its pooled connections belong to the event loop of the test that opened them
+    asyncio.run(dispose_async_engine())
+
+
+@pytest.fixture
+def fake_models(monkeypatch, tmp_path):
+    """
+    Model files that load as tests/fake_models.FakeModel: .detector and .classifier
+    paths, .loaded lists the models loaded so far. The weights are unique per test,
+    so are the model fingerprints.
+    """
+    from fake_models import FakeModel
+    from app.pipeline import image_processor
+
+    models = SimpleNamespace(loaded=[])
+
+    def load_model(path, task, backend="pytorch", int8=False):
+        model = FakeModel(task)
+        models.loaded.append(model)
+        return model, path, "pytorch"
+
+    monkeypatch.setattr(image_processor, "load_model", load_model)
+    for name in ("detector", "classifier"):
+        path = tmp_path / f"{name}.pt"
+        path.write_text(str(path))
+        setattr(models, name, str(path))
+    return models
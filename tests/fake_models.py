@@ -0,0 +1,71 @@
+# tests/fake_models.py
+"""
+Stand-ins for the ultralytics models: a frame whose first pixel is non-zero holds one
+animal covering the whole frame, and the classifier calls every crop a deer.
+"""
+import threading
+
+import numpy as np
+
+
+class _Tensor:
+    def __init__(self, values):
+        self.values = np.asarray(values, dtype=np.float32)
+
+    def __getitem__(self, index):
+        value = self.values[index]
+        return _Tensor(value) if np.ndim(value) else float(value)
+
+    def cpu(self):
+        return self
+
+    def numpy(self):
+        return self.values
+
+
+class _Box:
+    def __init__(self, width, height):
+        self.xyxy = _Tensor([[0, 0, width, height]])
+        self.conf = _Tensor([0.9])
+        self.cls = _Tensor([0])
+
+
+class _Detection:
+    names = {0: "animal"}
+
+    def __init__(self, image):
+        self.orig_img = image
+        height, width = image.shape[:2]
+        self.boxes = [_Box(width, height)] if image[0, 0, 0] else []
+
+
+class _Probs:
+    top1 = 0
+    top1conf = 0.8
+
+
+class _Classification:
+    names = {0: "deer"}
+    probs = _Probs()
+
+
+class FakeModel:
+    """Records the size of every batch it was called with"""
+
+    def __init__(self, task: str):
+        self.task = task
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def __call__(self, images, **kwargs):
+        with self._lock:
+            self.batches.append(len(images))
+        if self.task == "classify":
+            return [_Classification() for _ in images]
+        return [_Detection(image) for image in images]
+
+
+def frame(animal: bool, size: int = 32) -> np.ndarray:
+    image = np.zeros((size, size, 3), dtype=np.uint8)
+    image[0, 0, 0] = 255 if animal else 0
+    return image
@@ -0,0 +1,68 @@
+# tests/fake_redis.py
+"""In-memory stand-in for the subset of redis.Redis the JSON cache uses"""
+import fnmatch
+import threading
+import time
+from typing import Optional
+
+
+class FakeRedis:
+    """Thread-safe; values come back as bytes like redis-py's. Set fail=True to simulate an outage."""
+
+    def __init__(self):
+        self._data: dict[str, tuple[Optional[float], bytes]] = {}
+        self._lock = threading.Lock()
+        self.fail = False
+        self.calls = 0
+
+    def _check(self):
+        self.calls += 1
+        if self.fail:
+            raise ConnectionError("fake redis is down")
+
+    def _live(self, key: str) -> Optional[bytes]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    def ping(self) -> bool:
+        self._check()
+        return True
+
+    def get(self, key: str) -> Optional[bytes]:
+        self._check()
+        with self._lock:
+            return self._live(key)
+
+    def set(self, key: str, value) -> bool:
+        self._check()
+        with self._lock:
+            self._data[key] = (None, value.encode() if isinstance(value, str) else value)
+        return True
+
+    def setex(self, key: str, ttl: int, value) -> bool:
+        self._check()
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value.encode() if isinstance(value, str) else value)
+        return True
+
+    def delete(self, *keys: str) -> int:
+        self._check()
+        with self._lock:
+            keys = [key.decode() if isinstance(key, bytes) else key for key in keys]
+            return sum(self._data.pop(key, None) is not None for key in keys)
+
+    def scan_iter(self, match: str = "*", count: int = 10):
+        self._check()
+        with self._lock:
+            keys = [key for key in self._data if self._live(key) is not None and fnmatch.fnmatchcase(key, match)]
+        yield from (key.encode() for key in keys)
+
+    def flushall(self):
+        with self._lock:
+            self._data.clear()
@@ -0,0 +1,66 @@
+# tests/test_analysis.py
+import asyncio
+import json
+
+import cv2
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.routes import analysis
+from app.utils.metrics import Metrics
+
+
+def _png(value: int = 0) -> bytes:
+    return cv2.imencode(".png", np.full((16, 16, 3), value, dtype=np.uint8))[1].tobytes()
+
+
+class StubProcessor:
+    """Active-processor stand-in; after its first image another version becomes active"""
+
+    batcher = None
+
+    def __init__(self, version: str, manager):
+        self.version = version
+        self.manager = manager
+        self.in_flight = 0
+        self.images = 0
+
+    async def process_image(self, image, wait=False, image_bytes=None):
+        self.images += 1
+        self.manager.active = StubProcessor(f"{self.version}+1", self.manager)
+        await asyncio.sleep(0.01)
+        return {"status": "no_animal_detected", "detections": [], "version": self.version, "timings": {}}
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    class Manager:
+        active = None
+
+    manager = Manager()
+    manager.active = StubProcessor("v1", manager)
+    monkeypatch.setattr(analysis, "image_processor_singleton", lambda: manager.active)
+    metrics = Metrics()
+    monkeypatch.setattr(analysis, "metrics_singleton", lambda: metrics)
+    manager.metrics = metrics
+    return manager
+
+
+@pytest.mark.parametrize("stream", [None, "ndjson"])
+def test_batch_keeps_one_processor_for_the_whole_request(manager, stream):
+    first = manager.active
+    files = [("files", (f"{i}.png", _png(), "image/png")) for i in range(5)]
+    params = {"stream": stream} if stream else {}
+    response = TestClient(app).post("/api/analyze/batch", files=files, params=params)
+    assert response.status_code == 200
+
+    if stream:
+        records = [json.loads(line) for line in response.text.splitlines()]
+        results = [r for r in records if r["type"] == "result"]
+    else:
+        results = response.json()["results"]
+    assert {r["data"]["version"] for r in results} == {"v1"}
+    assert first.images == 5 and first.in_flight == 0
+    assert {version for _, _, version in manager.metrics._stages} == {"v1"}
@@ -0,0 +1,56 @@
+# tests/test_batch.py
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.pipeline.batch_processor import check_import_paths, expand_image_paths
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+@pytest.fixture
+def card(import_root, tmp_path):
+    """imports/card with two images, plus a symlink to an image outside the import root"""
+    card = os.path.join(import_root, "card")
+    os.makedirs(card, exist_ok=True)
+    for name in ("a.jpg", "b.JPG", "notes.txt"):
+        open(os.path.join(card, name), "wb").close()
+    outside = tmp_path / "secret.jpg"
+    outside.write_bytes(b"")
+    link = os.path.join(card, "z.jpg")
+    if not os.path.lexists(link):
+        os.symlink(outside, link)
+    return card
+
+
+def test_paths_inside_the_import_root_are_accepted(card):
+    check_import_paths([card, os.path.join(card, "a.jpg")])
+
+
+@pytest.mark.parametrize("path", ["/etc/passwd", "{root}/../elsewhere", "{card}/z.jpg"])
+def test_paths_escaping_the_import_root_are_rejected(card, import_root, path):
+    with pytest.raises(ValueError):
+        check_import_paths([path.format(root=import_root, card=card)])
+
+
+def test_expanding_skips_symlinks_out_of_the_import_root(card, import_root):
+    names = [os.path.basename(p) for p in expand_image_paths([card], import_root)]
+    assert names == ["a.jpg", "b.JPG"]
+    assert "z.jpg" in [os.path.basename(p) for p in expand_image_paths([card])]
+
+
+@pytest.mark.parametrize("endpoint", ["batch", "jobs"])
+def test_ingestion_outside_the_import_root_is_a_400(client, endpoint):
+    response = client.post(f"/api/projects/p1/{endpoint}", json=["/etc"])
+    assert response.status_code == 400
+    assert "must be inside" in response.json()["detail"]
+
+
+@pytest.mark.parametrize("endpoint", ["batch", "jobs"])
+def test_paths_are_checked_after_the_project(client, db, card, endpoint):
+    assert client.post(f"/api/projects/missing/{endpoint}", json=[card]).status_code == 404
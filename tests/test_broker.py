@@ -0,0 +1,81 @@
+import asyncio
+import json
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app.main import app
+from app.routes import realtime
+from app.utils.broker import InProcessBroker
+
+
+def test_messages_fan_out_to_every_subscriber():
+    broker = InProcessBroker()
+
+    async def scenario():
+        first, second = await broker.subscribe("project:1"), await broker.subscribe("project:1")
+        other = await broker.subscribe("project:2")
+        broker.publish("project:1", {"type": "image_processed"})
+        received = [await asyncio.wait_for(s.get(), 1) for s in (first, second)]
+        await asyncio.sleep(0)
+        return received, other.queue.qsize()
+
+    received, other_queued = asyncio.run(scenario())
+    assert [json.loads(payload) for payload in received] == [{"type": "image_processed"}] * 2
+    assert other_queued == 0
+
+
+def test_slow_consumer_is_dropped():
+    broker = InProcessBroker(client_queue=2)
+
+    async def scenario():
+        slow, fast = await broker.subscribe("project:1"), await broker.subscribe("project:1")
+        received = []
+        for i in range(3):
+            broker.publish("project:1", {"n": i})
+            await asyncio.sleep(0)
+            received.append(json.loads(await fast.get()))
+        return slow, fast, received, [payload async for payload in slow]
+
+    slow, fast, received, left_for_slow = asyncio.run(scenario())
+    assert slow.dropped and slow.closed
+    assert left_for_slow == []
+    assert not fast.dropped and received == [{"n": 0}, {"n": 1}, {"n": 2}]
+    assert broker.stats()["dropped_clients"] == 1
+    assert broker.stats()["subscribers"] == 1
+
+
+def test_throttled_messages_are_sent_at_most_once_per_interval():
+    broker = InProcessBroker(throttle_interval=0.05)
+    assert broker.publish("project:1", {"progress": 1}, throttle_key="job:1")
+    assert not broker.publish("project:1", {"progress": 2}, throttle_key="job:1")
+    # Other keys and unthrottled messages are unaffected
+    assert broker.publish("project:1", {"progress": 1}, throttle_key="job:2")
+    assert broker.publish("project:1", {"status": "completed"})
+    time.sleep(0.06)
+    assert broker.publish("project:1", {"progress": 3}, throttle_key="job:1")
+    assert broker.stats()["throttled"] == 1
+    assert broker.stats()["published"] == 4
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    broker = InProcessBroker(client_queue=1)
+    monkeypatch.setattr(realtime, "broker_singleton", lambda: broker)
+    return broker
+
+
+def test_websocket_of_a_slow_client_is_closed_with_1013(broker):
+    with TestClient(app).websocket_connect("/api/ws/projects/p1") as websocket:
+        assert websocket.receive_json()["type"] == "connected"
+        # Published faster than the forwarder can send: the one-message queue overflows
+        for i in range(200):
+            broker.publish("project:p1", {"n": i})
+        with pytest.raises(WebSocketDisconnect) as closed:
+            while True:
+                websocket.receive_text()
+    assert closed.value.code == realtime.SLOW_CONSUMER_CLOSE_CODE
+    assert broker.stats()["dropped_clients"] == 1
+    assert broker.stats()["subscribers"] == 0
@@ -0,0 +1,210 @@
+# tests/test_cache.py
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.utils import cache as cache_module
+from app.utils.cache import JsonCache, LocalCache, cached_json, configure_cache, invalidate_pattern
+from fake_redis import FakeRedis
+
+
+@pytest.fixture
+def redis():
+    return FakeRedis()
+
+
+def test_single_flight_runs_loader_once(redis):
+    cache = JsonCache(redis_client=redis)
+    calls = []
+    release = threading.Event()
+
+    def loader():
+        calls.append(1)
+        release.wait(2)
+        return {"value": 42}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_load("k", 60, loader)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [1]
+    assert results == [{"value": 42}] * 8
+    assert cache.misses == 1
+    assert cache.coalesced == 7
+
+
+def test_single_flight_async_loader(redis):
+    cache = JsonCache(redis_client=redis)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return [1, 2, 3]
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_load_async("k", 60, loader) for _ in range(5)))
+
+    assert asyncio.run(main()) == [[1, 2, 3]] * 5
+    assert calls == [1]
+    assert cache.coalesced == 4
+
+
+def test_cancelled_leader_hands_the_load_to_a_waiter(redis):
+    cache = JsonCache(redis_client=redis)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return len(calls)
+
+    async def main():
+        leader = asyncio.create_task(cache.get_or_load_async("k", 60, loader))
+        await asyncio.sleep(0.01)
+        waiters = [asyncio.create_task(cache.get_or_load_async("k", 60, loader)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        leader.cancel()  # e.g. the client disconnected
+        results = await asyncio.gather(*waiters)
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return results
+
+    # One waiter took over the load, the others shared its result
+    assert asyncio.run(main()) == [2, 2, 2]
+    assert len(calls) == 2
+
+
+def test_cancelled_waiter_leaves_the_shared_load_alone(redis):
+    cache = JsonCache(redis_client=redis)
+
+    async def loader():
+        await asyncio.sleep(0.05)
+        return "value"
+
+    async def main():
+        leader = asyncio.create_task(cache.get_or_load_async("k", 60, loader))
+        await asyncio.sleep(0.01)
+        quitter, waiter = (asyncio.create_task(cache.get_or_load_async("k", 60, loader)) for _ in range(2))
+        await asyncio.sleep(0.01)
+        quitter.cancel()
+        return await leader, await waiter
+
+    assert asyncio.run(main()) == ("value", "value")
+
+
+def test_async_loader_error_reaches_every_waiter(redis):
+    cache = JsonCache(redis_client=redis)
+
+    async def failing():
+        await asyncio.sleep(0.02)
+        raise ValueError("boom")
+
+    async def main():
+        return await asyncio.gather(*(cache.get_or_load_async("k", 60, failing) for _ in range(3)),
+                                    return_exceptions=True)
+
+    assert [type(e) for e in asyncio.run(main())] == [ValueError] * 3
+
+
+def test_loader_error_reaches_every_waiter_and_is_not_cached(redis):
+    cache = JsonCache(redis_client=redis)
+
+    def failing():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        cache.get_or_load("k", 60, failing)
+    assert cache.get_or_load("k", 60, lambda: "ok") == "ok"
+
+
+def test_redis_tier_is_shared_between_workers(redis):
+    worker_a = JsonCache(redis_client=redis)
+    worker_b = JsonCache(redis_client=redis)
+
+    worker_a.get_or_load("project:1:results", 60, lambda: {"page": 1})
+    assert worker_b.get_or_load("project:1:results", 60, lambda: pytest.fail("should come from redis")) == {"page": 1}
+    assert worker_b.redis_hits == 1
+
+
+def test_invalidate_pattern_clears_both_tiers(redis):
+    cache = configure_cache(redis_client=redis)
+    try:
+        cached_json("project:1:results:page:1", 60, lambda: "p1")
+        cached_json("project:1:sessions", 60, lambda: "s1")
+        cached_json("project:2:sessions", 60, lambda: "s2")
+
+        assert invalidate_pattern("project:1:*") == 2
+        assert len(cache.local) == 1
+        assert [key.decode() for key in redis.scan_iter()] == ["project:2:sessions"]
+        assert cached_json("project:1:sessions", 60, lambda: "s1 again") == "s1 again"
+        assert cached_json("project:2:sessions", 60, lambda: pytest.fail("still cached")) == "s2"
+    finally:
+        cache_module._cache = None
+
+
+def test_local_copy_is_bounded_by_local_ttl_with_redis(redis, monkeypatch):
+    monkeypatch.setattr(cache_module, "CACHE_LOCAL_TTL", 0)
+    worker_a = JsonCache(redis_client=redis)
+    worker_b = JsonCache(redis_client=redis)
+    worker_b.get_or_load("k", 60, lambda: "old")
+
+    # Another worker invalidates: b can't trust its local copy, it goes back to redis
+    worker_a.invalidate("k")
+    assert worker_b.get_or_load("k", 60, lambda: "new") == "new"
+
+
+def test_redis_outage_degrades_to_local_tier(redis):
+    cache = JsonCache(redis_client=redis)
+    redis.fail = True
+    assert cache.get_or_load("k", 60, lambda: "value") == "value"
+    assert cache.get_or_load("k", 60, lambda: pytest.fail("local tier")) == "value"
+    assert cache.redis_errors >= 2
+
+
+def test_lru_evicts_least_recently_used_entry():
+    local = LocalCache(max_entries=2, max_bytes=1024)
+    local.set("a", '"a"', 60)
+    local.set("b", '"b"', 60)
+    assert local.get("a") == '"a"'
+    local.set("c", '"c"', 60)
+
+    assert local.get("b") is None
+    assert local.get("a") == '"a"' and local.get("c") == '"c"'
+    assert local.evictions == 1
+
+
+def test_byte_bound_counts_encoded_bytes():
+    payload = '"' + "é" * 10 + '"'  # 12 characters, 22 bytes in UTF-8
+    local = LocalCache(max_entries=100, max_bytes=50)
+    local.set("a", payload, 60)
+    local.set("b", payload, 60)
+    assert local._bytes == 44
+    local.set("c", payload, 60)
+
+    assert len(local) == 2
+    assert local.get("a") is None
+    assert local._bytes == 44
+
+
+def test_oversized_payload_is_not_stored():
+    local = LocalCache(max_entries=100, max_bytes=10)
+    local.set("big", '"' + "é" * 5 + '"', 60)  # 7 characters, 12 bytes
+    assert local.get("big") is None
+    assert local._bytes == 0
+
+
+def test_expired_entries_are_dropped():
+    local = LocalCache()
+    local.set("k", '"v"', 0)
+    assert local.get("k") is None
+    assert local.expirations == 1
+    assert local._bytes == 0
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import delete, select
+
+from app.db.migrations import backfill_detections
+from app.db.models import Detection, Image, Project, Session
+from app.main import app
+
+START = datetime(2024, 5, 1)
+
+
+def _rows(db):
+    return sorted(
+        (d.image_id, d.session_id, d.project_id, d.species, d.capture_time, d.classification_confidence)
+        for d in db.scalars(select(Detection))
+    )
+
+
+@pytest.fixture
+def session(db):
+    project = Project(name="p")
+    db.add(project)
+    db.flush()
+    session = Session(project_id=project.id)
+    db.add(session)
+    db.commit()
+    return session
+
+
+def test_inserted_images_get_detection_rows(db, session):
+    boxed = Image(session_id=session.id, file_path="a.jpg", has_animal=True, capture_time=START,
+                  species_detected={"detections": [
+                      {"species": "deer", "classification_confidence": 0.9,
+                       "bounding_box": {"x1": 1, "y1": 2, "x2": 3, "y2": 4}},
+                      {"species": "fox"},
+                  ]})
+    legacy = Image(session_id=session.id, file_path="b.jpg", has_animal=True, created_at=START + timedelta(days=1),
+                   species_detected={"name": "bear", "confidence": 0.7})
+    empty = Image(session_id=session.id, file_path="c.jpg")
+    db.add_all([boxed, legacy, empty])
+    db.commit()
+
+    assert boxed.project_id == session.project_id
+    assert _rows(db) == sorted([
+        (boxed.id, session.id, session.project_id, "deer", START, 0.9),
+        (boxed.id, session.id, session.project_id, "fox", START, None),
+        # No capture time: the upload time stands in
+        (legacy.id, session.id, session.project_id, "bear", START + timedelta(days=1), 0.7),
+    ])
+    deer = db.scalars(select(Detection).where(Detection.species == "deer")).one()
+    assert (deer.x1, deer.y1, deer.x2, deer.y2) == (1, 2, 3, 4)
+
+
+def test_backfill_rebuilds_the_detections(db, session):
+    db.add_all(
+        Image(session_id=session.id, file_path=f"{i}.jpg", has_animal=True, capture_time=START + timedelta(days=i),
+              species_detected={"detections": [{"species": "deer"}] * (i % 3)})
+        for i in range(7)
+    )
+    db.commit()
+    expected = _rows(db)
+    assert len(expected) == 6
+
+    # A database from before the detections table: nothing to filter on until the backfill
+    db.execute(delete(Detection))
+    db.commit()
+    assert backfill_detections(chunk_size=2) == 6
+    db.expire_all()
+    assert _rows(db) == expected
+
+    # Safe to re-run: each chunk replaces the rows of its images
+    assert backfill_detections(chunk_size=4) == 6
+    assert _rows(db) == expected
+
+
+@pytest.fixture
+def sightings(db, session):
+    """Deer on days 0-3, a fox on day 4, a deer and a fox together on day 5"""
+    species = [["deer"]] * 4 + [["fox"], ["deer", "fox"]]
+    for day, names in enumerate(species):
+        db.add(Image(session_id=session.id, file_path=f"{day}.jpg", has_animal=True,
+                     capture_time=START + timedelta(days=day), created_at=START + timedelta(minutes=day),
+                     species_detected={"detections": [{"species": name} for name in names]}))
+    db.commit()
+    return session.project_id
+
+
+def _filtered(project_id, **params):
+    response = TestClient(app).get(f"/api/projects/{project_id}/results", params=params)
+    assert response.status_code == 200
+    body = response.json()
+    return sorted(img["file_path"] for img in body["images"]), body["pagination"]["total"]
+
+
+def test_species_and_time_filters_go_through_the_detections(sightings):
+    assert _filtered(sightings, species="fox") == (["4.jpg", "5.jpg"], 2)
+    assert _filtered(sightings, species="deer") == (["0.jpg", "1.jpg", "2.jpg", "3.jpg", "5.jpg"], 5)
+    # The end is exclusive; no rollup for a time range, so no total either
+    window = {"start": (START + timedelta(days=1)).isoformat(), "end": (START + timedelta(days=3)).isoformat()}
+    assert _filtered(sightings, **window) == (["1.jpg", "2.jpg"], None)
+    assert _filtered(sightings, species="fox", start=(START + timedelta(days=5)).isoformat()) == (["5.jpg"], None)
+    assert _filtered(sightings, species="wolf") == ([], 0)
@@ -0,0 +1,132 @@
+import asyncio
+import csv
+import io
+import json
+import zipfile
+from datetime import date, datetime
+from types import SimpleNamespace
+
+import pyarrow.parquet as pq
+import pytest
+from fastapi.testclient import TestClient
+
+from app.db.export import EXPORT_COLUMNS, ProjectExport, _ParquetWriter, _StreamBuffer
+from app.db.models import Image, Project, Session, Species
+from app.main import app
+
+
+@pytest.fixture
+def survey(db):
+    """One session: an image with a deer and a fox, one without detections"""
+    project = Project(name="survey", description="Spring survey")
+    db.add(project)
+    db.flush()
+    session = Session(project_id=project.id, location="45.5,-73.6", start_date=date(2024, 5, 1))
+    db.add_all([session, Species(common_name="deer", scientific_name="Odocoileus virginianus")])
+    db.flush()
+    db.add_all([
+        Image(session_id=session.id, file_path="cam1/a.jpg", has_animal=True, animal_count=2,
+              capture_time=datetime(2024, 5, 2, 6, 30),
+              species_detected={"detections": [
+                  {"species": "deer", "classification_confidence": 0.9, "detection_confidence": 0.8},
+                  {"species": "fox", "detection_confidence": 0.7},
+              ]}),
+        Image(session_id=session.id, file_path="cam1/b.jpg", capture_time=datetime(2024, 5, 3, 12, 0)),
+    ])
+    db.commit()
+    return SimpleNamespace(id=project.id, session_id=session.id)
+
+
+def _export(survey, **params):
+    response = TestClient(app).get(f"/api/projects/{survey.id}/export", params=params)
+    assert response.status_code == 200
+    return response
+
+
+def _csv_rows(data: bytes) -> list:
+    return list(csv.DictReader(io.StringIO(data.decode("utf-8"))))
+
+
+def test_csv_has_a_row_per_detection_and_one_per_empty_image(survey):
+    response = _export(survey, format="csv")
+    assert response.headers["content-type"].startswith("text/csv")
+    assert f'filename="{survey.id}.csv"' in response.headers["content-disposition"]
+    rows = _csv_rows(response.content)
+    assert list(rows[0]) == [name for name, _ in EXPORT_COLUMNS]
+    assert sorted((row["file_path"], row["species"]) for row in rows) == [
+        ("cam1/a.jpg", "deer"), ("cam1/a.jpg", "fox"), ("cam1/b.jpg", "")
+    ]
+    empty = next(row for row in rows if row["file_path"] == "cam1/b.jpg")
+    assert (empty["has_animal"], empty["detection_id"], empty["capture_time"]) == ("false", "", "2024-05-03T12:00:00")
+
+
+def test_filters_apply_to_the_detections(survey):
+    rows = _csv_rows(_export(survey, format="csv", species="fox").content)
+    assert [(row["file_path"], row["species"]) for row in rows] == [("cam1/a.jpg", "fox")]
+    rows = _csv_rows(_export(survey, format="csv", min_confidence=0.85).content)
+    assert [row["species"] for row in rows] == ["deer"]
+
+
+def test_export_streams_chunk_by_chunk(survey):
+    async def pieces():
+        return [data async for data in ProjectExport(survey.id, chunk_size=1).stream("csv")]
+
+    chunks = asyncio.run(pieces())
+    # Header with the first row, one piece per further row, then the (empty) tail
+    assert len(chunks) >= 3
+    assert _csv_rows(b"".join(chunks)) == _csv_rows(_export(survey, format="csv").content)
+
+
+def test_parquet_export(survey):
+    table = pq.read_table(io.BytesIO(_export(survey, format="parquet").content))
+    assert table.schema.names == [name for name, _ in EXPORT_COLUMNS]
+    assert sorted(zip(table["file_path"].to_pylist(), table["species"].to_pylist()),
+                  key=lambda row: (row[0], row[1] or "")) == [
+        ("cam1/a.jpg", "deer"), ("cam1/a.jpg", "fox"), ("cam1/b.jpg", None)
+    ]
+
+
+def test_parquet_row_groups_hold_row_group_size_rows():
+    buffer = _StreamBuffer()
+    writer = _ParquetWriter(buffer, row_group_size=4)
+    for start in range(0, 10, 3):
+        writer.write([{"image_id": str(i), "has_animal": False} for i in range(start, min(start + 3, 10))])
+    writer.close()
+
+    parquet = pq.ParquetFile(io.BytesIO(buffer.drain()))
+    # Chunks of 3 are buffered and cut into groups of 4, the rest goes in the last group
+    assert [parquet.metadata.row_group(i).num_rows for i in range(parquet.num_row_groups)] == [4, 4, 2]
+    assert parquet.read()["image_id"].to_pylist() == [str(i) for i in range(10)]
+
+
+def test_camtrap_dp_package(survey):
+    response = _export(survey, format="camtrapdp")
+    assert response.headers["content-type"] == "application/zip"
+    package = zipfile.ZipFile(io.BytesIO(response.content))
+    assert sorted(package.namelist()) == ["datapackage.json", "deployments.csv", "media.csv", "observations.csv"]
+
+    deployments = _csv_rows(package.read("deployments.csv"))
+    assert [(d["deploymentID"], d["latitude"], d["longitude"], d["deploymentStart"]) for d in deployments] == [
+        (survey.session_id, "45.5", "-73.6", "2024-05-01T00:00:00Z")
+    ]
+    media = _csv_rows(package.read("media.csv"))
+    assert sorted((m["fileName"], m["timestamp"], m["fileMediatype"]) for m in media) == [
+        ("a.jpg", "2024-05-02T06:30:00Z", "image/jpeg"), ("b.jpg", "2024-05-03T12:00:00Z", "image/jpeg")
+    ]
+    observations = _csv_rows(package.read("observations.csv"))
+    assert sorted((o["observationType"], o["scientificName"], o["classificationProbability"])
+                  for o in observations) == [
+        ("animal", "Odocoileus virginianus", "0.9"), ("animal", "fox", "0.7"), ("blank", "", "")
+    ]
+
+    datapackage = json.loads(package.read("datapackage.json"))
+    assert datapackage["title"] == "survey"
+    assert datapackage["temporal"] == {"start": "2024-05-02", "end": "2024-05-03"}
+    assert {taxon["scientificName"] for taxon in datapackage["taxonomic"]} == {"Odocoileus virginianus", "fox"}
+    assert [resource["path"] for resource in datapackage["resources"]] == [
+        "deployments.csv", "media.csv", "observations.csv"
+    ]
+
+
+def test_export_of_an_unknown_project_is_a_404(db):
+    assert TestClient(app).get("/api/projects/missing/export").status_code == 404
@@ -0,0 +1,43 @@
+# tests/test_image_processor.py
+import asyncio
+
+from app.pipeline import image_processor
+from app.pipeline.image_processor import ImageProcessor, _process_batch_in_worker
+from fake_models import frame
+
+
+def test_models_only_loads_just_the_models(fake_models, monkeypatch):
+    def unexpected(*args, **kwargs):
+        raise AssertionError("process-pool workers must not build serving state")
+
+    for name in ("result_cache_singleton", "inference_executor_singleton", "model_fingerprint", "MicroBatcher"):
+        monkeypatch.setattr(image_processor, name, unexpected)
+
+    processor = ImageProcessor.models_only(fake_models.detector, fake_models.classifier, "v2")
+    assert processor.version == "v2"
+    assert [model.task for model in fake_models.loaded] == ["detect", "classify"]
+    assert not hasattr(processor, "batcher") and not hasattr(processor, "result_cache")
+
+    results = processor._process_batch_sync([frame(True), frame(False)])
+    assert [r["status"] for r in results] == ["animal_detected", "no_animal_detected"]
+    assert results[0]["detections"][0]["species"] == "deer"
+
+
+def test_worker_reloads_only_for_a_new_spec(fake_models, monkeypatch):
+    monkeypatch.setattr(image_processor, "_worker_processor", None)
+    spec = (fake_models.detector, fake_models.classifier, "v1", "pytorch", False)
+    _process_batch_in_worker(spec, [frame(True)])
+    _process_batch_in_worker(spec, [frame(False)])
+    assert len(fake_models.loaded) == 2
+
+    _process_batch_in_worker((*spec[:2], "v2", *spec[3:]), [frame(True)])
+    assert len(fake_models.loaded) == 4
+    assert image_processor._worker_processor.version == "v2"
+
+
+def test_serving_processor_matches_the_worker(fake_models):
+    processor = ImageProcessor(fake_models.detector, fake_models.classifier)
+    result = asyncio.run(processor.process_image(frame(True), wait=True))
+    assert result["detections"][0]["species"] == "deer"
+    assert processor.model_fingerprint
+    processor.close()
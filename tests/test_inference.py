@@ -0,0 +1,178 @@
+import asyncio
+import threading
+
+import cv2
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.pipeline import image_processor
+from app.pipeline.executor import InferenceExecutor, InferenceQueueFull
+from app.pipeline.image_processor import ImageProcessor
+from app.pipeline.micro_batcher import MicroBatcher
+from app.pipeline.result_cache import ResultCache
+from app.routes import analysis
+from fake_models import frame
+
+
+def test_executor_rejects_when_full_unless_waiting():
+    executor = InferenceExecutor("thread", workers=1, max_queue=1)
+    release = threading.Event()
+
+    async def scenario():
+        running = [asyncio.create_task(executor.run(release.wait, 2)) for _ in range(executor.capacity)]
+        await asyncio.sleep(0.05)
+        assert executor.full
+        with pytest.raises(InferenceQueueFull):
+            await executor.run(lambda: "rejected")
+        waiting = asyncio.create_task(executor.run(lambda: "waited", wait=True))
+        await asyncio.sleep(0.05)
+        assert not waiting.done()
+        release.set()
+        await asyncio.gather(*running)
+        return await waiting
+
+    try:
+        assert asyncio.run(scenario()) == "waited"
+    finally:
+        executor.shutdown()
+    stats = executor.stats()
+    assert stats["rejected"] == 1
+    assert stats["completed"] == 3
+
+
+def _png() -> bytes:
+    return cv2.imencode(".png", np.zeros((16, 16, 3), dtype=np.uint8))[1].tobytes()
+
+
+def test_queue_full_is_a_503_with_retry_after(monkeypatch):
+    class SaturatedProcessor:
+        version = "v1"
+
+        async def process_image(self, image, wait=False, image_bytes=None):
+            raise InferenceQueueFull(retry_after=7)
+
+    monkeypatch.setattr(analysis, "image_processor_singleton", SaturatedProcessor)
+    response = TestClient(app).post("/api/analyze/single", files={"file": ("a.png", _png(), "image/png")})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "7"
+    assert response.json()["success"] is False
+
+
+class RecordingBatch:
+    """run_batch stand-in: doubles every item and records each batch it was given"""
+
+    def __init__(self, delay: float = 0.0, fail_unless_waiting: bool = False):
+        self.batches = []
+        self.delay = delay
+        self.fail_unless_waiting = fail_unless_waiting
+
+    async def __call__(self, items, wait=False):
+        self.batches.append((list(items), wait))
+        await asyncio.sleep(self.delay)
+        if self.fail_unless_waiting and not wait:
+            raise InferenceQueueFull()
+        return [item * 2 for item in items]
+
+
+def test_micro_batcher_coalesces_concurrent_submits():
+    run_batch = RecordingBatch()
+    batcher = MicroBatcher(run_batch, max_batch_size=4, max_wait_ms=50)
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.submit(i) for i in range(10)))
+
+    assert asyncio.run(scenario()) == [i * 2 for i in range(10)]
+    assert [len(items) for items, _ in run_batch.batches] == [4, 4, 2]
+    assert batcher.stats()["batches"] == 3
+    assert batcher.stats()["items"] == 10
+
+
+def test_micro_batcher_dispatches_a_lone_item_after_max_wait():
+    run_batch = RecordingBatch()
+    batcher = MicroBatcher(run_batch, max_batch_size=16, max_wait_ms=10)
+    assert asyncio.run(batcher.submit(3)) == 6
+    assert run_batch.batches == [([3], False)]
+
+
+def test_micro_batcher_waits_only_if_every_caller_does():
+    run_batch = RecordingBatch(fail_unless_waiting=True)
+    batcher = MicroBatcher(run_batch, max_batch_size=2, max_wait_ms=50)
+
+    async def scenario():
+        return await asyncio.gather(batcher.submit(1), batcher.submit(2, wait=True), return_exceptions=True)
+
+    rejected, waited = asyncio.run(scenario())
+    assert isinstance(rejected, InferenceQueueFull)
+    assert waited == 4
+    assert run_batch.batches == [([1, 2], False), ([2], True)]
+
+
+def test_micro_batcher_drops_callers_cancelled_while_queued():
+    run_batch = RecordingBatch()
+    batcher = MicroBatcher(run_batch, max_batch_size=4, max_wait_ms=50)
+
+    async def scenario():
+        gone = asyncio.create_task(batcher.submit(1))
+        kept = asyncio.create_task(batcher.submit(2))
+        await asyncio.sleep(0)
+        gone.cancel()
+        return await kept
+
+    assert asyncio.run(scenario()) == 4
+    assert run_batch.batches == [([2], False)]
+    assert batcher.stats()["pending"] == 0
+
+
+def test_micro_batcher_close_cancels_queued_items():
+    run_batch = RecordingBatch()
+    batcher = MicroBatcher(run_batch, max_batch_size=4, max_wait_ms=1000)
+
+    async def scenario():
+        first = asyncio.create_task(batcher.submit(1))
+        await asyncio.sleep(0.01)
+        queued = asyncio.create_task(batcher.submit(2))
+        await asyncio.sleep(0)
+        batcher.close()
+        return await asyncio.gather(first, queued, return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, asyncio.CancelledError) for result in results)
+    assert run_batch.batches == []
+
+
+def test_result_cache_keys_include_the_model_fingerprint():
+    cache = ResultCache(max_entries=8)
+    cache.put(ResultCache.make_key("model-a", "digest"), {"status": "animal_detected"})
+    assert cache.get(ResultCache.make_key("model-a", "digest")) == {"status": "animal_detected"}
+    assert cache.get(ResultCache.make_key("model-b", "digest")) is None
+
+
+def test_processor_serves_repeats_from_the_cache_of_its_own_models(fake_models, monkeypatch, tmp_path):
+    cache = ResultCache(max_entries=8)
+    monkeypatch.setattr(image_processor, "result_cache_singleton", lambda: cache)
+
+    async def analyze(processor):
+        return await processor.process_image(frame(True), wait=True, image_bytes=b"same upload")
+
+    first = ImageProcessor(fake_models.detector, fake_models.classifier)
+    try:
+        result = asyncio.run(analyze(first))
+        assert asyncio.run(analyze(first)) == {k: v for k, v in result.items() if k != "timings"}
+    finally:
+        first.close()
+    detector = fake_models.loaded[0]
+    assert detector.batches == [1]
+    assert cache.stats()["hits"] == 1
+
+    # New weights, new fingerprint: the same upload is analyzed again
+    retrained = tmp_path / "retrained.pt"
+    retrained.write_text("retrained")
+    second = ImageProcessor(str(retrained), fake_models.classifier)
+    try:
+        asyncio.run(analyze(second))
+    finally:
+        second.close()
+    assert second.model_fingerprint != first.model_fingerprint
+    assert fake_models.loaded[2].batches == [1]
@@ -0,0 +1,146 @@
+# tests/test_jobs.py
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.db.models import Image, Project, Session
+from app.pipeline import jobs
+from app.pipeline.job_store import CANCEL, LOST, RUN, SQLiteJobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SQLiteJobStore(str(tmp_path / "jobs.sqlite"))
+
+
+def _paths(n):
+    return [f"/imports/card/{i:03d}.jpg" for i in range(n)]
+
+
+def test_checkpoint_records_progress_and_pending_paths(store):
+    store.create("j1", "p1", "s1", _paths(5))
+    job = store.claim("w1")
+    assert job["status"] == "running" and job["attempts"] == 1
+
+    assert store.checkpoint("j1", "w1", _paths(5)[:2], ["/imports/card/002.jpg"], {"images_saved": 2}) == RUN
+    job = store.get("j1")
+    assert (job["processed"], job["failed"], job["summary"]) == (2, 1, {"images_saved": 2})
+    assert store.pending_paths("j1") == _paths(5)[3:]
+
+
+def test_claim_takes_the_oldest_queued_job(store):
+    store.create("old", "p1", "s1", _paths(1))
+    time.sleep(0.01)
+    store.create("new", "p1", "s1", _paths(1))
+    assert store.claim("w1")["id"] == "old"
+    assert store.claim("w2")["id"] == "new"
+    assert store.claim("w3") is None
+
+
+def test_cancel_queued_job_is_immediate(store):
+    store.create("j1", "p1", "s1", _paths(3))
+    assert store.cancel("j1")["status"] == "cancelled"
+    assert store.claim("w1") is None
+
+
+def test_cancel_running_job_stops_at_next_heartbeat(store):
+    store.create("j1", "p1", "s1", _paths(3))
+    store.claim("w1")
+    assert store.cancel("j1")["status"] == "running"
+    assert store.heartbeat("j1", "w1") == CANCEL
+    assert store.checkpoint("j1", "w1", _paths(1), [], None) == CANCEL
+    store.finish("j1", "w1", "cancelled")
+    assert store.get("j1")["status"] == "cancelled"
+
+
+def test_requeue_stale_hands_the_job_to_another_worker(store):
+    store.create("j1", "p1", "s1", _paths(3))
+    first = store.claim("w1")
+    store.checkpoint("j1", "w1", _paths(3)[:1], [], None)
+
+    assert store.requeue_stale(60) == []
+    assert store.requeue_stale(-1) == ["j1"]
+    resumed = store.claim("w2")
+    assert resumed["attempts"] == 2
+    assert resumed["started_at"] == first["started_at"]
+    assert store.pending_paths("j1") == _paths(3)[1:]
+    # The old worker finds out at its next heartbeat and must not touch the job
+    assert store.heartbeat("j1", "w1") == LOST
+    assert store.checkpoint("j1", "w1", _paths(3)[1:], [], None) == LOST
+    assert store.get("j1")["processed"] == 1
+
+
+class FakeBatchProcessor:
+    """Stores one empty Image per path, like the real pipeline's persist stage"""
+
+    def __init__(self, db):
+        self.db = db
+        self.seen = []
+
+    async def stream_batch(self, paths, project_id, session_id, endpoint="jobs"):
+        for path in paths:
+            self.seen.append(path)
+            image = Image(session_id=session_id, file_path=path, has_animal=False)
+            self.db.add(image)
+            self.db.commit()
+            yield {"file_path": path, "result": {"status": "no_animal_detected"}, "image_id": image.id}
+
+
+@pytest.fixture
+def session_id(db):
+    project = Project(name="p")
+    db.add(project)
+    db.flush()
+    session = Session(project_id=project.id)
+    db.add(session)
+    db.commit()
+    return session.id
+
+
+def _worker(store, db, monkeypatch):
+    monkeypatch.setattr(jobs, "_report", lambda *args, **kwargs: None)
+    worker = jobs.JobWorker(store=store, worker_id="w2")
+    worker.processor = FakeBatchProcessor(db)
+    return worker
+
+
+def test_resumed_job_skips_checkpointed_and_already_stored_images(store, db, session_id, monkeypatch):
+    paths = _paths(5)
+    # An earlier, unrelated batch in the same session already stored paths[3]
+    db.add(Image(session_id=session_id, file_path=paths[3], created_at=datetime.utcnow() - timedelta(hours=1)))
+    db.commit()
+
+    store.create("j1", "p1", session_id, paths)
+    store.claim("w1")
+    store.checkpoint("j1", "w1", paths[:1], [], {"images_saved": 1})
+    # w1 stored paths[1] and then died before its next checkpoint
+    db.add(Image(session_id=session_id, file_path=paths[1]))
+    db.commit()
+    store.requeue_stale(-1)
+
+    worker = _worker(store, db, monkeypatch)
+    assert asyncio.run(worker.run_job(store.claim("w2"))) == "completed"
+
+    assert worker.processor.seen == [paths[2], paths[3], paths[4]]
+    job = store.get("j1")
+    assert (job["status"], job["processed"], job["failed"]) == ("completed", 5, 0)
+    assert job["summary"]["images_saved"] == 5
+    assert db.query(Image).filter(Image.file_path == paths[1]).count() == 1
+
+
+def test_cancelled_job_keeps_what_it_stored(store, db, session_id, monkeypatch):
+    store.create("j1", "p1", session_id, _paths(3))
+    store.cancel("j1")  # while queued: nothing runs
+    assert store.claim("w2") is None
+
+    store.create("j2", "p1", session_id, _paths(3))
+    job = store.claim("w2")
+    store.cancel("j2")
+    worker = _worker(store, db, monkeypatch)
+    monkeypatch.setattr(jobs, "JOBS_CHECKPOINT_SIZE", 1)
+    assert asyncio.run(worker.run_job(job)) == "cancelled"
+    # The first checkpoint saw the cancellation and stopped the stream
+    assert worker.processor.seen == _paths(1)
+    assert store.get("j2")["processed"] == 1
@@ -0,0 +1,197 @@
+# tests/test_model_server.py
+import asyncio
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pytest
+
+from app.pipeline import model_registry, model_server
+from app.pipeline.executor import InferenceQueueFull
+from app.pipeline.model_registry import ModelVersionNotFound
+from app.pipeline.model_server import (
+    ModelServer, ModelServerError, RemoteImageProcessor, _decode_error, _encode_error, _read_frame, _write_frame
+)
+
+
+class FakeProcessor:
+    version = "v1"
+    backend = "pytorch"
+    model_fingerprint = "fp-v1"
+
+    async def process_image(self, image, wait=False):
+        if isinstance(image, str) and image == "full":
+            raise InferenceQueueFull(retry_after=7)
+        if isinstance(image, str) and image == "bad":
+            raise ValueError("cannot decode")
+        return {"status": "no_animal_detected", "shape": list(np.shape(image)), "wait": wait, "timings": {}}
+
+    async def warm_workers(self):
+        pass
+
+
+class FakeManager:
+    def __init__(self):
+        self.processor = FakeProcessor()
+        self.broken = False
+
+    @property
+    def active(self):
+        if self.broken:
+            raise RuntimeError("activation failed")
+        return self.processor
+
+    async def watch_registry(self):
+        await asyncio.Event().wait()
+
+    def status(self):
+        return {"active": "v1", "versions": []}
+
+
+class _Writer:
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data):
+        self.data += data
+
+
+def test_frames_round_trip_arrays():
+    writer = _Writer()
+    message = (3, "process", (np.arange(12, dtype=np.uint8).reshape(2, 2, 3), True))
+    _write_frame(writer, message)
+    _write_frame(writer, "second")
+
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(bytes(writer.data))
+        reader.feed_eof()
+        return await _read_frame(reader), await _read_frame(reader)
+
+    first, second = asyncio.run(read())
+    assert first[:2] == (3, "process") and np.array_equal(first[2][0], message[2][0])
+    assert second == "second"
+
+
+@pytest.mark.parametrize("error, expected", [
+    (InferenceQueueFull(retry_after=9), InferenceQueueFull),
+    (ModelVersionNotFound("v9"), ModelVersionNotFound),
+    (ValueError("bad image"), ValueError),
+    (KeyError("x"), KeyError),
+    (model_registry.ModelChecksumMismatch("changed"), ModelServerError),
+])
+def test_errors_round_trip(error, expected):
+    decoded = _decode_error(_encode_error(error))
+    assert type(decoded) is expected
+    if isinstance(error, InferenceQueueFull):
+        assert decoded.retry_after == 9
+    elif expected is ModelServerError:
+        assert "ModelChecksumMismatch" in str(decoded)
+    else:
+        assert str(error) in str(decoded) or error.args[0] in str(decoded)
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    manager = FakeManager()
+    monkeypatch.setattr(model_registry, "model_manager_singleton", lambda: manager)
+    return manager
+
+
+@pytest.fixture
+def socket_path():
+    # Unix socket paths are limited to ~100 bytes, pytest's tmp_path can be longer
+    directory = tempfile.mkdtemp(prefix="tg-", dir="/tmp")
+    yield os.path.join(directory, "models.sock")
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+async def _start(path):
+    task = asyncio.create_task(ModelServer(path).serve())
+    while not os.path.exists(path):
+        await asyncio.sleep(0.01)
+    return task
+
+
+async def _stop(task):
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+
+
+def test_remote_calls_and_errors(manager, socket_path):
+    async def main():
+        server = await _start(socket_path)
+        assert oct(os.stat(socket_path).st_mode & 0o777) == "0o600"
+        remote = RemoteImageProcessor(socket_path)
+        try:
+            result = await remote.process_image(np.zeros((4, 6, 3), dtype=np.uint8), wait=True)
+            assert result["shape"] == [4, 6, 3] and result["wait"] is True
+            assert remote.version == "v1" and remote.model_fingerprint == "fp-v1"
+
+            with pytest.raises(InferenceQueueFull) as full:
+                await remote.process_image("full")
+            assert full.value.retry_after == 7
+            with pytest.raises(ValueError, match="cannot decode"):
+                await remote.process_image("bad")
+            with pytest.raises(ValueError, match="Unknown model server operation"):
+                await remote.client.call("bogus")
+            assert remote.in_flight == 0
+        finally:
+            await _stop(server)
+        assert not os.path.exists(socket_path)
+
+    asyncio.run(main())
+
+
+def test_reply_is_sent_when_the_active_processor_fails(manager, socket_path):
+    async def main():
+        server = await _start(socket_path)
+        remote = RemoteImageProcessor(socket_path)
+        try:
+            await remote.client.call("info")
+            manager.broken = True
+            with pytest.raises(RuntimeError, match="activation failed"):
+                await asyncio.wait_for(remote.client.call("info"), 2)
+            assert "activation failed" in remote.client.info["error"]
+            # Without a known model, cached results can't be matched
+            assert remote.model_fingerprint == remote._unknown_fingerprint
+        finally:
+            await _stop(server)
+
+    asyncio.run(main())
+
+
+def test_client_reconnects_after_a_server_restart(manager, socket_path):
+    async def main():
+        server = await _start(socket_path)
+        remote = RemoteImageProcessor(socket_path)
+        assert (await remote.client.call("info"))["version"] == "v1"
+
+        await _stop(server)
+        # A real restart kills the process and with it the open connection
+        remote.client._writer.transport.abort()
+        await asyncio.sleep(0.05)
+        with pytest.raises(OSError):
+            await remote.client.call("info")
+
+        manager.processor.version = "v2"
+        server = await _start(socket_path)
+        try:
+            assert (await remote.client.call("info"))["version"] == "v2"
+            assert remote.version == "v2"
+        finally:
+            await _stop(server)
+
+    asyncio.run(main())
+
+
+def test_remote_processor_has_the_local_interface(socket_path):
+    async def main():
+        remote = RemoteImageProcessor(socket_path)
+        assert remote.batcher is None
+        await remote.warm_workers()
+        assert await remote.drain(0.1)
+        remote.close()
+
+    asyncio.run(main())
@@ -0,0 +1,133 @@
+# tests/test_projects.py
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import select, update
+
+from app.db.models import Image, Project, Session, StatsRollup
+from app.main import app
+
+
+@pytest.fixture
+def client(db):
+    return TestClient(app)
+
+
+@pytest.fixture
+def projects(db):
+    now = datetime.utcnow()
+    db.add_all(Project(name=f"p{i:03d}", created_at=now - timedelta(minutes=i)) for i in range(105))
+    db.commit()
+
+
+def test_listing_without_paging_returns_every_project(client, projects):
+    response = client.get("/api/projects")
+    assert response.status_code == 200
+    names = [p["name"] for p in response.json()]
+    assert len(names) == 105 and names[:2] == ["p000", "p001"]
+    assert response.headers["X-Total-Count"] == "105"
+
+
+def test_listing_pages(client, projects):
+    first = client.get("/api/projects", params={"limit": 10}).json()
+    assert [p["name"] for p in first] == [f"p{i:03d}" for i in range(10)]
+    # page without limit: pages of 100
+    assert [p["name"] for p in client.get("/api/projects", params={"page": 2}).json()] == [
+        f"p{i:03d}" for i in range(100, 105)
+    ]
+
+
+@pytest.fixture
+def survey(db):
+    """A project with 12 animal images (deer/fox alternating, captured a day apart) and 3 empty ones"""
+    project = Project(name="survey")
+    db.add(project)
+    db.flush()
+    session = Session(project_id=project.id)
+    db.add(session)
+    db.flush()
+    start = datetime(2024, 5, 1)
+    for i in range(12):
+        species = "deer" if i % 2 == 0 else "fox"
+        db.add(Image(session_id=session.id, file_path=f"{i}.jpg", has_animal=True, animal_count=1,
+                     capture_time=start + timedelta(days=i), created_at=start + timedelta(minutes=i),
+                     species_detected={"detections": [{"species": species}]}))
+    for i in range(3):
+        db.add(Image(session_id=session.id, file_path=f"empty{i}.jpg", created_at=start))
+    db.commit()
+    return SimpleNamespace(id=project.id, session_id=session.id, start=start)
+
+
+def _results(client, survey, **params):
+    response = client.get(f"/api/projects/{survey.id}/results", params=params)
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_cursor_pages_match_offset_pages(client, survey):
+    by_offset = [img["file_path"] for page in (1, 2, 3)
+                 for img in _results(client, survey, page=page, limit=5)["images"]]
+    assert by_offset == [f"{i}.jpg" for i in range(11, -1, -1)]
+
+    by_cursor, cursor = [], None
+    while True:
+        params = {"limit": 5, **({"cursor": cursor} if cursor else {})}
+        body = _results(client, survey, **params)
+        by_cursor += [img["file_path"] for img in body["images"]]
+        cursor = body["pagination"]["next_cursor"]
+        if cursor is None:
+            break
+    assert by_cursor == by_offset
+    assert body["pagination"]["page"] is None
+
+
+def test_cursor_breaks_created_at_ties_by_id(client, db, survey):
+    for image in db.scalars(select(Image).where(Image.project_id == survey.id)):
+        image.created_at = survey.start
+    db.commit()
+    by_offset = [img["id"] for page in (1, 2, 3) for img in _results(client, survey, page=page, limit=5)["images"]]
+    first = _results(client, survey, limit=5)
+    second = _results(client, survey, limit=5, cursor=first["pagination"]["next_cursor"])
+    third = _results(client, survey, limit=5, cursor=second["pagination"]["next_cursor"])
+    assert [img["id"] for body in (first, second, third) for img in body["images"]] == by_offset
+    assert len(set(by_offset)) == 12
+
+
+def test_invalid_cursor_is_a_400(client, survey):
+    response = client.get(f"/api/projects/{survey.id}/results", params={"cursor": "not a cursor"})
+    assert response.status_code == 400
+
+
+def test_results_etag_changes_with_the_project(client, db, survey):
+    url = f"/api/projects/{survey.id}/results"
+    etag = client.get(url).headers["ETag"]
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(url, headers={"If-None-Match": f"W/{etag}"}).status_code == 304
+
+    db.add(Image(session_id=survey.session_id, file_path="new.jpg", has_animal=True,
+                 species_detected={"detections": [{"species": "bear"}]}))
+    db.commit()
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    assert response.json()["statistics"]["species_count"]["bear"] == 1
+
+
+def test_totals_and_statistics_come_from_the_rollups(client, db, survey):
+    body = _results(client, survey, limit=5)
+    assert body["pagination"]["total"] == 15
+    assert body["statistics"] == {
+        "total_processed": 15,
+        "animals_detected": 12,
+        "unique_species": 2,
+        "species_count": {"deer": 6, "fox": 6},
+    }
+    assert _results(client, survey, species="fox")["pagination"]["total"] == 6
+
+    # Served from the rollup rows, not by counting images
+    db.execute(update(StatsRollup).where(StatsRollup.scope_id == survey.id).values(total_images=99))
+    db.execute(update(Project).where(Project.id == survey.id).values(version=Project.version + 1))
+    db.commit()
+    assert _results(client, survey)["statistics"]["total_processed"] == 99
@@ -0,0 +1,124 @@
+# tests/test_rollups.py
+import pytest
+from sqlalchemy import select
+
+from app.db.detections import detection_rows
+from app.db.models import Detection, Image, Project, Session, SpeciesRollup, StatsRollup
+from app.db.rollups import rebuild_rollups
+
+
+def _rollups(db):
+    stats = {(r.scope, r.scope_id): (r.total_images, r.animal_images)
+             for r in db.scalars(select(StatsRollup)) if r.total_images or r.animal_images}
+    species = {(r.scope, r.scope_id, r.species): (r.image_count, r.detection_count)
+               for r in db.scalars(select(SpeciesRollup)) if r.image_count or r.detection_count}
+    return stats, species
+
+
+def assert_matches_rebuild(db):
+    db.commit()
+    incremental = _rollups(db)
+    rebuild_rollups(db)
+    db.flush()
+    assert _rollups(db) == incremental
+    db.rollback()
+
+
+def _species(*names):
+    return {"detections": [{"species": name} for name in names]}
+
+
+@pytest.fixture
+def project(db):
+    """Two projects, two sessions in the first one, 7 images per session"""
+    project, other = Project(name="p"), Project(name="q")
+    db.add_all([project, other])
+    db.flush()
+    sessions = [Session(project_id=project.id), Session(project_id=project.id), Session(project_id=other.id)]
+    db.add_all(sessions)
+    db.flush()
+    for session in sessions[:2]:
+        db.add_all(
+            Image(session_id=session.id, file_path=f"{i}.jpg", has_animal=i < 2,
+                  species_detected=_species("deer", "deer") if i < 2 else None)
+            for i in range(7)
+        )
+    db.commit()
+    return project, sessions
+
+
+def _total(db, scope, scope_id):
+    row = db.get(StatsRollup, (scope, scope_id))
+    return row.total_images if row else 0
+
+
+def _image(db, session):
+    return db.scalars(select(Image).where(Image.session_id == session.id, Image.has_animal)).first()
+
+
+def test_inserts(db, project):
+    project, _ = project
+    assert _total(db, "project", project.id) == 14
+    assert db.get(SpeciesRollup, ("project", project.id, "deer")).detection_count == 8
+    assert_matches_rebuild(db)
+
+
+def test_deleting_an_image(db, project):
+    project, sessions = project
+    db.delete(_image(db, sessions[0]))
+    assert_matches_rebuild(db)
+    assert _total(db, "project", project.id) == 13
+
+
+def test_deleting_a_session_cascades_into_the_rollups(db, project):
+    project, sessions = project
+    version = project.version
+    db.delete(sessions[0])
+    db.commit()
+
+    assert db.query(Image).count() == 7
+    assert _total(db, "project", project.id) == 7
+    assert _total(db, "session", sessions[0].id) == 0
+    species = db.get(SpeciesRollup, ("project", project.id, "deer"))
+    assert (species.image_count, species.detection_count) == (2, 4)
+    assert db.get(Project, project.id).version > version
+    assert_matches_rebuild(db)
+
+
+def test_deleting_a_project_cascades_into_the_rollups(db, project):
+    project, sessions = project
+    db.delete(project)
+    db.commit()
+    assert db.query(Image).count() == 0
+    assert _total(db, "project", project.id) == 0
+    assert _rollups(db) == ({}, {})
+
+
+@pytest.mark.parametrize("change", [
+    lambda img, other: setattr(img, "has_animal", False),
+    lambda img, other: setattr(img, "species_detected", _species("fox")),
+    lambda img, other: setattr(img, "species_detected", None),
+    lambda img, other: setattr(img, "session_id", other.id),
+    lambda img, other: setattr(img, "session", other),
+], ids=["has_animal", "species", "species_cleared", "session_id", "session"])
+def test_updates_move_the_image_between_rollups(db, project, change):
+    _, sessions = project
+    img = _image(db, sessions[0])
+    db.expire(img)  # the replaced value must be loaded for the update to be subtracted
+    change(img, sessions[2])
+    assert_matches_rebuild(db)
+
+
+def test_update_rewrites_detections(db, project):
+    _, sessions = project
+    img = _image(db, sessions[0])
+    img.species_detected = _species("fox", "boar", "boar")
+    img.session_id = sessions[2].id
+    db.commit()
+
+    stored = sorted((d.species, d.project_id) for d in db.scalars(select(Detection).where(Detection.image_id == img.id)))
+    assert img.project_id == sessions[2].project_id
+    assert stored == sorted((row["species"], row["project_id"]) for row in detection_rows(
+        {"id": img.id, "session_id": img.session_id, "project_id": img.project_id,
+         "species_detected": img.species_detected}
+    ))
@@ -0,0 +1,85 @@
+# tests/test_startup.py
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import app.main
+from app.main import app as api
+from app.utils import startup
+from app.utils.startup import StartupTracker
+
+
+class FlakyLoader:
+    """load_models stand-in: fails `failures` times, then waits for release() and succeeds"""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.attempts = 0
+        self.released = False
+
+    def release(self):
+        self.released = True
+
+    async def __call__(self, tracker):
+        self.attempts += 1
+        if self.attempts <= self.failures:
+            raise RuntimeError(f"weights missing (attempt {self.attempts})")
+        with tracker.timed("models"):
+            while not self.released:
+                await asyncio.sleep(0.01)
+
+
+@pytest.fixture
+def loader(monkeypatch, request):
+    loader = FlakyLoader(getattr(request, "param", 0))
+    monkeypatch.setattr(startup, "_startup_tracker_instance", StartupTracker())
+    monkeypatch.setattr(startup, "STARTUP_RETRY_INTERVAL", 0.05)
+    monkeypatch.setattr(app.main, "load_models", loader)
+    return loader
+
+
+def _wait_for(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_ready_is_503_while_loading_then_200(db, loader):
+    with TestClient(api) as client:
+        response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.json()["phase"] == "models"
+        assert client.get("/health").status_code == 200
+
+        queue = client.get("/api/analyze/queue")
+        assert queue.status_code == 503
+        assert queue.headers["Retry-After"]
+
+        loader.release()
+        _wait_for(lambda: client.get("/ready").status_code == 200)
+        assert client.get("/ready").json()["phase"] == "ready"
+
+
+@pytest.mark.parametrize("loader", [2], indirect=True)
+def test_failed_load_stays_503_and_is_retried_in_the_background(db, loader, monkeypatch):
+    from app.pipeline import model_registry
+
+    def load_on_the_event_loop():
+        raise AssertionError("requests must not load the models themselves")
+
+    monkeypatch.setattr(model_registry, "model_manager_singleton", load_on_the_event_loop)
+    with TestClient(api) as client:
+        _wait_for(lambda: loader.attempts >= 2)
+        response = client.get("/ready")
+        assert response.status_code == 503
+        assert response.json()["phase"] == "failed"
+        assert "weights missing" in response.json()["error"]
+        assert client.get("/api/analyze/queue").status_code == 503
+
+        loader.release()
+        _wait_for(lambda: client.get("/ready").status_code == 200)
+        assert loader.attempts == 3
+        assert client.get("/ready").json()["error"] is None